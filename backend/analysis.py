@@ -0,0 +1,543 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import TYPE_CHECKING, Callable, Dict, List, Optional, Tuple
+
+from clause_policy import decide_clause_action, ClauseAction, validate_rewrite_output
+from metrics import stage, registry
+from budget import ResourceBudget, current_budget, limit_chunks, request_budget
+from tenancy import fair_share
+from docx_extractor import extract_docx_text
+
+
+DETECTION_THRESHOLD = 0.75
+CHUNK_SIZE = 600
+CHUNK_OVERLAP = 150
+ENCODE_BATCH_SIZE = int(os.getenv("ENCODE_BATCH_SIZE", "128"))
+
+# Extraction processes are started from a fork server (spawned where that is
+# unavailable), never forked from the API process: it runs threads and
+# torch's OpenMP pools, whose locks a forked child can inherit held.
+EXTRACT_MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+
+if TYPE_CHECKING:
+    from ip_mod_api import ContractIngestor
+
+# pdfplumber/langchain (ip_mod_api) and the OpenAI client (llm_rewrite) are
+# imported where they are used, so importing this module (and main.py) stays
+# cheap and the app can answer health checks before the model is loaded.
+
+REWRITE_REJECTED_MESSAGE = "Legal review recommended due to potential legal modification."
+REWRITE_SKIPPED_MESSAGE = "Legal review recommended. (rewrite skipped: request resource budget exhausted)"
+REVIEW_ONLY_MESSAGE = (
+    "Legal review recommended. This clause affects liability, "
+    "damages, or remedies and should not be rewritten automatically."
+)
+NO_TEXT_MESSAGE = "No text could be extracted from the PDF."
+
+# progress(event, data) is called between pipeline steps. Callers use it to
+# publish partial results and may raise from it to abort the analysis.
+ProgressCallback = Callable[[str, dict], None]
+
+
+def apply_clause_policy(risks: List[Dict], progress: Optional[ProgressCallback] = None,
+                        rewrite_cache: Optional[Dict] = None) -> List[Dict]:
+    """
+    Decide rewrite vs review for each detected risk and fill in
+    `action` and `suggested_clause` in place.
+
+    All clauses needing a rewrite are collected first and sent together
+    through rewrite_clauses (batched JSON prompts where enabled); each
+    distinct (category, clause) is rewritten once. Pass the same
+    `rewrite_cache` dict across documents to also reuse rewrites of an
+    identical clause seen in an earlier document.
+    """
+    pending = {}
+    for risk in risks:
+        with stage("policy"):
+            action = decide_clause_action(
+                risk_category=risk["risk_category"],
+                clause_text=risk["chunk_text"]
+            )
+
+        risk["action"] = action
+
+        if action == ClauseAction.REWRITE:
+            cache_key = (risk["risk_category"], risk["chunk_text"])
+            if rewrite_cache is not None and cache_key in rewrite_cache:
+                registry.record_cache("rewrite_dedup", hit=True)
+            elif cache_key not in pending:
+                if rewrite_cache is not None:
+                    registry.record_cache("rewrite_dedup", hit=False)
+                pending[cache_key] = None
+
+    rewrites = {}
+    if pending:
+        from llm_rewrite import rewrite_clauses
+
+        keys = list(pending)
+        answers = rewrite_clauses(
+            [(clause_text, category) for category, clause_text in keys],
+            validate=validate_rewrite_output,
+        )
+        rewrites = dict(zip(keys, answers))
+
+        # None = not attempted, the request budget ran out
+        not_attempted = sum(1 for answer in answers if answer is None)
+        budget = current_budget()
+        if not_attempted and budget:
+            budget.skip("rewrite", "deadline" if budget.expired() else "max_llm_calls", clauses=not_attempted)
+        if rewrite_cache is not None:
+            rewrite_cache.update((key, answer) for key, answer in rewrites.items() if answer is not None)
+
+    for i, risk in enumerate(risks):
+        if risk["action"] == ClauseAction.REWRITE:
+            cache_key = (risk["risk_category"], risk["chunk_text"])
+            rewritten = rewrites[cache_key] if cache_key in rewrites else rewrite_cache[cache_key]
+
+            if rewritten is None and cache_key in rewrites:
+                risk["suggested_clause"] = REWRITE_SKIPPED_MESSAGE
+            elif not rewritten or not validate_rewrite_output(rewritten):
+                risk["suggested_clause"] = REWRITE_REJECTED_MESSAGE
+            else:
+                risk["suggested_clause"] = rewritten
+
+        else:
+            risk["suggested_clause"] = REVIEW_ONLY_MESSAGE
+
+        if progress:
+            progress("clause_reviewed", {"done": i + 1, "total": len(risks)})
+
+    return risks
+
+
+def build_result(filename: str, chunks: List[Dict], risks: List[Dict]) -> dict:
+    if not chunks:
+        return {
+            "filename": filename,
+            "num_chunks": 0,
+            "num_risks": 0,
+            "risks": [],
+            "message": NO_TEXT_MESSAGE
+        }
+
+    return {
+        "filename": filename,
+        "num_chunks": len(chunks),
+        "num_risks": len(risks),
+        "risks": risks,
+        "status": "success"
+    }
+
+
+def compact_result(result: dict, chunks: Optional[List[Dict]] = None) -> dict:
+    """
+    Offset-based form of a full result. Every chunk that carries a risk is
+    listed once (text, page and character offsets); risks reference it by
+    id, and each category definition and suggested clause is sent once
+    instead of being repeated per risk.
+    """
+    if "risks" not in result:
+        # Error entries (e.g. a failed batch document) have nothing to compact
+        return result
+
+    metadata_by_id = {chunk["id"]: chunk.get("metadata", {}) for chunk in chunks or []}
+    compact = {key: value for key, value in result.items() if key not in ("risks", "delta")}
+    compact["format"] = "compact"
+
+    listed_chunks = {}
+    definitions = {}
+    suggestions = []
+    suggestion_index = {}
+
+    def chunk_ref(risk):
+        chunk_id = risk["chunk_id"]
+        if chunk_id not in listed_chunks:
+            metadata = metadata_by_id.get(chunk_id, {})
+            listed_chunks[chunk_id] = {
+                "id": chunk_id,
+                "text": risk["chunk_text"],
+                "page": metadata.get("page"),
+                "start": metadata.get("start_char"),
+                "end": metadata.get("end_char"),
+            }
+        return chunk_id
+
+    risks = []
+    for risk in result["risks"]:
+        category = risk["risk_category"]
+        definitions.setdefault(category, risk.get("risk_definition"))
+
+        suggestion = risk.get("suggested_clause")
+        if suggestion is not None and suggestion not in suggestion_index:
+            suggestion_index[suggestion] = len(suggestions)
+            suggestions.append(suggestion)
+
+        entry = {
+            "category": category,
+            "chunk_id": chunk_ref(risk),
+            "score": round(float(risk["similarity_score"]), 4),
+            "action": risk.get("action"),
+            "suggestion": suggestion_index.get(suggestion) if suggestion is not None else None,
+        }
+        if "sentence" in risk:
+            # Sentence mode: the risky sentence as document offsets (text only when it has none)
+            sentence = risk["sentence"]
+            entry["sentence"] = {
+                "start": sentence["start_char"],
+                "end": sentence["end_char"],
+                "score": round(sentence["similarity_score"], 4),
+            }
+            if sentence["start_char"] is None:
+                entry["sentence"]["text"] = sentence["text"]
+        risks.append(entry)
+
+    if "delta" in result:
+        delta = dict(result["delta"])
+        delta["risks_added"] = [
+            {"category": r["risk_category"], "chunk_id": chunk_ref(r), "score": round(float(r["similarity_score"]), 4)}
+            for r in delta["risks_added"]
+        ]
+        # Removed risks point at chunks of the previous version, so they keep their text
+        compact["delta"] = delta
+
+    compact["chunks"] = list(listed_chunks.values())
+    compact["definitions"] = definitions
+    compact["suggestions"] = suggestions
+    compact["risks"] = risks
+    return compact
+
+
+def analyze_chunks(detector, filename: str, chunks: List[Dict], progress: Optional[ProgressCallback] = None,
+                   embeddings: Optional[dict] = None) -> dict:
+    """
+    Detection, policy and rewrite for an already-chunked contract.
+    `embeddings` is filled with chunk_id -> embedding when given.
+    """
+    if not chunks:
+        return build_result(filename, chunks, [])
+
+    with fair_share("cpu"):
+        risks = detector.detect_risks(chunks, threshold=DETECTION_THRESHOLD, embeddings=embeddings)
+    if progress:
+        progress("risks_detected", {"num_chunks": len(chunks), "risks": risks})
+
+    apply_clause_policy(risks, progress=progress)
+    return build_result(filename, chunks, risks)
+
+
+def ingest_pdf(pdf_path: str) -> List[Dict]:
+    """
+    Extract and chunk one PDF. Module-level so it can run in a worker process.
+    """
+    from ip_mod_api import ContractIngestor
+
+    ingestor = ContractIngestor(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    with fair_share("cpu"):
+        return ingestor.process_contract(pdf_path)
+
+
+def ingest_text(text: str, source_type: str = "text") -> List[Dict]:
+    """
+    Chunk text that is already extracted (API text, DOCX); no PDF
+    extraction, temp file or layout pass.
+    """
+    from ip_mod_api import ContractIngestor
+
+    ingestor = ContractIngestor(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    with fair_share("cpu"):
+        return ingestor.process_text(text, source_type=source_type)
+
+
+def read_docx(data: bytes) -> str:
+    """Text of a DOCX held in memory. ValueError if it is not a DOCX."""
+    with fair_share("cpu"), stage("extraction"):
+        return extract_docx_text(data)
+
+
+def ingest_docx(data: bytes) -> List[Dict]:
+    return ingest_text(read_docx(data), source_type="contract_docx")
+
+
+def prepare_chunks(items: List[Dict], source_type: str = "prechunked") -> List[Dict]:
+    """
+    Caller-chunked text ({"text"} plus optional "id", "page", "start_char",
+    "end_char") in the pipeline's chunk shape, used as-is without
+    re-chunking. Blank chunks are dropped; ValueError on duplicate ids.
+    """
+    chunks = []
+    seen = set()
+    for i, item in enumerate(items):
+        text = item.get("text") or ""
+        if not text.strip():
+            continue
+        chunk_id = str(item.get("id") or f"chunk_{i}")
+        if chunk_id in seen:
+            raise ValueError(f"Duplicate chunk id: {chunk_id}")
+        seen.add(chunk_id)
+        chunks.append({
+            "id": chunk_id,
+            "text": text,
+            "metadata": {
+                "source_type": source_type,
+                "start_char": item.get("start_char"),
+                "end_char": item.get("end_char"),
+                "page": item.get("page"),
+            },
+        })
+    return limit_chunks(chunks)
+
+
+def ingest_pdf_with_limits(pdf_path: str, limits: Optional[Dict] = None) -> Tuple[List[Dict], List[Dict]]:
+    """
+    ingest_pdf under its own ResourceBudget built from `limits` (see
+    ResourceBudget.limits), so page/chunk limits and the deadline also
+    apply inside worker processes. Returns (chunks, skipped).
+    """
+    if not limits:
+        return ingest_pdf(pdf_path), []
+    with request_budget(ResourceBudget(**limits)) as budget:
+        return ingest_pdf(pdf_path), budget.skipped
+
+
+def extract_documents(pdf_paths: List[str], workers: int, limits: Optional[Dict] = None) -> List:
+    """
+    Extract several PDFs in parallel. pdfplumber is pure Python, so separate
+    processes are needed to use more than one core. Each entry is either a
+    (chunks, skipped) pair or the exception raised for that document.
+    """
+    if workers <= 1 or len(pdf_paths) <= 1:
+        results = []
+        for path in pdf_paths:
+            try:
+                results.append(ingest_pdf_with_limits(path, limits))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    results = []
+    with ProcessPoolExecutor(max_workers=min(workers, len(pdf_paths)), mp_context=EXTRACT_MP_CONTEXT) as pool:
+        futures = [pool.submit(ingest_pdf_with_limits, path, limits) for path in pdf_paths]
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+def analyze_batch(detector, documents: List[Tuple[str, str]], workers: int = None,
+                  compact: bool = False, on_result: Optional[Callable] = None) -> List[dict]:
+    """
+    Analyze many PDFs as one unit of work: parallel extraction, one shared
+    encode/similarity pass over every document's chunks, and LLM rewrites
+    deduplicated across documents. `documents` is a list of
+    (filename, pdf_path); results come back in the same order, in the
+    compact offset-based form when `compact` is set.
+
+    `on_result(index, chunks, result, embeddings)` is called for every
+    successfully analysed document before compaction (e.g. to store and
+    index it); embeddings are only collected when it is given.
+
+    Under a request budget, page/chunk limits apply per document and the
+    deadline and LLM calls to the whole batch; each document's result
+    lists what was skipped for it.
+    """
+    workers = workers or os.cpu_count() or 1
+    budget = current_budget()
+
+    # The whole batch holds one CPU slot per stage; its tenant is charged for
+    # the time, so its next work waits behind other tenants'
+    with fair_share("cpu"), stage("batch_extraction"):
+        extracted = extract_documents([path for _, path in documents], workers, budget.limits() if budget else None)
+
+    ok_indexes = [i for i, item in enumerate(extracted) if not isinstance(item, Exception)]
+    documents_chunks = [extracted[i][0] for i in ok_indexes]
+
+    embeddings = [{} for _ in documents_chunks] if on_result else None
+    with fair_share("cpu"):
+        risks_per_document = detector.detect_risks_batch(
+            documents_chunks, threshold=DETECTION_THRESHOLD, batch_size=ENCODE_BATCH_SIZE, embeddings=embeddings
+        )
+
+    rewrite_cache = {}
+    results = [None] * len(documents)
+    for d, (i, chunks, risks) in enumerate(zip(ok_indexes, documents_chunks, risks_per_document)):
+        mark = len(budget.skipped) if budget else 0
+        apply_clause_policy(risks, rewrite_cache=rewrite_cache)
+        results[i] = build_result(documents[i][0], chunks, risks)
+
+        skipped = list(extracted[i][1])
+        if budget:
+            # Notes recorded while rewriting this document belong to it
+            skipped.extend(budget.skipped[mark:])
+            del budget.skipped[mark:]
+        results[i]["skipped"] = skipped
+
+        if on_result and chunks:
+            on_result(i, chunks, results[i], embeddings[d])
+        if compact:
+            results[i] = compact_result(results[i], chunks)
+
+    for i, item in enumerate(extracted):
+        if isinstance(item, Exception):
+            results[i] = {
+                "filename": documents[i][0],
+                "status": "error",
+                "error": str(item)
+            }
+
+    return results
+
+
+def align_revision(ingestor: "ContractIngestor", text: str, previous_texts: List[str]) -> List[Dict]:
+    """
+    Re-chunk a revised contract so unchanged regions keep their previous
+    chunks. Previous chunks that still occur verbatim (and in order) are
+    carried over as-is; only the gaps between them are chunked afresh.
+
+    Each returned chunk has the usual id/text/metadata plus `previous_index`
+    (index into previous_texts, or None for new text).
+    """
+    carried = []
+    cursor = 0
+    for index, previous in enumerate(previous_texts):
+        position = text.find(previous, cursor)
+        if position == -1:
+            continue
+        carried.append((position, position + len(previous), index))
+        cursor = position + 1
+
+    pieces = []
+
+    def add_gap(start, end):
+        gap = text[start:end]
+        if gap.strip():
+            for chunk in ingestor.chunk_text(gap, offset=start):
+                pieces.append((chunk["text"], None, chunk["metadata"]))
+
+    covered_to = 0
+    for start, end, index in carried:
+        if start > covered_to:
+            add_gap(covered_to, start)
+        pieces.append((previous_texts[index], index, {
+            "source_type": ingestor.source_type,
+            "start_char": start,
+            "end_char": end,
+            "page": ingestor.page_for_offset(start),
+        }))
+        covered_to = max(covered_to, end)
+    if covered_to < len(text):
+        add_gap(covered_to, len(text))
+
+    return [
+        {
+            "id": f"chunk_{i}",
+            "text": chunk_text,
+            "metadata": metadata,
+            "previous_index": previous_index,
+        }
+        for i, (chunk_text, previous_index, metadata) in enumerate(pieces)
+    ]
+
+
+def _risk_summary(risk: Dict) -> Dict:
+    return {
+        "risk_category": risk["risk_category"],
+        "chunk_id": risk["chunk_id"],
+        "chunk_text": risk["chunk_text"],
+        "similarity_score": risk["similarity_score"],
+    }
+
+
+def analyze_revision(detector, pdf_path: Optional[str], filename: str, previous: dict,
+                     embeddings: Optional[dict] = None, raw_text: Optional[str] = None,
+                     source_type: str = "contract_pdf") -> Tuple[dict, List[Dict]]:
+    """
+    Analyse a new version of a previously analysed contract. Only new or
+    edited text is embedded, scored and rewritten; risks on unchanged chunks
+    are carried over. The result includes a `delta` of risks added and
+    removed relative to `previous` (an AnalysisStore record).
+    A revision that is already text (API text, DOCX) is passed as
+    `raw_text` with its `source_type` instead of `pdf_path`.
+    `embeddings` receives the embeddings of the new chunks only.
+    Returns (result, chunks).
+    """
+    from ip_mod_api import ContractIngestor
+
+    ingestor = ContractIngestor(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
+    if raw_text is None:
+        with fair_share("cpu"), stage("extraction"):
+            raw_text = ingestor.extract_text_from_pdf(pdf_path)
+    else:
+        ingestor.source_type = source_type
+        raw_text = ingestor.clean_text(raw_text.replace("\r\n", "\n").replace("\r", "\n"))
+
+    previous_texts = previous["chunks"]
+    with stage("alignment"):
+        chunks = align_revision(ingestor, raw_text, previous_texts) if raw_text else []
+
+    # Previous risks keyed by chunk text (chunk ids are not contiguous, and
+    # the same text always scores the same), one entry per category
+    previous_risks_by_text = {}
+    rewrite_cache = {}
+    for risk in previous["result"].get("risks", []):
+        previous_risks_by_text.setdefault(risk["chunk_text"], {})[risk["risk_category"]] = risk
+        # A rewrite the budget skipped last time is not a rewrite to reuse
+        if risk.get("action") == ClauseAction.REWRITE and risk["suggested_clause"] != REWRITE_SKIPPED_MESSAGE:
+            rewrite_cache[(risk["risk_category"], risk["chunk_text"])] = risk["suggested_clause"]
+
+    carried_risks = []
+    reused = set()
+    for chunk in chunks:
+        index = chunk["previous_index"]
+        if index is None:
+            continue
+        reused.add(index)
+        for risk in previous_risks_by_text.get(chunk["text"], {}).values():
+            carried_risks.append({**risk, "chunk_id": chunk["id"]})
+
+    changed = [c for c in chunks if c["previous_index"] is None]
+    new_chunks = limit_chunks(changed)
+    if len(new_chunks) < len(changed):
+        # Chunks the budget sampled away were never scored. Leave them out of
+        # the result (and so the stored analysis): recording them would let
+        # the next revision carry them over as unchanged and risk-free.
+        analysed = {id(c) for c in new_chunks}
+        chunks = [c for c in chunks if c["previous_index"] is not None or id(c) in analysed]
+    new_risks = []
+    if new_chunks:
+        with fair_share("cpu"):
+            new_risks = detector.detect_risks(new_chunks, threshold=previous["threshold"], embeddings=embeddings)
+    # Carried risks whose rewrite was skipped last time get another attempt
+    retried = [risk for risk in carried_risks if risk.get("suggested_clause") == REWRITE_SKIPPED_MESSAGE]
+    apply_clause_policy(new_risks + retried, rewrite_cache=rewrite_cache)
+    registry.inc("incremental_chunks_reused", len(reused))
+    registry.inc("incremental_chunks_analyzed", len(new_chunks))
+
+    risks = carried_risks + new_risks
+    risks.sort(key=lambda x: x['similarity_score'], reverse=True)
+
+    carried_texts = {previous_texts[index] for index in reused}
+    removed_risks = [
+        risk
+        for text, text_risks in previous_risks_by_text.items()
+        if text not in carried_texts
+        for risk in text_risks.values()
+    ]
+
+    for chunk in chunks:
+        chunk.pop("previous_index")
+
+    result = build_result(filename, chunks, risks)
+    result["delta"] = {
+        "risks_added": [_risk_summary(r) for r in new_risks],
+        "risks_removed": [_risk_summary(r) for r in removed_risks],
+        "risks_unchanged": len(carried_risks),
+        "chunks_reused": len(reused),
+        "chunks_new": len(new_chunks),
+        "chunks_removed": len(previous_texts) - len(reused),
+    }
+    return result, chunks
@@ -0,0 +1,72 @@
+import json
+import sqlite3
+import time
+import uuid
+from typing import List, Optional
+
+from tenancy import ANONYMOUS_TENANT
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    filename TEXT,
+    threshold REAL,
+    chunks TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_parent ON analyses (parent_id);
+"""
+
+# Columns added after the first release; created on older databases at startup.
+# Analyses stored before tenants were recorded go to the anonymous tenant.
+ADDED_COLUMNS = {"tenant": f"TEXT DEFAULT '{ANONYMOUS_TENANT}'"}
+
+
+class AnalysisStore:
+    """
+    Keeps finished analyses (ordered chunk texts plus the response) so a
+    later revision of the same contract can be analysed incrementally.
+    Each analysis belongs to the tenant that made it and is only visible
+    to that tenant.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(analyses)")}
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE analyses ADD COLUMN {column} {column_type}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def save(self, filename: str, chunk_texts: List[str], result: dict, threshold: float,
+             parent_id: Optional[str] = None, tenant: Optional[str] = None) -> str:
+        analysis_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO analyses (id, parent_id, tenant, filename, threshold, chunks, result, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (analysis_id, parent_id, tenant, filename, threshold, json.dumps(chunk_texts),
+                 json.dumps(result), time.time()),
+            )
+        return analysis_id
+
+    def get(self, analysis_id: str, tenant: Optional[str] = None) -> Optional[dict]:
+        """The stored analysis, or None if it does not exist or belongs to another tenant."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM analyses WHERE id = ?", (analysis_id,)).fetchone()
+        if row is None or row["tenant"] != tenant:
+            return None
+        analysis = dict(row)
+        analysis["chunks"] = json.loads(analysis["chunks"])
+        analysis["result"] = json.loads(analysis["result"])
+        return analysis
@@ -0,0 +1,110 @@
+"""
+Compare PDF extraction backends on throughput and text fidelity.
+
+    python bench_extractors.py
+    python bench_extractors.py --pages 50 --pdf contracts/*.pdf --output extractors.json
+
+The fixed corpus is synthetic_pdf.generate_layout_contract in every layout
+(single column, two columns, ruled tables) with a fixed seed, so runs are
+comparable across machines and commits. Contracts passed with --pdf are
+added; they have no ground truth, so pdfplumber's text is their reference.
+
+Fidelity is the difflib ratio between the reference words and the extracted
+words of each page (1.0 = same words in the same order), averaged over the
+pages. Word recall ignores order. The " | " cell separators the layout
+backend puts between table cells are not counted as words.
+"""
+import argparse
+import difflib
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from pdf_extractors import EXTRACTORS, choose_extractor
+from synthetic_pdf import LAYOUTS, generate_layout_contract
+
+
+DATASET_PATH = "dataset/synthetic_gold_standard_with_nli.json"
+BACKENDS = list(EXTRACTORS) + ["auto"]
+
+
+def extract_pages(pdf_path: str, backend: str):
+    """(page texts, seconds, backend actually used); auto includes its probe."""
+    started = time.perf_counter()
+    used = choose_extractor(pdf_path, backend)
+    with EXTRACTORS[used](pdf_path) as pdf:
+        pages = [pdf.page_text(i) for i in range(len(pdf))]
+    return pages, time.perf_counter() - started, used
+
+
+def _words(text: str):
+    return [w for w in text.split() if w != "|"]
+
+
+def fidelity(reference: str, extracted: str):
+    ref_words, got_words = _words(reference), _words(extracted)
+    order = difflib.SequenceMatcher(None, ref_words, got_words, autojunk=False).ratio()
+    overlap = sum((Counter(ref_words) & Counter(got_words)).values())
+    recall = overlap / len(ref_words) if ref_words else 1.0
+    return order, recall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput and fidelity of the PDF extraction backends")
+    parser.add_argument("--pages", type=int, default=20, help="Pages per synthetic document")
+    parser.add_argument("--layouts", nargs="+", choices=LAYOUTS, default=list(LAYOUTS))
+    parser.add_argument("--pdf", nargs="*", default=[], help="Extra contracts (pdfplumber text is the reference)")
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per document and backend")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        documents = []
+        for layout in args.layouts:
+            path = os.path.join(tmp_dir, f"contract_{layout}.pdf")
+            reference = generate_layout_contract(path, args.pages, args.dataset, layout, seed=args.seed)
+            documents.append((layout, path, reference))
+        for path in args.pdf:
+            reference, _, _ = extract_pages(path, "pdfplumber")
+            documents.append((os.path.basename(path), path, reference))
+
+        print("| Document | Backend | Used | Pages/s | Fidelity | Word recall |")
+        print("|---|---|---|---|---|---|")
+        for name, path, reference in documents:
+            for backend in args.backends:
+                timings = []
+                for _ in range(args.repeat):
+                    pages, seconds, used = extract_pages(path, backend)
+                    timings.append(seconds)
+                scores = [fidelity(ref, got) for ref, got in zip(reference, pages)]
+                row = {
+                    "document": name,
+                    "backend": backend,
+                    "used": used,
+                    "pages": len(pages),
+                    "median_seconds": round(statistics.median(timings), 4),
+                    "pages_per_second": round(len(pages) / statistics.median(timings), 1),
+                    "fidelity": round(statistics.mean(s[0] for s in scores), 4) if scores else None,
+                    "word_recall": round(statistics.mean(s[1] for s in scores), 4) if scores else None,
+                }
+                results.append(row)
+                print(f"| {name} | {backend} | {used} | {row['pages_per_second']} | "
+                      f"{row['fidelity']} | {row['word_recall']} |")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"pages": args.pages, "seed": args.seed, "results": results}, f, indent=4)
+        print(f"\nResults saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,158 @@
+"""
+Memory-per-worker and throughput-vs-workers benchmark for serve.py (Linux).
+
+    python mock_llm_server.py --port 8089 &
+    LLM_BASE_URL=http://127.0.0.1:8089/api/v1 OPENROUTER_API_KEY=mock \\
+        python bench_workers.py --workers 1 2 4 --pages 10 --duration 30
+
+For each worker count it starts serve.py, waits for /readyz, drives load
+with load_test.run_level at 2x the worker count, then reads RSS, PSS and
+USS of every worker from /proc/<pid>/smaps_rollup. PSS is the number to compare:
+shared copy-on-write model pages are split between the processes sharing
+them, so PSS per worker drops as workers are added if sharing works.
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from load_test import run_level
+from synthetic_pdf import generate_contract_pdf
+
+
+DATASET_PATH = "dataset/synthetic_gold_standard_with_nli.json"
+
+
+def read_memory_kb(pid: int) -> dict:
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":"):
+                try:
+                    fields[parts[0][:-1]] = int(parts[1])
+                except ValueError:
+                    pass
+    return {
+        "rss_mb": round(fields.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(fields.get("Pss", 0) / 1024, 1),
+        "uss_mb": round((fields.get("Private_Clean", 0) + fields.get("Private_Dirty", 0)) / 1024, 1),
+    }
+
+
+def child_pids(pid: int) -> list:
+    path = f"/proc/{pid}/task/{pid}/children"
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [int(p) for p in f.read().split()]
+
+
+def wait_until_ready(url: str, timeout: float) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/readyz", timeout=2).status_code == 200:
+                return True
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    return False
+
+
+def bench_worker_count(workers, port, payload, filename, duration, startup_timeout):
+    url = f"http://127.0.0.1:{port}"
+    process = subprocess.Popen(
+        [sys.executable, "serve.py", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        # Measure raw throughput, not the anonymous tenant's rate limit
+        env={**os.environ, "TENANT_REQUESTS_PER_MINUTE": "0"},
+    )
+    try:
+        if not wait_until_ready(url, startup_timeout):
+            return {"workers": workers, "error": "server did not become ready"}
+        # Give every worker time to finish its startup handlers
+        time.sleep(2)
+
+        # One warm-up request per worker so lazily created state is included
+        run_level(url, payload, filename, workers, 0.1, 300)
+
+        idle_memory = [read_memory_kb(pid) for pid in child_pids(process.pid)]
+        load = run_level(url, payload, filename, workers * 2, duration, 300)
+
+        # After the load run every worker has served requests, so its
+        # allocator pools and encoder buffers are counted
+        memory = [read_memory_kb(pid) for pid in child_pids(process.pid)]
+        master = read_memory_kb(process.pid)
+        total_pss = master["pss_mb"] + sum(m["pss_mb"] for m in memory)
+        return {
+            "workers": workers,
+            "master_memory": master,
+            "idle_worker_memory": idle_memory,
+            "worker_memory": memory,
+            "pss_per_worker_mb": round(sum(m["pss_mb"] for m in memory) / max(1, len(memory)), 1),
+            "uss_per_worker_mb": round(sum(m["uss_mb"] for m in memory) / max(1, len(memory)), 1),
+            "total_pss_mb": round(total_pss, 1),
+            "load": load,
+        }
+    finally:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark serve.py memory and throughput across worker counts")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--port", type=int, default=8123)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=30.0)
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--output", default="bench_workers.json")
+    args = parser.parse_args()
+
+    if not sys.platform.startswith("linux"):
+        print("[ERROR] bench_workers.py reads /proc and only runs on Linux.")
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = os.path.join(tmp_dir, f"bench_{args.pages}p.pdf")
+        generate_contract_pdf(pdf_path, args.pages, args.dataset)
+        with open(pdf_path, "rb") as f:
+            payload = f.read()
+
+    results = []
+    for workers in args.workers:
+        print(f"Benchmarking {workers} worker(s)...")
+        results.append(bench_worker_count(
+            workers, args.port, payload, os.path.basename(pdf_path), args.duration, args.startup_timeout
+        ))
+
+    print("\n| Workers | PSS / worker (MB) | USS / worker (MB) | Total PSS (MB) | Throughput (req/s) | p95 (s) |")
+    print("|---|---|---|---|---|---|")
+    for r in results:
+        if "error" in r:
+            print(f"| {r['workers']} | {r['error']} | | | | |")
+            continue
+        p95 = r["load"].get("latency_seconds", {}).get("p95")
+        print(f"| {r['workers']} | {r['pss_per_worker_mb']} | {r['uss_per_worker_mb']} | "
+              f"{r['total_pss_mb']} | {r['load']['throughput_rps']} | {p95} |")
+
+    with open(args.output, "w") as f:
+        json.dump({"cpu_count": os.cpu_count(), "pages": args.pages, "results": results}, f, indent=4)
+    print(f"\nResults saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
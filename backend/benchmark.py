@@ -0,0 +1,292 @@
+"""
+End-to-end benchmark for the contract analysis pipeline.
+
+    python benchmark.py run --pages 10 100 1000 --repeat 3
+    python benchmark.py compare benchmark_results/old.json benchmark_results/new.json
+
+`run` generates synthetic contract PDFs and times three targets:
+  ingest  - ContractIngestor.process_contract
+  detect  - RiskDetector.detect_risks on the ingested chunks
+  api     - POST /analyze-contract through FastAPI's TestClient, with the
+            LLM client pointed at the local mock server
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from metrics import track_request
+from synthetic_pdf import generate_contract_pdf
+
+
+DATASET_PATH = "dataset/synthetic_gold_standard_with_nli.json"
+RESULTS_DIR = "benchmark_results"
+TARGETS = ("ingest", "detect", "api")
+
+
+def reset_peak_rss() -> bool:
+    """
+    Reset the kernel's RSS high-water mark (VmHWM) so the next
+    peak_rss_mb() covers only what ran since. Linux only; False elsewhere.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_mb() -> float:
+    """Peak RSS since the last reset_peak_rss(), else since process start."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    if sys.platform == "darwin":
+        return usage / (1024 * 1024)
+    return usage / 1024
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return "unknown"
+
+
+def summarize(latencies, stage_runs, pages, chunks):
+    arr = np.array(latencies)
+    total = float(arr.sum())
+
+    stage_names = sorted({name for run in stage_runs for name in run})
+    stages = {
+        name: round(float(np.mean([run.get(name, {}).get("seconds", 0.0) for run in stage_runs])), 6)
+        for name in stage_names
+    }
+
+    return {
+        "runs": len(latencies),
+        "latency_seconds": {
+            "mean": round(float(arr.mean()), 6),
+            "p50": round(float(np.percentile(arr, 50)), 6),
+            "p95": round(float(np.percentile(arr, 95)), 6),
+            "p99": round(float(np.percentile(arr, 99)), 6),
+            "min": round(float(arr.min()), 6),
+            "max": round(float(arr.max()), 6),
+        },
+        "throughput": {
+            "docs_per_second": round(len(latencies) / total, 4) if total else None,
+            "pages_per_second": round(pages * len(latencies) / total, 4) if total else None,
+            "chunks_per_second": round(chunks * len(latencies) / total, 4) if total else None,
+        },
+        "stages_mean_seconds": stages,
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+def bench_ingest(pdf_path, repeat):
+    from ip_mod_api import ContractIngestor
+
+    latencies, stage_runs, chunks = [], [], []
+    for _ in range(repeat):
+        ingestor = ContractIngestor(chunk_size=600, chunk_overlap=150)
+        with track_request("benchmark_ingest") as timings:
+            chunks = ingestor.process_contract(pdf_path)
+        latencies.append(timings.total)
+        stage_runs.append(timings.as_dict()["stages"])
+    return latencies, stage_runs, chunks
+
+
+def bench_detect(detector, chunks, repeat, threshold):
+    latencies, stage_runs = [], []
+    for _ in range(repeat):
+        with track_request("benchmark_detect") as timings:
+            detector.detect_risks(chunks, threshold=threshold)
+        latencies.append(timings.total)
+        stage_runs.append(timings.as_dict()["stages"])
+    return latencies, stage_runs
+
+
+def bench_api(client, pdf_path, repeat):
+    latencies, stage_runs = [], []
+    num_chunks = 0
+    with open(pdf_path, "rb") as f:
+        payload = f.read()
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.post(
+            "/analyze-contract",
+            params={"debug": "true"},
+            files={"file": (os.path.basename(pdf_path), payload, "application/pdf")},
+        )
+        latencies.append(time.perf_counter() - start)
+        response.raise_for_status()
+        body = response.json()
+        num_chunks = body.get("num_chunks", 0)
+        stage_runs.append(body.get("timings", {}).get("stages", {}))
+    return latencies, stage_runs, num_chunks
+
+
+def run(args):
+    os.makedirs(args.output_dir, exist_ok=True)
+    targets = set(args.targets)
+
+    mock = None
+    api_client = None
+    main_module = None
+    if "api" in targets or "detect" in targets:
+        from mock_llm_server import start_mock_server
+
+        mock = start_mock_server(latency=args.llm_latency)
+        print(f"Mock LLM server at {mock.base_url}")
+
+        # Load the app's model up front; reuse its detector for the detect target.
+        # The OpenAI client refuses to build without a key, even a fake one.
+        os.environ["LLM_BASE_URL"] = mock.base_url
+        os.environ.setdefault("OPENROUTER_API_KEY", "benchmark")
+        import main as main_module
+        if main_module.load_detector() is None:
+            print("CRITICAL ERROR: RiskDetector failed to load; cannot benchmark detect/api.")
+            return 1
+
+        if "api" in targets:
+            from fastapi.testclient import TestClient
+            api_client = TestClient(main_module.app)
+
+    scenarios = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for pages in args.pages:
+            pdf_path = os.path.join(tmp_dir, f"contract_{pages}p.pdf")
+            generate_contract_pdf(pdf_path, pages, args.dataset, risk_ratio=args.risk_ratio, seed=args.seed)
+            size_bytes = os.path.getsize(pdf_path)
+            print(f"\n=== {pages} pages ({size_bytes / 1024:.0f} KiB) ===")
+
+            # Each scenario reports its own peak, not the process-wide one
+            # that includes model load and every earlier scenario
+            if not reset_peak_rss():
+                print("  (peak RSS cannot be reset on this platform; it is cumulative)")
+            latencies, stage_runs, chunks = bench_ingest(pdf_path, args.repeat)
+            if "ingest" in targets:
+                result = summarize(latencies, stage_runs, pages, len(chunks))
+                scenarios.append({"name": f"ingest_{pages}p", "target": "ingest", "pages": pages,
+                                  "num_chunks": len(chunks), "pdf_bytes": size_bytes, **result})
+                print(f"  ingest  p50={result['latency_seconds']['p50']:.3f}s")
+
+            if "detect" in targets and chunks:
+                reset_peak_rss()
+                latencies, stage_runs = bench_detect(main_module.detector, chunks, args.repeat, args.threshold)
+                result = summarize(latencies, stage_runs, pages, len(chunks))
+                scenarios.append({"name": f"detect_{pages}p", "target": "detect", "pages": pages,
+                                  "num_chunks": len(chunks), "pdf_bytes": size_bytes, **result})
+                print(f"  detect  p50={result['latency_seconds']['p50']:.3f}s")
+
+            if "api" in targets:
+                reset_peak_rss()
+                latencies, stage_runs, num_chunks = bench_api(api_client, pdf_path, args.repeat)
+                result = summarize(latencies, stage_runs, pages, num_chunks)
+                scenarios.append({"name": f"api_{pages}p", "target": "api", "pages": pages,
+                                  "num_chunks": num_chunks, "pdf_bytes": size_bytes, **result})
+                print(f"  api     p50={result['latency_seconds']['p50']:.3f}s")
+
+    if mock is not None:
+        mock.shutdown()
+
+    commit = git_commit()
+    report = {
+        "meta": {
+            "git_commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "repeat": args.repeat,
+            "threshold": args.threshold,
+            "llm_latency": args.llm_latency,
+        },
+        "scenarios": scenarios,
+    }
+
+    output = args.output or os.path.join(args.output_dir, f"{commit}.json")
+    with open(output, "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"\nResults saved to {output}")
+    return 0
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    base_by_name = {s["name"]: s for s in baseline["scenarios"]}
+    regressions = 0
+
+    print(f"{'scenario':<18}{'metric':<8}{'baseline':>12}{'candidate':>12}{'change':>10}")
+    for scenario in candidate["scenarios"]:
+        base = base_by_name.get(scenario["name"])
+        if base is None:
+            continue
+        for metric in ("p50", "p95", "p99"):
+            old = base["latency_seconds"][metric]
+            new = scenario["latency_seconds"][metric]
+            change = (new - old) / old * 100 if old else 0.0
+            flag = ""
+            if change > args.tolerance:
+                flag = "  REGRESSION"
+                regressions += 1
+            print(f"{scenario['name']:<18}{metric:<8}{old:>12.4f}{new:>12.4f}{change:>9.1f}%{flag}")
+
+        old_rss, new_rss = base["peak_rss_mb"], scenario["peak_rss_mb"]
+        print(f"{scenario['name']:<18}{'rss_mb':<8}{old_rss:>12.1f}{new_rss:>12.1f}")
+
+    print(f"\n{regressions} regression(s) above {args.tolerance:.0f}% tolerance")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the contract analysis pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run the benchmark and save results as JSON")
+    run_parser.add_argument("--pages", type=int, nargs="+", default=[10, 100, 1000])
+    run_parser.add_argument("--repeat", type=int, default=3)
+    run_parser.add_argument("--targets", nargs="+", choices=TARGETS, default=list(TARGETS))
+    run_parser.add_argument("--threshold", type=float, default=0.75)
+    run_parser.add_argument("--risk-ratio", type=float, default=0.05)
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--llm-latency", type=float, default=0.0, help="Mock LLM delay per call, seconds")
+    run_parser.add_argument("--dataset", default=DATASET_PATH)
+    run_parser.add_argument("--output-dir", default=RESULTS_DIR)
+    run_parser.add_argument("--output", help="Explicit output file (default: <output-dir>/<commit>.json)")
+
+    compare_parser = sub.add_parser("compare", help="Diff two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--tolerance", type=float, default=10.0, help="Allowed slowdown in percent")
+
+    args = parser.parse_args()
+    if args.command == "run":
+        return run(args)
+    return compare(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
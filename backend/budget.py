@@ -0,0 +1,180 @@
+import contextvars
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from metrics import registry
+
+
+def _limit(name: str, default: str) -> Optional[float]:
+    # 0 (or empty) disables a limit
+    value = float(os.getenv(name, default) or 0)
+    return value if value > 0 else None
+
+
+# Per-request resource limits; each stage degrades instead of failing when
+# its share is exhausted (see ResourceBudget). All off by default, so
+# results match an unlimited run until an operator opts in.
+BUDGET_MAX_PAGES = _limit("BUDGET_MAX_PAGES", "0")
+BUDGET_MAX_CHUNKS = _limit("BUDGET_MAX_CHUNKS", "0")
+BUDGET_DEADLINE_SECONDS = _limit("BUDGET_DEADLINE_SECONDS", "0")
+BUDGET_MAX_LLM_CALLS = _limit("BUDGET_MAX_LLM_CALLS", "0")
+BUDGET_MAX_MEMORY_MB = _limit("BUDGET_MAX_MEMORY_MB", "0")
+BUDGET_BATCH_DEADLINE_SECONDS = _limit("BUDGET_BATCH_DEADLINE_SECONDS", "0")
+BUDGET_BATCH_MAX_LLM_CALLS = _limit("BUDGET_BATCH_MAX_LLM_CALLS", "0")
+# Queued jobs exist for the large contracts interactive limits would cut
+# down, so they never sample pages or chunks; only these apply
+BUDGET_JOB_DEADLINE_SECONDS = _limit("BUDGET_JOB_DEADLINE_SECONDS", "0")
+BUDGET_JOB_MAX_LLM_CALLS = _limit("BUDGET_JOB_MAX_LLM_CALLS", "0")
+
+BUDGET_KINDS = ("request", "batch", "job")
+
+# Rough OCR cost used to decide whether OCR still fits in the deadline
+OCR_SECONDS_PER_PAGE = float(os.getenv("BUDGET_OCR_SECONDS_PER_PAGE", "3"))
+# Encode batch size used once the memory ceiling is reached
+LOW_MEMORY_ENCODE_BATCH = 8
+
+
+def current_rss_mb() -> Optional[float]:
+    """Resident set size of this process, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+class ResourceBudget:
+    """
+    Resource limits for one request, plus a record of what was skipped to
+    stay within them. Every limit is optional (None = unlimited).
+
+      max_pages        - longer PDFs are sampled evenly down to this many pages
+      max_chunks       - longer documents are sampled evenly down to this many chunks
+      deadline         - absolute time.time(); past it, OCR and rewrites are skipped
+      max_llm_calls    - rewrites beyond this many LLM requests are skipped
+      max_memory_mb    - above this process RSS, encoding drops to small batches
+
+    Detection itself is never skipped: a degraded response still lists the
+    risks found in everything that was processed.
+    """
+
+    def __init__(self, max_pages=None, max_chunks=None, deadline_seconds=None, max_llm_calls=None,
+                 max_memory_mb=None, deadline=None):
+        self.max_pages = int(max_pages) if max_pages else None
+        self.max_chunks = int(max_chunks) if max_chunks else None
+        if deadline is None and deadline_seconds:
+            deadline = time.time() + deadline_seconds
+        self.deadline = deadline
+        self.max_llm_calls = int(max_llm_calls) if max_llm_calls else None
+        self.max_memory_mb = max_memory_mb
+        self.llm_calls = 0
+        self.skipped: List[Dict] = []
+
+    def limits(self) -> Dict:
+        """Constructor arguments, e.g. to rebuild the budget in a worker process."""
+        return {
+            "max_pages": self.max_pages,
+            "max_chunks": self.max_chunks,
+            "deadline": self.deadline,
+            "max_llm_calls": self.max_llm_calls,
+            "max_memory_mb": self.max_memory_mb,
+        }
+
+    def remaining_seconds(self) -> Optional[float]:
+        return None if self.deadline is None else self.deadline - time.time()
+
+    def expired(self) -> bool:
+        remaining = self.remaining_seconds()
+        return remaining is not None and remaining <= 0
+
+    def skip(self, stage: str, reason: str, **details):
+        self.skipped.append({"stage": stage, "reason": reason, **details})
+        registry.inc("budget_degradations")
+
+    def allow_llm_call(self) -> bool:
+        """Reserve one LLM request; False once the call budget or deadline is spent."""
+        if self.expired():
+            return False
+        if self.max_llm_calls is not None and self.llm_calls >= self.max_llm_calls:
+            return False
+        self.llm_calls += 1
+        return True
+
+    def allow_ocr(self, num_pages: int) -> bool:
+        remaining = self.remaining_seconds()
+        return remaining is None or remaining > num_pages * OCR_SECONDS_PER_PAGE
+
+    def encode_batch_size(self, default: int) -> int:
+        if self.max_memory_mb is None:
+            return default
+        rss = current_rss_mb()
+        if rss is None or rss < self.max_memory_mb or default <= LOW_MEMORY_ENCODE_BATCH:
+            return default
+        self.skip("encode", "memory_ceiling", rss_mb=round(rss), batch_size=LOW_MEMORY_ENCODE_BATCH)
+        return LOW_MEMORY_ENCODE_BATCH
+
+
+def sample_evenly(count: int, limit: int) -> List[int]:
+    """`limit` indexes spread evenly over range(count), first and last included."""
+    if count <= limit:
+        return list(range(count))
+    if limit == 1:
+        return [0]
+    step = (count - 1) / (limit - 1)
+    return sorted({round(i * step) for i in range(limit)})
+
+
+def limit_chunks(chunks: List[Dict]) -> List[Dict]:
+    """Sample chunks evenly down to the current budget's max_chunks."""
+    budget = current_budget()
+    if budget is None or budget.max_chunks is None or len(chunks) <= budget.max_chunks:
+        return chunks
+    keep = sample_evenly(len(chunks), budget.max_chunks)
+    budget.skip("chunking", "max_chunks", chunks_total=len(chunks), chunks_processed=len(keep))
+    return [chunks[i] for i in keep]
+
+
+_current_budget: contextvars.ContextVar = contextvars.ContextVar("resource_budget", default=None)
+
+
+def current_budget() -> Optional[ResourceBudget]:
+    return _current_budget.get()
+
+
+def default_budget(kind: str = "request") -> ResourceBudget:
+    """The env-configured budget for an interactive request, a batch or a queued job."""
+    if kind not in BUDGET_KINDS:
+        raise ValueError(f"Unknown budget kind '{kind}', expected one of {BUDGET_KINDS}")
+    if kind == "job":
+        return ResourceBudget(
+            deadline_seconds=BUDGET_JOB_DEADLINE_SECONDS,
+            max_llm_calls=BUDGET_JOB_MAX_LLM_CALLS,
+            max_memory_mb=BUDGET_MAX_MEMORY_MB,
+        )
+    batch = kind == "batch"
+    return ResourceBudget(
+        max_pages=BUDGET_MAX_PAGES,
+        max_chunks=BUDGET_MAX_CHUNKS,
+        deadline_seconds=BUDGET_BATCH_DEADLINE_SECONDS if batch else BUDGET_DEADLINE_SECONDS,
+        max_llm_calls=BUDGET_BATCH_MAX_LLM_CALLS if batch else BUDGET_MAX_LLM_CALLS,
+        max_memory_mb=BUDGET_MAX_MEMORY_MB,
+    )
+
+
+@contextmanager
+def request_budget(budget: Optional[ResourceBudget] = None, kind: str = "request"):
+    """
+    Make a budget current for the enclosed work (default_budget(kind)
+    unless one is given). Stages find it via current_budget() and run
+    unlimited outside of one.
+    """
+    if budget is None:
+        budget = default_budget(kind)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
@@ -0,0 +1,457 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from metrics import stage, registry
+from tenancy import ANONYMOUS_TENANT
+
+
+# Rows per embedding segment file; fixed when the index is created
+SEGMENT_ROWS = int(os.getenv("CLAUSE_SEGMENT_ROWS", "65536"))
+
+# SQLite's default limit on bound parameters is 999
+SQL_BATCH = 500
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS index_meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS contracts (
+    id TEXT PRIMARY KEY,
+    parent_id TEXT,
+    filename TEXT,
+    num_clauses INTEGER NOT NULL,
+    superseded INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS clauses (
+    id INTEGER PRIMARY KEY,
+    contract_id TEXT NOT NULL,
+    chunk_id TEXT,
+    page INTEGER,
+    start_char INTEGER,
+    end_char INTEGER,
+    text TEXT NOT NULL,
+    superseded INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_clauses_contract ON clauses (contract_id);
+CREATE TABLE IF NOT EXISTS clause_risks (
+    clause_id INTEGER NOT NULL,
+    category TEXT NOT NULL,
+    score REAL NOT NULL,
+    superseded INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_clause_risks_category ON clause_risks (category, superseded, score, clause_id);
+CREATE INDEX IF NOT EXISTS idx_clause_risks_clause ON clause_risks (clause_id);
+"""
+
+# Columns added after the first release; created on older indexes at startup.
+# Contracts indexed before tenants were recorded go to the anonymous tenant.
+ADDED_COLUMNS = {"contracts": {"tenant": f"TEXT DEFAULT '{ANONYMOUS_TENANT}'"}}
+
+
+class ClauseIndex:
+    """
+    Persistent, portfolio-wide store of analysed clauses.
+
+    Embeddings live in append-only segment files of float32 rows
+    (segments/000000.f32, ...), L2-normalised so a dot product is the cosine
+    similarity. Row N of the concatenated segments is clause id N in SQLite,
+    which holds everything else: contract, filename, page, offsets, text and
+    the detected risk categories/scores. Every contract records the tenant
+    that analysed it, and a search given a tenant only sees its contracts.
+
+    Writers serialise on SQLite's write lock: vectors are written past the
+    last committed row, then the metadata is committed, so readers (which
+    only look at committed rows) never see a half-written clause. A crashed
+    writer leaves garbage past the committed rows that the next writer
+    overwrites. Safe to share between threads and pre-forked workers.
+    """
+
+    def __init__(self, index_dir: str):
+        self.index_dir = index_dir
+        os.makedirs(os.path.join(index_dir, "segments"), exist_ok=True)
+        self.db_path = os.path.join(index_dir, "clauses.db")
+        self._maps = {}  # segment -> (rows mapped, np.memmap)
+        self._maps_lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            for table, columns in ADDED_COLUMNS.items():
+                existing = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+                for column, column_type in columns.items():
+                    if column not in existing:
+                        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            conn.execute(
+                "INSERT OR IGNORE INTO index_meta (key, value) VALUES ('segment_rows', ?)", (str(SEGMENT_ROWS),)
+            )
+            self.segment_rows = int(self._meta(conn, "segment_rows"))
+            dim = self._meta(conn, "dim")
+            self.dim = int(dim) if dim else None
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _meta(conn, key):
+        row = conn.execute("SELECT value FROM index_meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def _segment_path(self, segment: int) -> str:
+        return os.path.join(self.index_dir, "segments", f"{segment:06d}.f32")
+
+    # ----- writing -----
+
+    def add_contract(self, contract_id: str, filename: str, chunks: List[Dict], risks: List[Dict],
+                     embeddings: Dict[str, np.ndarray], parent_id: Optional[str] = None,
+                     tenant: Optional[str] = None) -> int:
+        """
+        Index the clauses of one analysed contract. `embeddings` maps
+        chunk_id -> embedding; chunks without one are looked up by text in
+        the parent contract (unchanged clauses of a revision) and skipped if
+        still missing. Indexing a revision marks the parent as superseded.
+        Returns the number of clauses indexed.
+        """
+        vectors = dict(embeddings)
+        missing = [c for c in chunks if c["id"] not in vectors]
+        if missing and parent_id:
+            parent_vectors = self.vectors_by_text(parent_id)
+            for chunk in missing:
+                if chunk["text"] in parent_vectors:
+                    vectors[chunk["id"]] = parent_vectors[chunk["text"]]
+
+        indexed = [c for c in chunks if c["id"] in vectors]
+        risks_by_chunk = {}
+        for risk in risks:
+            risks_by_chunk.setdefault(risk["chunk_id"], []).append(
+                (risk["risk_category"], float(risk["similarity_score"]))
+            )
+
+        with stage("index_add"):
+            matrix = None
+            if indexed:
+                matrix = np.asarray([vectors[c["id"]] for c in indexed], dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                matrix /= np.where(norms == 0, 1, norms)
+
+            conn = self._connect()
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                if matrix is not None:
+                    self._check_dim(conn, matrix.shape[1])
+                start = conn.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM clauses").fetchone()[0]
+                if matrix is not None:
+                    self._write_vectors(start, matrix)
+
+                clause_rows = []
+                risk_rows = []
+                for row, chunk in enumerate(indexed, start=start):
+                    metadata = chunk.get("metadata", {})
+                    clause_rows.append((
+                        row, contract_id, chunk["id"], metadata.get("page"),
+                        metadata.get("start_char"), metadata.get("end_char"), chunk["text"],
+                    ))
+                    risk_rows.extend((row, category, score) for category, score in risks_by_chunk.get(chunk["id"], []))
+
+                conn.executemany(
+                    "INSERT INTO clauses (id, contract_id, chunk_id, page, start_char, end_char, text) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    clause_rows,
+                )
+                conn.executemany("INSERT INTO clause_risks (clause_id, category, score) VALUES (?, ?, ?)", risk_rows)
+                conn.execute(
+                    "INSERT INTO contracts (id, parent_id, tenant, filename, num_clauses, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (contract_id, parent_id, tenant, filename, len(indexed), time.time()),
+                )
+                if parent_id:
+                    conn.execute("UPDATE contracts SET superseded = 1 WHERE id = ?", (parent_id,))
+                    conn.execute("UPDATE clauses SET superseded = 1 WHERE contract_id = ?", (parent_id,))
+                    conn.execute(
+                        "UPDATE clause_risks SET superseded = 1 "
+                        "WHERE clause_id IN (SELECT id FROM clauses WHERE contract_id = ?)", (parent_id,)
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            finally:
+                conn.close()
+
+        registry.inc("index_clauses_added", len(indexed))
+        return len(indexed)
+
+    def _check_dim(self, conn, dim: int):
+        stored = self._meta(conn, "dim")
+        if stored is None:
+            conn.execute("INSERT INTO index_meta (key, value) VALUES ('dim', ?)", (str(dim),))
+            stored = dim
+        if int(stored) != dim:
+            raise ValueError(f"Embedding dimension {dim} does not match the index ({stored})")
+        self.dim = int(stored)
+
+    def _write_vectors(self, start: int, matrix: np.ndarray):
+        row = start
+        done = 0
+        while done < len(matrix):
+            segment, offset = divmod(row, self.segment_rows)
+            n = min(len(matrix) - done, self.segment_rows - offset)
+            path = self._segment_path(segment)
+            with open(path, "r+b" if os.path.exists(path) else "w+b") as f:
+                f.seek(offset * self.dim * 4)
+                f.write(matrix[done:done + n].tobytes())
+            done += n
+            row += n
+
+    # ----- reading -----
+
+    def _segment(self, segment: int, rows: int) -> np.ndarray:
+        """First `rows` committed rows of a segment, memory-mapped."""
+        with self._maps_lock:
+            cached = self._maps.get(segment)
+            if cached is None or cached[0] < rows:
+                # Full segments never change; the last one is remapped as it grows
+                mapped = np.memmap(self._segment_path(segment), dtype=np.float32, mode="r",
+                                   shape=(rows, self.dim))
+                cached = self._maps[segment] = (rows, mapped)
+        return cached[1][:rows]
+
+    def _committed_rows(self, conn) -> int:
+        return conn.execute("SELECT COALESCE(MAX(id) + 1, 0) FROM clauses").fetchone()[0]
+
+    def _vectors(self, ids: np.ndarray, total: int) -> np.ndarray:
+        """Embeddings of the given (sorted) clause ids."""
+        out = np.empty((len(ids), self.dim), dtype=np.float32)
+        segments = ids // self.segment_rows
+        for segment in np.unique(segments):
+            mask = segments == segment
+            rows = min(self.segment_rows, total - segment * self.segment_rows)
+            out[mask] = self._segment(int(segment), rows)[ids[mask] - segment * self.segment_rows]
+        return out
+
+    def _scan(self, query: np.ndarray, total: int) -> np.ndarray:
+        """Similarity of the query to every committed clause."""
+        scores = np.empty(total, dtype=np.float32)
+        for segment in range((total + self.segment_rows - 1) // self.segment_rows):
+            begin = segment * self.segment_rows
+            rows = min(self.segment_rows, total - begin)
+            scores[begin:begin + rows] = self._segment(segment, rows) @ query
+        return scores
+
+    def vectors_by_text(self, contract_id: str) -> Dict[str, np.ndarray]:
+        with self._connect() as conn:
+            total = self._committed_rows(conn)
+            rows = conn.execute(
+                "SELECT id, text FROM clauses WHERE contract_id = ? ORDER BY id", (contract_id,)
+            ).fetchall()
+        if not rows:
+            return {}
+        vectors = self._vectors(np.array([r["id"] for r in rows]), total)
+        return {r["text"]: vectors[i] for i, r in enumerate(rows)}
+
+    def search(self, query_vector, top_k: int = 10, categories: Optional[List[str]] = None,
+               min_risk_score: Optional[float] = None, contract_ids: Optional[List[str]] = None,
+               filename: Optional[str] = None, include_superseded: bool = False,
+               unique_contracts: bool = False, tenant: Optional[str] = None) -> List[Dict]:
+        """
+        Most similar clauses to `query_vector`, best first.
+
+        Metadata filters (categories, min_risk_score, contract_ids, filename)
+        are resolved in SQLite first and only the matching rows are scored;
+        without them every committed row is scanned. With a tenant, only that
+        tenant's contracts are searched (a full scan still applies when no
+        other tenant has indexed anything). Superseded contract
+        versions are skipped unless include_superseded is set, and
+        unique_contracts keeps only the best clause per contract.
+        """
+        query = np.asarray(query_vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+
+        with stage("search"):
+            with self._connect() as conn:
+                total = self._committed_rows(conn)
+                if total == 0 or top_k <= 0:
+                    return []
+                if self.dim is None:
+                    self.dim = int(self._meta(conn, "dim"))
+                if len(query) != self.dim:
+                    raise ValueError(f"Query dimension {len(query)} does not match the index ({self.dim})")
+
+                if tenant is not None and not conn.execute(
+                    "SELECT 1 FROM contracts WHERE tenant IS NOT ? LIMIT 1", (tenant,)
+                ).fetchone():
+                    tenant = None  # every indexed contract is this tenant's
+                filtered = categories or min_risk_score is not None or contract_ids or filename or tenant
+                if filtered:
+                    ids = self._filter_ids(conn, categories, min_risk_score, contract_ids, filename,
+                                           include_superseded, tenant)
+                    if len(ids) == 0:
+                        return []
+                    scores = self._vectors(ids, total) @ query
+                else:
+                    ids = None
+                    scores = self._scan(query, total)
+
+                post_filter = unique_contracts or (not filtered and not include_superseded)
+                fetch = top_k * 4 if post_filter else top_k
+                while True:
+                    n = min(fetch, len(scores))
+                    top = np.argpartition(-scores, n - 1)[:n] if n < len(scores) else np.arange(len(scores))
+                    top = top[np.argsort(-scores[top], kind="stable")]
+                    results = self._collect(conn, top if ids is None else ids[top], scores[top],
+                                            top_k, include_superseded, unique_contracts)
+                    if len(results) >= top_k or n == len(scores):
+                        break
+                    fetch *= 4
+
+        registry.inc("index_searches")
+        return results
+
+    def _filter_ids(self, conn, categories, min_risk_score, contract_ids, filename, include_superseded,
+                    tenant=None) -> np.ndarray:
+        where = []
+        params = []
+        if categories or min_risk_score is not None:
+            # Risky clauses are a small minority: answer from the covering
+            # (category, superseded, score, clause_id) index alone when possible
+            column = "r.clause_id"
+            source = "clause_risks r"
+            if categories:
+                where.append(f"r.category IN ({', '.join('?' * len(categories))})")
+                params.extend(categories)
+            if min_risk_score is not None:
+                where.append("r.score >= ?")
+                params.append(min_risk_score)
+            if not include_superseded:
+                where.append("r.superseded = 0")
+            if contract_ids or filename or tenant:
+                source += " JOIN clauses c ON c.id = r.clause_id"
+        else:
+            column = "c.id"
+            source = "clauses c"
+            if not include_superseded:
+                where.append("c.superseded = 0")
+        if contract_ids:
+            where.append(f"c.contract_id IN ({', '.join('?' * len(contract_ids))})")
+            params.extend(contract_ids)
+        if filename or tenant:
+            source += " JOIN contracts k ON k.id = c.contract_id"
+        if filename:
+            where.append("k.filename = ?")
+            params.append(filename)
+        if tenant:
+            where.append("k.tenant = ?")
+            params.append(tenant)
+
+        rows = conn.execute(f"SELECT {column} FROM {source} WHERE {' AND '.join(where) or '1'}", params).fetchall()
+        # A clause can match several categories
+        return np.unique(np.fromiter((r[0] for r in rows), dtype=np.int64, count=len(rows)))
+
+    def _collect(self, conn, ids, scores, top_k, include_superseded, unique_contracts) -> List[Dict]:
+        id_list = [int(i) for i in ids]
+        clauses = {}
+        risks = {}
+        for i in range(0, len(id_list), SQL_BATCH):
+            batch = id_list[i:i + SQL_BATCH]
+            marks = ", ".join("?" * len(batch))
+            for row in conn.execute(
+                "SELECT c.id, c.contract_id, k.filename, c.superseded, c.chunk_id, c.page, c.start_char, "
+                f"c.end_char, c.text FROM clauses c JOIN contracts k ON k.id = c.contract_id WHERE c.id IN ({marks})",
+                batch,
+            ):
+                clauses[row["id"]] = row
+            for row in conn.execute(
+                f"SELECT clause_id, category, score FROM clause_risks WHERE clause_id IN ({marks})", batch
+            ):
+                risks.setdefault(row["clause_id"], []).append({"category": row["category"], "score": row["score"]})
+
+        results = []
+        seen_contracts = set()
+        for clause_id, score in zip(id_list, scores):
+            row = clauses.get(clause_id)
+            if row is None or (row["superseded"] and not include_superseded):
+                continue
+            if unique_contracts:
+                if row["contract_id"] in seen_contracts:
+                    continue
+                seen_contracts.add(row["contract_id"])
+            results.append({
+                "contract_id": row["contract_id"],
+                "filename": row["filename"],
+                "chunk_id": row["chunk_id"],
+                "page": row["page"],
+                "start_char": row["start_char"],
+                "end_char": row["end_char"],
+                "text": row["text"],
+                "similarity": round(float(score), 4),
+                "risks": sorted(risks.get(clause_id, []), key=lambda r: r["score"], reverse=True),
+            })
+            if len(results) == top_k:
+                break
+        return results
+
+    def counts(self) -> Dict[str, int]:
+        with self._connect() as conn:
+            contracts = conn.execute("SELECT COUNT(*) FROM contracts WHERE superseded = 0").fetchone()[0]
+            clauses = self._committed_rows(conn)
+        return {"contracts": contracts, "clauses": clauses}
+
+
+if __name__ == "__main__":
+    # Query latency on a synthetic index:  python clause_index.py --rows 300000 --dim 768
+    import argparse
+    import tempfile
+
+    parser = argparse.ArgumentParser(description="Benchmark clause index search latency")
+    parser.add_argument("--rows", type=int, default=300000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--clauses-per-contract", type=int, default=100)
+    parser.add_argument("--risk-ratio", type=float, default=0.05, help="Fraction of clauses carrying a risk")
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--top-k", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    categories = ["Termination For Convenience", "Uncapped Liability", "Non-Compete"]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = ClauseIndex(tmp_dir)
+        started = time.perf_counter()
+        for c in range(0, args.rows, args.clauses_per_contract):
+            n = min(args.clauses_per_contract, args.rows - c)
+            chunks = [{"id": f"chunk_{i}", "text": f"clause {c + i}", "metadata": {"page": i // 5 + 1}} for i in range(n)]
+            vectors = rng.standard_normal((n, args.dim), dtype=np.float32)
+            risks = [
+                {"chunk_id": f"chunk_{i}", "risk_category": categories[i % len(categories)],
+                 "similarity_score": float(rng.uniform(0.75, 1.0))}
+                for i in np.flatnonzero(rng.random(n) < args.risk_ratio)
+            ]
+            index.add_contract(f"contract_{c}", f"contract_{c}.pdf", chunks, risks,
+                               {chunk["id"]: v for chunk, v in zip(chunks, vectors)})
+        print(f"Indexed {args.rows} clauses in {time.perf_counter() - started:.1f}s")
+
+        queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+        for label, kwargs in [
+            ("unfiltered", {}),
+            ("unique_contracts", {"unique_contracts": True}),
+            ("category filter", {"categories": ["Uncapped Liability"]}),
+            ("category + min score", {"categories": ["Non-Compete", "Uncapped Liability"], "min_risk_score": 0.9}),
+        ]:
+            index.search(queries[0], top_k=args.top_k, **kwargs)  # warm the page cache
+            latencies = []
+            for q in queries:
+                t = time.perf_counter()
+                index.search(q, top_k=args.top_k, **kwargs)
+                latencies.append(time.perf_counter() - t)
+            latencies = np.array(latencies) * 1000
+            print(f"{label:>22}: p50 {np.percentile(latencies, 50):.1f} ms, p95 {np.percentile(latencies, 95):.1f} ms")
@@ -0,0 +1,78 @@
+"""
+Plain text of a DOCX file, read straight from its XML.
+
+A DOCX is a ZIP archive whose body lives in word/document.xml, so the
+standard library is enough: no python-docx, no temp file, no layout pass.
+Paragraphs become lines, table rows become "cell | cell" lines (like the
+layout PDF backend), and tracked deletions are left out.
+"""
+import io
+import os
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+
+
+W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+DOCUMENT_XML = "word/document.xml"
+# Refuse archives whose main document inflates beyond this (zip bombs)
+DOCX_MAX_XML_MB = int(os.getenv("DOCX_MAX_XML_MB", "200"))
+
+
+def _paragraph_text(paragraph) -> str:
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == W + "t":
+            parts.append(node.text or "")
+        elif node.tag == W + "tab":
+            parts.append("\t")
+        elif node.tag in (W + "br", W + "cr"):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _block_lines(element, lines):
+    for child in element:
+        if child.tag == W + "p":
+            lines.append(_paragraph_text(child))
+        elif child.tag == W + "tbl":
+            for row in child.findall(W + "tr"):
+                cells = []
+                for cell in row.findall(W + "tc"):
+                    # A nested table becomes part of its cell's text, not lines of its own
+                    cell_lines = []
+                    _block_lines(cell, cell_lines)
+                    cells.append(" ".join(cell_lines).strip())
+                lines.append(" | ".join(cells))
+        elif child.tag in (W + "sdt", W + "sdtContent", W + "customXml", W + "smartTag"):
+            # Content controls and custom markup wrap ordinary paragraphs
+            _block_lines(child, lines)
+
+
+def extract_docx_text(data: bytes) -> str:
+    """Document text, one line per paragraph or table row. ValueError if `data` is not a DOCX."""
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(data))
+        info = archive.getinfo(DOCUMENT_XML)
+    except (zipfile.BadZipFile, KeyError):
+        raise ValueError("Not a valid DOCX file")
+    if info.file_size > DOCX_MAX_XML_MB * 1024 * 1024:
+        raise ValueError("DOCX document is too large when extracted")
+    try:
+        xml = archive.read(info)
+    except RuntimeError:
+        # zipfile's error for an encrypted member
+        raise ValueError("Encrypted DOCX files are not supported")
+    except (zipfile.BadZipFile, zlib.error, EOFError, NotImplementedError):
+        # Bad CRC, a truncated member or an unsupported compression method
+        raise ValueError("Not a valid DOCX file")
+    try:
+        root = ET.fromstring(xml)
+    except ET.ParseError as e:
+        raise ValueError(f"Invalid DOCX document XML: {e}")
+
+    body = root.find(W + "body")
+    lines = []
+    if body is not None:
+        _block_lines(body, lines)
+    return "\n".join(lines).strip()
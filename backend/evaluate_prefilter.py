@@ -0,0 +1,128 @@
+"""
+Measure the lexical prefilter's recall on held-out data.
+
+    python evaluate_prefilter.py --skip-ratios 0.25 0.5 0.75 0.9
+    python evaluate_prefilter.py --pdf contracts/*.pdf --with-embeddings
+
+A fraction of the gold-standard exemplars is held out; the prefilter is
+built from the rest. The evaluation corpus is the held-out risky clauses
+(positives) plus chunks of risk-free contract text (synthetic boilerplate,
+or real contracts passed with --pdf).
+
+Reported per skip ratio:
+  skipped            - fraction of corpus chunks that never reach the encoder
+  label_recall       - held-out risky clauses that survive the prefilter
+  embedding_recall   - (--with-embeddings) chunks the full embedding pass
+                       flags at --threshold that also survive the prefilter
+"""
+import argparse
+import json
+import random
+import sys
+
+from ip_mod_api import ContractIngestor
+from lexical_prefilter import LexicalPrefilter
+from synthetic_pdf import generate_contract_pages
+
+
+DATASET_PATH = "dataset/synthetic_gold_standard_with_nli.json"
+
+
+def split_gold_standard(data, holdout, seed):
+    rng = random.Random(seed)
+    by_category = {}
+    for item in data:
+        by_category.setdefault(item["category"], []).append(item)
+
+    train, held_out = {}, []
+    for category, items in by_category.items():
+        items = items[:]
+        rng.shuffle(items)
+        n_held = max(1, int(len(items) * holdout))
+        held_out.extend(items[:n_held])
+        train[category] = [items[0]["nli_hypothesis"]] + [i["risky_clause"] for i in items[n_held:]]
+    return train, held_out
+
+
+def negative_chunks(pdf_paths, pages, seed):
+    ingestor = ContractIngestor(chunk_size=600, chunk_overlap=150)
+    if pdf_paths:
+        texts = []
+        for path in pdf_paths:
+            texts.extend(c["text"] for c in ingestor.process_contract(path))
+        return texts
+    lines = [line for page in generate_contract_pages(pages, [], risk_ratio=0.0, seed=seed) for line in page]
+    return [c["text"] for c in ingestor.chunk_text("\n".join(lines))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Held-out recall of the lexical prefilter")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--holdout", type=float, default=0.3, help="Fraction of exemplars per category held out")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pdf", nargs="*", help="Contracts to use as negatives (default: synthetic boilerplate)")
+    parser.add_argument("--pages", type=int, default=50, help="Synthetic boilerplate pages when --pdf is not given")
+    parser.add_argument("--min-score", type=float, default=0.1)
+    parser.add_argument("--skip-ratios", type=float, nargs="+", default=[0.25, 0.5, 0.75, 0.9])
+    parser.add_argument("--with-embeddings", action="store_true",
+                        help="Also compare against the full embedding pass (loads the model)")
+    parser.add_argument("--threshold", type=float, default=0.75)
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    with open(args.dataset) as f:
+        data = json.load(f)
+
+    train, held_out = split_gold_standard(data, args.holdout, args.seed)
+    positives = [item["risky_clause"] for item in held_out]
+    negatives = negative_chunks(args.pdf, args.pages, args.seed)
+    corpus = positives + negatives
+    print(f"Train exemplars: {sum(len(v) for v in train.values())}, "
+          f"held-out positives: {len(positives)}, negatives: {len(negatives)}")
+
+    flagged = None
+    if args.with_embeddings:
+        from vector_search import RiskDetector
+
+        # Tuned per-category thresholds would override --threshold
+        detector = RiskDetector(args.dataset, use_prefilter=False, thresholds_path=None)
+        chunks = [{"id": str(i), "text": text} for i, text in enumerate(corpus)]
+        flagged = {int(r["chunk_id"]) for r in detector.detect_risks(chunks, threshold=args.threshold)}
+        print(f"Full embedding pass flags {len(flagged)} chunk(s) at threshold {args.threshold}")
+
+    results = []
+    print(f"\n{'skip_ratio':>10}{'skipped':>10}{'label_recall':>14}{'embedding_recall':>18}")
+    for skip_ratio in args.skip_ratios:
+        prefilter = LexicalPrefilter(train, min_score=args.min_score, skip_ratio=skip_ratio)
+        kept = set(prefilter.select(corpus).tolist())
+
+        row = {
+            "skip_ratio": skip_ratio,
+            "min_score": args.min_score,
+            "skipped": round(1 - len(kept) / len(corpus), 4),
+            "label_recall": round(sum(1 for i in range(len(positives)) if i in kept) / len(positives), 4),
+        }
+        if flagged is not None:
+            row["embedding_recall"] = round(len(flagged & kept) / len(flagged), 4) if flagged else None
+        results.append(row)
+
+        embedding_recall = row.get("embedding_recall")
+        embedding_text = f"{embedding_recall:.4f}" if embedding_recall is not None else "-"
+        print(f"{skip_ratio:>10.2f}{row['skipped']:>10.4f}{row['label_recall']:>14.4f}{embedding_text:>18}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "holdout": args.holdout,
+                "seed": args.seed,
+                "num_positives": len(positives),
+                "num_negatives": len(negatives),
+                "threshold": args.threshold if args.with_embeddings else None,
+                "results": results,
+            }, f, indent=4)
+        print(f"\nResults saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,230 @@
+"""
+Sweep detection thresholds, scoring strategies and top-k offline.
+
+    python evaluate_thresholds.py
+    python evaluate_thresholds.py --min-recall 0.9 --write-config
+    python evaluate_thresholds.py --corpus labeled_chunks.jsonl --pdf contracts/*.pdf
+
+The labeled corpus is built from the gold standard, with a fraction held
+out per category (see evaluate_prefilter.split_gold_standard). It contains:
+  - held-out risky clauses: positives for their category
+  - held-out safe clauses: hard negatives
+  - risk-free contract chunks: synthetic boilerplate, or --pdf contracts
+  - optional --corpus JSONL lines {"text": ..., "categories": [...]}, where an
+    empty list marks a negative
+
+The rest of the gold standard are the exemplars for the exemplar-based
+strategies (see thresholds.AGGREGATIONS). Every text is embedded once, and
+the embeddings are cached per model in --cache-dir, so re-runs only encode
+new texts. Each (strategy, top_k) pair is one matrix product, and a whole
+threshold grid is evaluated from a single sort per category.
+
+For every configuration the report gives the per-category operating point
+(best F1, or best precision at --min-recall), with its precision, recall
+and F1. --write-config saves the best configuration to THRESHOLDS_PATH,
+where RiskDetector picks it up at startup.
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+
+import numpy as np
+
+from evaluate_prefilter import negative_chunks, split_gold_standard
+from thresholds import (
+    AGGREGATIONS, THRESHOLDS_PATH, aggregate_scores, pick_operating_points, save_threshold_config, sweep_thresholds,
+)
+
+
+DATASET_PATH = "dataset/synthetic_gold_standard_with_nli.json"
+
+
+class EmbeddingCache:
+    """Text -> embedding, persisted as one .npz per model and keyed by SHA-1 of the text."""
+
+    def __init__(self, cache_dir: str, model_id: str):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.path = os.path.join(cache_dir, re.sub(r"[^A-Za-z0-9_.-]", "_", model_id) + ".npz")
+        self.rows = {}
+        self.vectors = None
+        if os.path.exists(self.path):
+            stored = np.load(self.path)
+            self.vectors = stored["vectors"]
+            self.rows = {key: i for i, key in enumerate(stored["keys"].tolist())}
+
+    @staticmethod
+    def key(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def embed(self, texts, encode):
+        keys = [self.key(t) for t in texts]
+        missing = list(dict.fromkeys(k for k in keys if k not in self.rows))
+        if missing:
+            by_key = dict(zip(keys, texts))
+            new_vectors = np.asarray(encode([by_key[k] for k in missing]), dtype=np.float32)
+            start = 0 if self.vectors is None else len(self.vectors)
+            self.vectors = new_vectors if self.vectors is None else np.vstack([self.vectors, new_vectors])
+            self.rows.update((k, start + i) for i, k in enumerate(missing))
+            np.savez(self.path, keys=np.array(list(self.rows)), vectors=self.vectors)
+        print(f"Embeddings: {len(set(keys)) - len(missing)} cached, {len(missing)} encoded ({self.path})")
+        return self.vectors[[self.rows[k] for k in keys]]
+
+
+def load_labeled_corpus(path, categories):
+    texts, labels = [], []
+    with open(path) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            unknown = set(item.get("categories", [])) - set(categories)
+            if unknown:
+                print(f"Ignoring unknown categories in {path}: {sorted(unknown)}")
+            texts.append(item["text"])
+            labels.append([c in item.get("categories", []) for c in categories])
+    return texts, labels
+
+
+def build_corpus(args, data, categories):
+    exemplars, held_out = split_gold_standard(data, args.holdout, args.seed)
+    texts, labels = [], []
+    for item in held_out:
+        texts.append(item["risky_clause"])
+        labels.append([c == item["category"] for c in categories])
+        if item.get("safe_clause"):
+            texts.append(item["safe_clause"])
+            labels.append([False] * len(categories))
+    for text in negative_chunks(args.pdf, args.pages, args.seed):
+        texts.append(text)
+        labels.append([False] * len(categories))
+    if args.corpus:
+        extra_texts, extra_labels = load_labeled_corpus(args.corpus, categories)
+        texts.extend(extra_texts)
+        labels.extend(extra_labels)
+    return exemplars, texts, np.array(labels, dtype=bool).T
+
+
+def evaluate_configuration(scores, labels, grid, min_recall):
+    sweep = sweep_thresholds(scores, labels, grid)
+    picks = pick_operating_points(sweep, grid, min_recall)
+    per_category = []
+    for c, t in enumerate(picks):
+        per_category.append({
+            "threshold": round(float(grid[t]), 4),
+            "precision": round(float(sweep["precision"][c, t]), 4),
+            "recall": round(float(sweep["recall"][c, t]), 4),
+            "f1": round(float(sweep["f1"][c, t]), 4),
+            "support": int(labels[c].sum()),
+        })
+    return per_category
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline threshold/strategy sweep for risk detection")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--holdout", type=float, default=0.3, help="Fraction of exemplars per category held out")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pdf", nargs="*", help="Risk-free contracts used as negatives (default: synthetic)")
+    parser.add_argument("--pages", type=int, default=50, help="Synthetic boilerplate pages when --pdf is not given")
+    parser.add_argument("--corpus", help="Extra labeled chunks, JSONL {\"text\", \"categories\"}")
+    parser.add_argument("--aggregations", nargs="+", choices=AGGREGATIONS, default=list(AGGREGATIONS))
+    parser.add_argument("--top-k", type=int, nargs="+", default=[2, 3, 5], help="k values for mean_topk")
+    parser.add_argument("--thresholds", type=float, nargs=3, default=[0.2, 0.95, 0.01], metavar=("START", "STOP", "STEP"))
+    parser.add_argument("--baseline-threshold", type=float, default=0.75,
+                        help="Global threshold the service uses today (analysis.DETECTION_THRESHOLD)")
+    parser.add_argument("--min-recall", type=float, help="Pick the best precision at this recall instead of best F1")
+    parser.add_argument("--cache-dir", default="eval_cache")
+    parser.add_argument("--write-config", nargs="?", const=THRESHOLDS_PATH, help="Save the best configuration")
+    parser.add_argument("--output", help="Write the full report as JSON")
+    args = parser.parse_args()
+
+    with open(args.dataset) as f:
+        data = json.load(f)
+
+    from vector_search import RiskDetector
+    detector = RiskDetector(args.dataset, use_prefilter=False, thresholds_path=None)
+    categories = list(detector.gold_standard.keys())
+
+    exemplars, texts, labels = build_corpus(args, data, categories)
+    print(f"Corpus: {labels.shape[1]} chunks, positives per category: "
+          f"{dict(zip(categories, labels.sum(axis=1).tolist()))}")
+
+    exemplar_texts, exemplar_rows = [], []
+    for category, items in exemplars.items():
+        # items[0] is the definition, which aggregate_scores adds itself
+        exemplar_texts.extend(items[1:])
+        exemplar_rows.extend([categories.index(category)] * (len(items) - 1))
+
+    cache = EmbeddingCache(args.cache_dir, detector.model_id)
+    definitions = list(detector.gold_standard.values())
+    vectors = cache.embed(definitions + exemplar_texts + texts, lambda batch: detector.model.encode(batch, batch_size=64))
+    definition_vectors = vectors[:len(definitions)]
+    exemplar_vectors = vectors[len(definitions):len(definitions) + len(exemplar_texts)]
+    chunk_vectors = vectors[len(definitions) + len(exemplar_texts):]
+
+    start, stop, step = args.thresholds
+    grid = np.round(np.arange(start, stop + step / 2, step), 6)
+    configurations = [(a, k) for a in args.aggregations for k in (args.top_k if a == "mean_topk" else [None])]
+
+    started = time.perf_counter()
+    report = []
+    for aggregation, top_k in configurations:
+        scores = aggregate_scores(chunk_vectors, definition_vectors, exemplar_vectors, exemplar_rows,
+                                  aggregation=aggregation, top_k=top_k or 3)
+        per_category = evaluate_configuration(scores, labels, grid, args.min_recall)
+        entry = {
+            "aggregation": aggregation,
+            "top_k": top_k,
+            "macro_f1": round(float(np.mean([c["f1"] for c in per_category])), 4),
+            "categories": dict(zip(categories, per_category)),
+        }
+        if aggregation == "definition":
+            # What the service does today: one global threshold
+            baseline = sweep_thresholds(scores, labels, np.array([args.baseline_threshold]))
+            entry["baseline"] = {
+                "threshold": args.baseline_threshold,
+                "macro_f1": round(float(baseline["f1"][:, 0].mean()), 4),
+            }
+        report.append(entry)
+    elapsed = time.perf_counter() - started
+    print(f"Swept {len(configurations)} configurations x {len(grid)} thresholds in {elapsed:.3f}s")
+
+    for entry in report:
+        name = entry["aggregation"] + (f" (k={entry['top_k']})" if entry["top_k"] else "")
+        print(f"\n{name}: macro F1 {entry['macro_f1']}"
+              + (f" (global {entry['baseline']['threshold']}: {entry['baseline']['macro_f1']})" if "baseline" in entry else ""))
+        print("| Category | Threshold | Precision | Recall | F1 | Support |")
+        print("|---|---|---|---|---|---|")
+        for category, m in entry["categories"].items():
+            print(f"| {category} | {m['threshold']} | {m['precision']} | {m['recall']} | {m['f1']} | {m['support']} |")
+
+    # Ties keep the earlier (simpler) strategy
+    best = max(report, key=lambda e: (e["macro_f1"], -report.index(e)))
+    print(f"\nBest: {best['aggregation']}" + (f" (k={best['top_k']})" if best["top_k"] else "")
+          + f", macro F1 {best['macro_f1']}")
+
+    if args.write_config:
+        save_threshold_config(
+            args.write_config,
+            model=detector.model_id,
+            aggregation=best["aggregation"],
+            top_k=best["top_k"] or 3,
+            thresholds={c: m["threshold"] for c, m in best["categories"].items()},
+            report={"macro_f1": best["macro_f1"], "categories": best["categories"],
+                    "min_recall": args.min_recall, "corpus_chunks": int(labels.shape[1])},
+        )
+        print(f"Threshold config written to {args.write_config}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"grid": [start, stop, step], "min_recall": args.min_recall, "results": report}, f, indent=4)
+        print(f"Results saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,327 @@
+"""
+Columnar on-disk format for the gold standard.
+
+    python gold_store.py build --input dataset/synthetic_gold_standard_with_nli.json \\
+        --output dataset/gold_standard.gold
+    python gold_store.py bench --rows 100000
+
+A store is a directory:
+
+    meta.json              row count, column names, categories in order with
+                           their definition (nli_hypothesis) and row range,
+                           embedding model and dimension
+    <column>.offsets       uint64 (rows + 1) byte offsets into <column>.utf8
+    <column>.utf8          the column's strings, UTF-8, back to back
+    category_ids.u16       uint16 category index per row
+    embeddings.f16         float16 (rows x dim), L2-normalised risky_clause embeddings
+    definitions.f16        float16 (categories x dim), L2-normalised definition embeddings
+
+Rows are grouped by category (first-occurrence order, original order within a
+category), so each category is one contiguous row range. Opening a store only
+reads meta.json; every column and matrix is memory-mapped on first use, so
+startup time and RSS do not grow with the number of exemplars.
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from thresholds import normalise
+
+
+FORMAT_VERSION = 1
+TEXT_COLUMNS = ["id", "nli_hypothesis", "risky_clause", "safe_clause", "risk_explanation"]
+
+
+def _memmap(path: str, dtype, shape=None):
+    # np.memmap cannot map an empty file
+    if os.path.getsize(path) == 0:
+        return np.zeros(0 if shape is None else shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", shape=shape)
+
+
+class TextColumn:
+    """Read-only, memory-mapped string column."""
+
+    def __init__(self, directory: str, name: str):
+        self.offsets = _memmap(os.path.join(directory, f"{name}.offsets"), np.uint64)
+        self.data = _memmap(os.path.join(directory, f"{name}.utf8"), np.uint8)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        start, end = int(self.offsets[index]), int(self.offsets[index + 1])
+        return bytes(self.data[start:end]).decode("utf-8")
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class GoldStore:
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported gold store version {meta.get('version')} at {path}")
+
+        self.num_rows = meta["num_rows"]
+        self.columns = meta["columns"]
+        self.categories = [c["name"] for c in meta["categories"]]
+        self.definitions = {c["name"]: c["definition"] for c in meta["categories"]}
+        self._ranges = {c["name"]: range(c["start"], c["end"]) for c in meta["categories"]}
+        self.model = meta.get("model")
+        self.dim = meta.get("dim")
+
+        self._columns = {}
+        self._category_ids = None
+        self._embeddings = None
+        self._definition_embeddings = None
+
+    @staticmethod
+    def is_store(path: str) -> bool:
+        return os.path.isfile(os.path.join(path, "meta.json"))
+
+    def column(self, name: str) -> TextColumn:
+        if name not in self._columns:
+            if name not in self.columns:
+                raise KeyError(f"No column '{name}' in gold store {self.path}")
+            self._columns[name] = TextColumn(self.path, name)
+        return self._columns[name]
+
+    def category_rows(self, category: str) -> range:
+        return self._ranges[category]
+
+    @property
+    def category_ids(self) -> np.ndarray:
+        if self._category_ids is None:
+            self._category_ids = _memmap(os.path.join(self.path, "category_ids.u16"), np.uint16)
+        return self._category_ids
+
+    @property
+    def embeddings(self) -> Optional[np.ndarray]:
+        """float16 (rows x dim) risky_clause embeddings, or None if not built."""
+        if self._embeddings is None and self.dim:
+            self._embeddings = _memmap(os.path.join(self.path, "embeddings.f16"), np.float16, (self.num_rows, self.dim))
+        return self._embeddings
+
+    @property
+    def definition_embeddings(self) -> Optional[np.ndarray]:
+        """float16 (categories x dim) definition embeddings, in category order."""
+        if self._definition_embeddings is None and self.dim:
+            self._definition_embeddings = _memmap(
+                os.path.join(self.path, "definitions.f16"), np.float16, (len(self.categories), self.dim)
+            )
+        return self._definition_embeddings
+
+    def row(self, index: int) -> Dict:
+        item = {name: self.column(name)[index] for name in self.columns}
+        item["category"] = self.categories[int(self.category_ids[index])]
+        return item
+
+
+def _write_text_column(directory: str, name: str, values: List[str]):
+    offsets = np.zeros(len(values) + 1, dtype=np.uint64)
+    with open(os.path.join(directory, f"{name}.utf8"), "wb") as f:
+        position = 0
+        for i, value in enumerate(values):
+            encoded = (value or "").encode("utf-8")
+            f.write(encoded)
+            position += len(encoded)
+            offsets[i + 1] = position
+    offsets.tofile(os.path.join(directory, f"{name}.offsets"))
+
+
+def build_gold_store(data: List[Dict], output_dir: str, encode: Optional[Callable] = None,
+                     model: Optional[str] = None, batch_size: int = 256):
+    """
+    Write gold-standard rows (the JSON array's items) as a store at
+    output_dir, replacing any existing one. `encode(texts)` produces the
+    embedding matrices; without it only text columns are written.
+    """
+    by_category = {}
+    for item in data:
+        by_category.setdefault(item["category"], []).append(item)
+    rows = [item for items in by_category.values() for item in items]
+
+    tmp_dir = output_dir.rstrip("/\\") + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    categories = []
+    start = 0
+    for category_id, (category, items) in enumerate(by_category.items()):
+        # Same definition RiskDetector.load_gold_standard picks: the first one seen
+        categories.append({"name": category, "definition": items[0]["nli_hypothesis"],
+                           "start": start, "end": start + len(items)})
+        start += len(items)
+    np.repeat(np.arange(len(categories), dtype=np.uint16), [len(v) for v in by_category.values()]) \
+        .tofile(os.path.join(tmp_dir, "category_ids.u16"))
+
+    for name in TEXT_COLUMNS:
+        _write_text_column(tmp_dir, name, [item.get(name, "") for item in rows])
+
+    dim = None
+    if encode is not None:
+        with open(os.path.join(tmp_dir, "embeddings.f16"), "wb") as f:
+            for i in range(0, len(rows), batch_size):
+                block = normalise(encode([item.get("risky_clause", "") for item in rows[i:i + batch_size]]))
+                dim = block.shape[1]
+                block.astype(np.float16).tofile(f)
+        definitions = normalise(encode([c["definition"] for c in categories]))
+        dim = dim or definitions.shape[1]
+        definitions.astype(np.float16).tofile(os.path.join(tmp_dir, "definitions.f16"))
+
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump({
+            "version": FORMAT_VERSION,
+            "num_rows": len(rows),
+            "columns": TEXT_COLUMNS,
+            "categories": categories,
+            "model": model if encode is not None else None,
+            "dim": dim,
+            "created_at": time.time(),
+        }, f, indent=4)
+
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+
+
+# ----- benchmark -----
+
+LOAD_SNIPPET = """
+import json, sys, time
+import numpy
+sys.path.insert(0, {backend!r})
+started = time.perf_counter()
+if {use_store!r}:
+    from gold_store import GoldStore
+    store = GoldStore({path!r})
+    definitions = dict(store.definitions)
+else:
+    with open({path!r}) as f:
+        data = json.load(f)
+    definitions = {{}}
+    for item in data:
+        definitions.setdefault(item["category"], item["nli_hypothesis"])
+elapsed = time.perf_counter() - started
+# VmHWM (unlike ru_maxrss) is not inherited from the forking parent
+with open("/proc/self/status") as f:
+    peak_kb = int(next(line for line in f if line.startswith("VmHWM:")).split()[1])
+print(json.dumps({{"seconds": elapsed, "max_rss_mb": peak_kb / 1024, "categories": len(definitions)}}))
+"""
+
+
+def measure_load(path: str, use_store: bool) -> Dict:
+    """
+    Load in a fresh interpreter so time and peak RSS are not polluted by
+    this process. numpy is imported before the clock starts in both cases.
+    """
+    code = LOAD_SNIPPET.format(backend=os.path.dirname(os.path.abspath(__file__)), path=path, use_store=use_store)
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def synthetic_rows(seed_rows: List[Dict], count: int) -> List[Dict]:
+    """Grow the real gold standard to `count` rows by cycling it with unique ids."""
+    rows = []
+    for i in range(count):
+        item = dict(seed_rows[i % len(seed_rows)])
+        item["id"] = f"{item['id']}_{i}"
+        item["risky_clause"] = f"{item['risky_clause']} ({i})"
+        rows.append(item)
+    return rows
+
+
+def bench(args) -> int:
+    with open(args.input) as f:
+        seed_rows = json.load(f)
+
+    print(f"\n| Rows | JSON size (MB) | Store size (MB) | JSON load (s) | Store open (s) | JSON peak RSS (MB) | Store peak RSS (MB) |")
+    print("|---|---|---|---|---|---|---|")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for count in args.rows:
+            rows = synthetic_rows(seed_rows, count)
+            json_path = os.path.join(tmp_dir, f"gold_{count}.json")
+            with open(json_path, "w") as f:
+                # Same layout synthesize_data.py writes
+                json.dump(rows, f, indent=4)
+            store_path = os.path.join(tmp_dir, f"gold_{count}.gold")
+            rng = np.random.default_rng(0)
+            build_gold_store(rows, store_path, encode=lambda texts: rng.standard_normal((len(texts), args.dim)),
+                             model="synthetic")
+
+            store_bytes = sum(os.path.getsize(os.path.join(store_path, n)) for n in os.listdir(store_path))
+            json_load = measure_load(json_path, use_store=False)
+            store_load = measure_load(store_path, use_store=True)
+            row = {
+                "rows": count,
+                "json_mb": round(os.path.getsize(json_path) / 2 ** 20, 1),
+                "store_mb": round(store_bytes / 2 ** 20, 1),
+                "json_load_seconds": round(json_load["seconds"], 4),
+                "store_open_seconds": round(store_load["seconds"], 4),
+                "json_peak_rss_mb": round(json_load["max_rss_mb"], 1),
+                "store_peak_rss_mb": round(store_load["max_rss_mb"], 1),
+            }
+            results.append(row)
+            print(f"| {count} | {row['json_mb']} | {row['store_mb']} | {row['json_load_seconds']} | "
+                  f"{row['store_open_seconds']} | {row['json_peak_rss_mb']} | {row['store_peak_rss_mb']} |")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"dim": args.dim, "results": results}, f, indent=4)
+        print(f"\nResults saved to {args.output}")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or benchmark the columnar gold-standard store")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Convert the JSON gold standard into a store")
+    build.add_argument("--input", default="dataset/synthetic_gold_standard_with_nli.json")
+    build.add_argument("--output", default="dataset/gold_standard.gold")
+    build.add_argument("--no-embeddings", action="store_true", help="Only write text columns (no model needed)")
+    build.add_argument("--batch-size", type=int, default=256)
+
+    bench_parser = sub.add_parser("bench", help="Compare JSON loading with opening a store")
+    bench_parser.add_argument("--input", default="dataset/synthetic_gold_standard_with_nli.json")
+    bench_parser.add_argument("--rows", type=int, nargs="+", default=[1000, 10000, 100000])
+    bench_parser.add_argument("--dim", type=int, default=768)
+    bench_parser.add_argument("--output")
+
+    args = parser.parse_args()
+    if args.command == "bench":
+        return bench(args)
+
+    with open(args.input) as f:
+        data = json.load(f)
+
+    encode, model = None, None
+    if not args.no_embeddings:
+        from vector_search import HF_MODEL_ID
+        from sentence_transformers import SentenceTransformer
+
+        model = HF_MODEL_ID
+        print(f"Loading model {model}...")
+        encoder = SentenceTransformer(model)
+        encode = lambda texts: encoder.encode(texts, batch_size=64)
+
+    started = time.perf_counter()
+    build_gold_store(data, args.output, encode=encode, model=model, batch_size=args.batch_size)
+    print(f"Wrote {len(data)} rows to {args.output} in {time.perf_counter() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+Report what importing the app costs, and how long a fresh replica takes to
+become live and ready.
+
+    python import_report.py                      # import-time breakdown of main.py
+    python import_report.py --serve              # also time /livez and /readyz from a cold start
+    python import_report.py --max-seconds 2      # exit 1 if `import main` is slower (CI guard)
+
+The breakdown comes from `python -X importtime` in a fresh interpreter. The
+heavy dependencies (torch, sentence_transformers, sklearn, pdfplumber,
+langchain, openai) must stay out of `import main` so the app can answer
+health checks while the model loads; any that sneak in are listed and make
+the script exit 1.
+"""
+import argparse
+import json
+import re
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+HEAVY_MODULES = ["torch", "sentence_transformers", "transformers", "sklearn", "pdfplumber",
+                 "langchain_text_splitters", "openai"]
+
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def import_times(module: str):
+    """[(name, self_us, cumulative_us, depth)] in the order -X importtime prints them."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        print(result.stderr[-2000:])
+        raise SystemExit(f"`import {module}` failed")
+    rows = []
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return rows
+
+
+def summarize(rows, module: str, top: int):
+    total_us = next((c for name, _, c, depth in rows if name == module and depth == 0), sum(s for _, s, _, _ in rows))
+    by_package = {}
+    for name, self_us, _, _ in rows:
+        package = name.split(".")[0]
+        by_package[package] = by_package.get(package, 0) + self_us
+    imported = {name.split(".")[0] for name, _, _, _ in rows}
+    return {
+        "module": module,
+        "total_seconds": round(total_us / 1e6, 3),
+        "modules_imported": len(rows),
+        "heavy_modules_imported": [m for m in HEAVY_MODULES if m in imported],
+        "direct_imports": [
+            {"module": name, "cumulative_ms": round(c / 1000, 1)}
+            for name, _, c, depth in sorted((r for r in rows if r[3] == 1), key=lambda r: -r[2])[:top]
+        ],
+        "packages": [
+            {"package": package, "self_ms": round(us / 1000, 1)}
+            for package, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]
+        ],
+    }
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _get(url: str):
+    """(status, JSON body), or (None, None) while nothing is listening."""
+    try:
+        with urllib.request.urlopen(url, timeout=1) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+    except (urllib.error.URLError, OSError, ValueError):
+        return None, None
+
+
+def time_cold_start(timeout: float):
+    """Start `uvicorn main:app` and time until /livez and /readyz first answer 200."""
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    live = ready = readyz = None
+    try:
+        while time.perf_counter() - started < timeout and server.poll() is None:
+            if live is None:
+                if _get(base + "/livez")[0] == 200:
+                    live = time.perf_counter() - started
+            else:
+                status, readyz = _get(base + "/readyz")
+                if status == 200:
+                    ready = time.perf_counter() - started
+                    break
+                if readyz and readyz.get("status") == "failed":
+                    break
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "live_seconds": round(live, 2) if live is not None else None,
+        "ready_seconds": round(ready, 2) if ready is not None else None,
+        "readyz": readyz,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time and cold-start report for the API")
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--serve", action="store_true", help="Also time /livez and /readyz from a cold start")
+    parser.add_argument("--timeout", type=float, default=300, help="Give up waiting for readiness after this")
+    parser.add_argument("--max-seconds", type=float, help="Exit 1 if the import takes longer than this")
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    report = summarize(import_times(args.module), args.module, args.top)
+    print(f"`import {args.module}`: {report['total_seconds']}s, {report['modules_imported']} modules")
+
+    print("\n| Direct import | Cumulative (ms) |")
+    print("|---|---|")
+    for item in report["direct_imports"]:
+        print(f"| {item['module']} | {item['cumulative_ms']} |")
+    print("\n| Package | Self (ms) |")
+    print("|---|---|")
+    for item in report["packages"]:
+        print(f"| {item['package']} | {item['self_ms']} |")
+
+    failed = False
+    if report["heavy_modules_imported"]:
+        print(f"\nHeavy modules imported eagerly: {', '.join(report['heavy_modules_imported'])}")
+        failed = True
+    if args.max_seconds is not None and report["total_seconds"] > args.max_seconds:
+        print(f"\nImport took {report['total_seconds']}s, over the {args.max_seconds}s budget")
+        failed = True
+
+    if args.serve:
+        report["cold_start"] = time_cold_start(args.timeout)
+        cold = report["cold_start"]
+        ready = f"ready after {cold['ready_seconds']}s" if cold["ready_seconds"] is not None else "never ready"
+        print(f"\nCold start: live after {cold['live_seconds']}s, {ready} (/readyz: {cold['readyz']})")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+        print(f"\nReport saved to {args.output}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,18 @@
-import pdfplumber
 import os
+from bisect import bisect_right
 from typing import List, Dict
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import json
 import tempfile
-# from pdf2image import convert_from_path
-# from paddleocr import PaddleOCR
+from metrics import annotate, stage, registry
+from pdf_extractors import PDF_EXTRACTOR, open_extractor
+from budget import current_budget, limit_chunks, sample_evenly
 
 class ContractIngestor:
-    def __init__(self, chunk_size=500, chunk_overlap=50):
+    def __init__(self, chunk_size=500, chunk_overlap=50, extractor=None):
+        # Extraction backend, see pdf_extractors.py ("auto" picks per document)
+        self.extractor = extractor or PDF_EXTRACTOR
+        self.extractor_used = None
         
         # LangChain splitter
         self.splitter = RecursiveCharacterTextSplitter(
@@ -17,20 +21,47 @@ class ContractIngestor:
             length_function=len,
             separators=["\n\n", "\n", " ", ""]
         )
+        # Character offset where each page starts in the last extracted text,
+        # and its 1-based page number (pages may be sampled)
+        self.page_starts = []
+        self.page_numbers = []
+        # metadata source_type of the chunks produced
+        self.source_type = "contract_pdf"
 
     def extract_text_from_pdf(self, pdf_path: str) -> str:
         """
-        Extract raw text from a PDF file using pdfplumber.
+        Extract raw text from a PDF file with the configured backend
+        (see pdf_extractors.py); self.extractor_used records which one ran.
+        Under a request budget, long documents are sampled evenly down to
+        max_pages, extraction stops at the deadline, and OCR is skipped if
+        it cannot finish in time.
         """
         full_text = ""
+        self.page_starts = []
+        self.page_numbers = []
+        budget = current_budget()
+        total_pages = 0
         try:
             print(f"{pdf_path}")
-            with pdfplumber.open(pdf_path) as pdf:
-                total_pages = len(pdf.pages)
-                print(f"Found {total_pages} pages.")
+            with open_extractor(pdf_path, self.extractor) as pdf:
+                self.extractor_used = pdf.name
+                total_pages = len(pdf)
+                print(f"Found {total_pages} pages ({pdf.name} extractor).")
+                annotate(pages=total_pages, extractor=pdf.name)
+                registry.inc(f"pdf_extractor_{pdf.name}_documents")
+
+                page_indexes = range(total_pages)
+                if budget and budget.max_pages and total_pages > budget.max_pages:
+                    page_indexes = sample_evenly(total_pages, budget.max_pages)
+                    budget.skip("extraction", "max_pages", pages_total=total_pages, pages_processed=len(page_indexes))
                 
-                for i, page in enumerate(pdf.pages):
-                    text = page.extract_text()
+                for n, i in enumerate(page_indexes):
+                    if budget and budget.expired():
+                        budget.skip("extraction", "deadline", pages_total=total_pages, pages_processed=n)
+                        break
+                    text = pdf.page_text(i)
+                    self.page_starts.append(len(full_text))
+                    self.page_numbers.append(i + 1)
                     if text:
                         full_text += text + "\n"
 
@@ -44,10 +75,23 @@ class ContractIngestor:
             return full_text
         
         else:
+            # OCR is an optional extra (pdf2image + paddleocr, plus poppler)
+            try:
+                from pdf2image import convert_from_path
+                from paddleocr import PaddleOCR
+            except ImportError:
+                registry.inc("ocr_unavailable")
+                print("No text layer and OCR is not available (install pdf2image and paddleocr)")
+                return ""
+
+            ocr_pages = min(total_pages, budget.max_pages) if budget and budget.max_pages else total_pages
+            if budget and not budget.allow_ocr(ocr_pages):
+                budget.skip("extraction", "ocr_skipped", pages_total=total_pages)
+                return ""
 
             pocr = PaddleOCR(use_textline_orientation=True, lang='en')
             text = []
-            pages = convert_from_path(pdf_path, dpi=300)
+            pages = convert_from_path(pdf_path, dpi=300, last_page=ocr_pages or None)
 
             with tempfile.TemporaryDirectory() as temp_dir:
                 for i, page in enumerate(pages):
@@ -62,6 +106,9 @@ class ContractIngestor:
                     print(f"  - OCR extracted page {i+1}/{len(pages)}")
 
             full_text = " ".join(text).strip()
+            # OCR output is joined without page markers
+            self.page_starts = []
+            self.page_numbers = []
             
             return full_text
 
@@ -71,19 +118,42 @@ class ContractIngestor:
         """
         return text.strip()
 
-    def chunk_text(self, text: str) -> List[Dict[str, str]]:
+    def page_for_offset(self, offset):
+        """
+        1-based page number containing a character offset of the last
+        extracted text, or None when page boundaries are unknown.
+        """
+        if offset is None or not self.page_starts:
+            return None
+        return self.page_numbers[bisect_right(self.page_starts, offset) - 1]
+
+    def chunk_text(self, text: str, offset: int = 0) -> List[Dict[str, str]]:
         """
         Split text using LangChain RecursiveCharacterTextSplitter.
+        `offset` is the position of `text` inside the full document, so
+        start/end offsets in the metadata are document-relative.
         """
         raw_chunks = self.splitter.split_text(text)
         
         structured_chunks = []
+        search_from = 0
         for i, content in enumerate(raw_chunks):
+            # Chunks are verbatim (stripped) slices of the text, in order
+            start = text.find(content, search_from)
+            if start != -1:
+                search_from = start + 1
+                start += offset
+
             if len(content) > 20:
                 structured_chunks.append({
                     "id": f"chunk_{i}",
                     "text": content,
-                    "metadata": {"source_type": "contract_pdf"} 
+                    "metadata": {
+                        "source_type": self.source_type,
+                        "start_char": start if start != -1 else None,
+                        "end_char": start + len(content) if start != -1 else None,
+                        "page": self.page_for_offset(start if start != -1 else None),
+                    }
                 })
 
         return structured_chunks
@@ -92,17 +162,35 @@ class ContractIngestor:
         print(f"Ingestion for: {pdf_path}")
         
         # Extract
-        raw_text = self.extract_text_from_pdf(pdf_path)
+        with stage("extraction"):
+            raw_text = self.extract_text_from_pdf(pdf_path)
         if not raw_text:
             print("No text extracted. Exiting.")
             return []
 
         # Chunk
-        chunks = self.chunk_text(raw_text)
+        with stage("chunking"):
+            chunks = limit_chunks(self.chunk_text(raw_text))
         
         print(f"Created {len(chunks)} chunks.")
         return chunks
 
+    def process_text(self, text: str, source_type: str = "text") -> List[Dict[str, str]]:
+        """
+        Chunk text that is already extracted (plain text, DOCX). No PDF
+        handling, so chunks carry character offsets but no page numbers.
+        """
+        self.page_starts = []
+        self.page_numbers = []
+        self.source_type = source_type
+        text = self.clean_text(text.replace("\r\n", "\n").replace("\r", "\n"))
+        if not text:
+            return []
+
+        with stage("chunking"):
+            chunks = limit_chunks(self.chunk_text(text))
+        return chunks
+
 if __name__ == "__main__":
     # target_pdf = "C:\\Users\\Sneha Shendre\\OneDrive\\Desktop\\legality-ai\\datasets\\contract.pdf"
     target_pdf = "C:\\Users\\Sneha Shendre\\OneDrive\\Desktop\\legality-ai\\pdf_to_final\\Screenshot 2025-12-26 234217.pdf"
@@ -0,0 +1,386 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable, Optional
+
+
+class JobStatus:
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+    CANCELLED = "cancelled"
+
+
+TERMINAL_STATUSES = {JobStatus.SUCCEEDED, JobStatus.FAILED, JobStatus.CANCELLED}
+
+# Higher runs first. Small uploads are usually someone waiting on the UI, so
+# they jump ahead of bulk documents unless the caller says otherwise.
+PRIORITY_INTERACTIVE = 10
+PRIORITY_NORMAL = 5
+PRIORITY_BULK = 0
+
+
+def default_priority(num_bytes: int) -> int:
+    if num_bytes < 1 * 1024 * 1024:
+        return PRIORITY_INTERACTIVE
+    if num_bytes < 10 * 1024 * 1024:
+        return PRIORITY_NORMAL
+    return PRIORITY_BULK
+
+
+class JobCancelled(Exception):
+    """Raised from a progress report when the job has been cancelled."""
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    filename TEXT,
+    file_path TEXT,
+    params TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    progress TEXT,
+    partial_result TEXT,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    run_after REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL,
+    lease_owner TEXT,
+    lease_expires REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_claim ON jobs (status, priority DESC, created_at);
+"""
+
+JSON_COLUMNS = ("params", "progress", "partial_result", "result")
+# Columns added after the first release, created on older databases
+ADDED_COLUMNS = {"lease_owner": "TEXT", "lease_expires": "REAL"}
+
+# A RUNNING job belongs to the worker holding its lease. Workers renew their
+# leases every LEASE_SECONDS / 3; a job whose lease ran out (its process died)
+# is requeued by any live worker.
+LEASE_SECONDS = 60.0
+
+
+class JobStore:
+    """
+    Persistent job queue on top of SQLite. Every call opens its own
+    connection so the store can be shared freely between worker threads.
+    """
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in existing:
+                    conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    @staticmethod
+    def _row_to_dict(row) -> Optional[dict]:
+        if row is None:
+            return None
+        job = dict(row)
+        for column in JSON_COLUMNS:
+            if job.get(column) is not None:
+                job[column] = json.loads(job[column])
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        return job
+
+    def create(self, kind: str, filename: str = None, file_path: str = None, params: dict = None,
+               priority: int = PRIORITY_NORMAL, max_attempts: int = 3) -> str:
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, priority, filename, file_path, params, "
+                "max_attempts, created_at, run_after) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, kind, JobStatus.QUEUED, priority, filename, file_path,
+                 json.dumps(params or {}), max_attempts, now, now),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self._connect() as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._row_to_dict(row)
+
+    def claim_next(self, owner: str = None, lease_seconds: float = LEASE_SECONDS) -> Optional[dict]:
+        """
+        Atomically move the highest-priority runnable job to RUNNING, leased
+        to `owner` for `lease_seconds` (see renew_leases).
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status = ? AND run_after <= ? "
+                "ORDER BY priority DESC, created_at ASC LIMIT 1",
+                (JobStatus.QUEUED, time.time()),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            now = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, attempts = attempts + 1, started_at = ?, "
+                "lease_owner = ?, lease_expires = ? WHERE id = ?",
+                (JobStatus.RUNNING, now, owner, now + lease_seconds, row["id"]),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return self.get(row["id"])
+
+    def update_progress(self, job_id: str, progress: dict, partial_result: dict = None):
+        with self._connect() as conn:
+            if partial_result is None:
+                conn.execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(progress), job_id))
+            else:
+                conn.execute(
+                    "UPDATE jobs SET progress = ?, partial_result = ? WHERE id = ?",
+                    (json.dumps(progress), json.dumps(partial_result), job_id),
+                )
+
+    def complete(self, job_id: str, result: dict):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = NULL, finished_at = ? WHERE id = ?",
+                (JobStatus.SUCCEEDED, json.dumps(result), time.time(), job_id),
+            )
+
+    def fail(self, job_id: str, error: str, retry_delay: float = 5.0) -> str:
+        """
+        Record a failure. The job goes back to the queue (with exponential
+        backoff) until it runs out of attempts. Returns the new status.
+        """
+        job = self.get(job_id)
+        if job is None:
+            return JobStatus.FAILED
+        with self._connect() as conn:
+            if job["attempts"] < job["max_attempts"] and not job["cancel_requested"]:
+                delay = retry_delay * (2 ** (job["attempts"] - 1))
+                conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, run_after = ? WHERE id = ?",
+                    (JobStatus.QUEUED, error, time.time() + delay, job_id),
+                )
+                return JobStatus.QUEUED
+            conn.execute(
+                "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                (JobStatus.FAILED, error, time.time(), job_id),
+            )
+        return JobStatus.FAILED
+
+    def mark_cancelled(self, job_id: str):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ?",
+                (JobStatus.CANCELLED, time.time(), job_id),
+            )
+
+    def request_cancel(self, job_id: str) -> Optional[str]:
+        """
+        Cancel a queued job immediately; flag a running one so its worker
+        stops at the next progress report. Returns the resulting status.
+        """
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            status = row["status"]
+            if status == JobStatus.QUEUED:
+                conn.execute(
+                    "UPDATE jobs SET status = ?, cancel_requested = 1, finished_at = ? WHERE id = ?",
+                    (JobStatus.CANCELLED, time.time(), job_id),
+                )
+                status = JobStatus.CANCELLED
+            elif status == JobStatus.RUNNING:
+                conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ?", (job_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return status
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        with self._connect() as conn:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row["cancel_requested"])
+
+    def renew_leases(self, owner: str, job_ids, lease_seconds: float = LEASE_SECONDS):
+        """Extend `owner`'s leases on its running jobs."""
+        job_ids = list(job_ids)
+        if not job_ids:
+            return
+        with self._connect() as conn:
+            conn.execute(
+                f"UPDATE jobs SET lease_expires = ? WHERE status = ? AND lease_owner = ? "
+                f"AND id IN ({', '.join('?' * len(job_ids))})",
+                (time.time() + lease_seconds, JobStatus.RUNNING, owner, *job_ids),
+            )
+
+    def recover_interrupted(self) -> int:
+        """
+        Jobs left RUNNING by a crashed or restarted process go back to the
+        queue. Their attempt is still counted. Only expired leases count as
+        interrupted: jobs that a live worker (e.g. a sibling process under
+        serve.py --workers) is still renewing are left alone.
+        """
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, run_after = ?, lease_owner = NULL, lease_expires = NULL "
+                "WHERE status = ? AND (lease_expires IS NULL OR lease_expires < ?)",
+                (JobStatus.QUEUED, time.time(), JobStatus.RUNNING, time.time()),
+            )
+        return cursor.rowcount
+
+    def counts(self) -> dict:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+# handler(job, report) -> result dict. `report(progress, partial_result=None)`
+# persists progress and raises JobCancelled if the job was cancelled.
+JobHandler = Callable[[dict, Callable], dict]
+
+
+class WorkerPool:
+    """
+    Fixed set of worker threads pulling jobs from a JobStore. Threads share
+    the already-loaded model, so adding workers does not add model copies.
+    A heartbeat thread renews the leases of this pool's running jobs and
+    requeues jobs whose lease expired, so several processes can share one
+    queue and a crashed one's jobs are picked up by the others.
+    """
+
+    def __init__(self, store: JobStore, handlers: dict, num_workers: int = 2,
+                 poll_interval: float = 0.5, retry_delay: float = 5.0,
+                 lease_seconds: float = LEASE_SECONDS):
+        self.store = store
+        self.handlers = handlers
+        self.num_workers = num_workers
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.lease_seconds = lease_seconds
+        self.owner = None
+        self._running = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        # Identify this process at start, not at construction: serve.py forks
+        # after importing main.py
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._recover()
+        for i in range(self.num_workers):
+            thread = threading.Thread(target=self._run, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        if self.num_workers:
+            thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"Started {self.num_workers} job worker(s).")
+
+    def _recover(self):
+        recovered = self.store.recover_interrupted()
+        if recovered:
+            print(f"Requeued {recovered} interrupted job(s).")
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.lease_seconds / 3):
+            try:
+                with self._lock:
+                    running = list(self._running)
+                self.store.renew_leases(self.owner, running, self.lease_seconds)
+                self._recover()
+            except Exception as e:
+                print(f"Job lease error: {e}")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim_next(self.owner, self.lease_seconds)
+            except Exception as e:
+                print(f"Job queue error: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            self._execute(job)
+
+    def _execute(self, job: dict):
+        job_id = job["id"]
+
+        def report(progress: dict, partial_result: dict = None):
+            self.store.update_progress(job_id, progress, partial_result)
+            if self.store.is_cancel_requested(job_id):
+                raise JobCancelled(job_id)
+
+        handler = self.handlers.get(job["kind"])
+        finished = True
+        with self._lock:
+            self._running.add(job_id)
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind '{job['kind']}'")
+            report({"stage": "started", "attempt": job["attempts"]})
+            result = handler(job, report)
+            self.store.complete(job_id, result)
+        except JobCancelled:
+            self.store.mark_cancelled(job_id)
+            print(f"Job {job_id} cancelled.")
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            print(traceback.format_exc())
+            status = self.store.fail(job_id, str(e), retry_delay=self.retry_delay)
+            finished = status in TERMINAL_STATUSES
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+            if finished:
+                self._cleanup(job)
+
+    @staticmethod
+    def _cleanup(job: dict):
+        file_path = job.get("file_path")
+        if file_path and os.path.exists(file_path):
+            try:
+                os.remove(file_path)
+            except Exception as e:
+                print(f"Warning: Could not delete job file {file_path}: {e}")
@@ -0,0 +1,75 @@
+import numpy as np
+from typing import Dict, List
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+
+class LexicalPrefilter:
+    """
+    Cheap first stage in front of the transformer. Learns a TF-IDF vocabulary
+    per risk category from the gold-standard exemplars and scores each chunk
+    by its best cosine match against the category centroids. Chunks with no
+    real lexical overlap (definitions, signature blocks, boilerplate) can be
+    dropped before `encode`.
+
+    Two knobs bound how aggressive it is:
+      min_score  - chunks scoring below this are candidates for skipping
+      skip_ratio - never skip more than this fraction of a document's chunks;
+                   if more fall below min_score, the highest-scoring of them
+                   are kept
+    """
+
+    def __init__(self, exemplars: Dict[str, List[str]], min_score=0.1, skip_ratio=0.5):
+        self.min_score = min_score
+        self.skip_ratio = skip_ratio
+        self.categories = list(exemplars.keys())
+
+        corpus = [text for texts in exemplars.values() for text in texts]
+        self.vectorizer = TfidfVectorizer(
+            stop_words="english",
+            ngram_range=(1, 2),
+            sublinear_tf=True,
+            min_df=1,
+        )
+        matrix = self.vectorizer.fit_transform(corpus)
+
+        centroids = []
+        start = 0
+        for texts in exemplars.values():
+            block = matrix[start:start + len(texts)]
+            start += len(texts)
+            centroid = np.asarray(block.mean(axis=0)).ravel()
+            norm = np.linalg.norm(centroid)
+            centroids.append(centroid / norm if norm else centroid)
+        self.centroids = np.vstack(centroids)
+
+    def score(self, texts: List[str]) -> np.ndarray:
+        """Best per-category lexical similarity for each text, in [0, 1]."""
+        if not texts:
+            return np.zeros(0)
+        vectors = self.vectorizer.transform(texts)  # rows are L2-normalised
+        return np.asarray((vectors @ self.centroids.T).max(axis=1)).ravel()
+
+    def select(self, texts: List[str]) -> np.ndarray:
+        """
+        Indexes of the texts that should go on to the embedding stage,
+        in their original order.
+        """
+        if not texts:
+            return np.arange(0)
+        return self.select_scored(self.score(texts))
+
+    def select_scored(self, scores: np.ndarray) -> np.ndarray:
+        """select() for one document's already computed score() values."""
+        n = len(scores)
+        if n == 0:
+            return np.arange(0)
+
+        below = np.flatnonzero(scores < self.min_score)
+        max_skips = int(n * self.skip_ratio)
+        if len(below) > max_skips:
+            # Skip only the lowest-scoring ones up to the allowed ratio
+            below = below[np.argsort(scores[below], kind="stable")[:max_skips]]
+
+        keep = np.ones(n, dtype=bool)
+        keep[below] = False
+        return np.flatnonzero(keep)
@@ -0,0 +1,290 @@
+import json
+import os
+import time
+from typing import List, Optional, Tuple
+from dotenv import load_dotenv
+from openai import OpenAI
+
+import metrics
+from metrics import stage
+from budget import current_budget
+from tenancy import fair_share, record_usage
+
+
+FORBIDDEN_TERMS = [
+    "liability shall be limited",
+    "in no event shall",
+    "consequential damages",
+    "punitive damages",
+    "$",
+    "cap",
+    "fees paid"
+]
+
+# Load environment variables
+load_dotenv()
+
+# Point LLM_BASE_URL at mock_llm_server.py to load-test without real OpenRouter calls
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
+
+client = OpenAI(
+    base_url=LLM_BASE_URL,
+    api_key=os.getenv("OPENROUTER_API_KEY"),
+)
+
+OPENROUTER_MODEL = os.getenv("LLM_MODEL", "mistralai/mistral-7b-instruct:free")
+
+GENERATION_UNAVAILABLE = "Legal review recommended. (generation unavailable)"
+
+# Batched mode packs several clauses into one JSON request (see rewrite_clauses).
+# Off by default: it relies on the model answering with well-formed JSON.
+LLM_BATCH_REWRITES = os.getenv("LLM_BATCH_REWRITES", "0").lower() in ("1", "true", "yes")
+LLM_BATCH_MAX_ITEMS = int(os.getenv("LLM_BATCH_MAX_ITEMS", "8"))
+LLM_BATCH_PROMPT_TOKENS = int(os.getenv("LLM_BATCH_PROMPT_TOKENS", "3000"))
+LLM_BATCH_COMPLETION_TOKENS = int(os.getenv("LLM_BATCH_COMPLETION_TOKENS", "2400"))
+# A failed batch request (429, timeout, 5xx) is retried as a whole this many
+# times, waiting LLM_BATCH_RETRY_DELAY seconds and doubling each time
+LLM_BATCH_RETRIES = int(os.getenv("LLM_BATCH_RETRIES", "2"))
+LLM_BATCH_RETRY_DELAY = float(os.getenv("LLM_BATCH_RETRY_DELAY", "2"))
+
+# rewrite_clauses retries batches itself; the client's own retries would multiply the attempts
+batch_client = client.with_options(max_retries=0)
+
+REWRITE_RULES = """STRICT RULES:
+- Do NOT add new legal concepts
+- Do NOT add liability caps, damages, numbers, or exclusions
+- Do NOT remove or limit existing rights
+- Do NOT introduce new obligations
+- Preserve the original legal meaning
+- Do NOT add conversational filler (e.g., "Here is the rewrite")."""
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English legal text; no tokenizer needed
+    return len(text) // 4 + 1
+
+
+def is_safe_rewrite(original: str, rewritten: str) -> bool:
+    lower = rewritten.lower()
+    return not any(term in lower for term in FORBIDDEN_TERMS)
+
+def generate_safe_rewrite(risky_text: str, risk_type: str) -> str:
+    """
+    Uses OpenRouter to rewrite a risky clause.
+    """
+    prompt = f"""
+    You are a senior legal expert.
+    You are rewriting a contract clause for clarity ONLY.
+
+{REWRITE_RULES}
+- Output ONLY the rewritten clause text.
+
+TASK:
+Rewrite the clause below to be clearer and more balanced in wording ONLY.
+
+Clause:
+{risky_text}"""
+
+    try:
+        metrics.registry.inc("llm_calls")
+        record_usage("llm_calls")
+        with fair_share("llm"), stage("llm_rewrite"):
+            response = client.chat.completions.create(
+                model=OPENROUTER_MODEL,
+                messages=[
+                    {"role": "system", "content": "You are a helpful legal assistant."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.1,
+                max_tokens=300
+            )
+        return response.choices[0].message.content.strip()
+    except Exception as e:
+        metrics.registry.inc("llm_failures")
+        print(f"Generation Failed: {e}")
+        return GENERATION_UNAVAILABLE
+
+
+BATCH_PROMPT_HEADER = f"""
+    You are a senior legal expert.
+    You are rewriting several contract clauses for clarity ONLY.
+
+{REWRITE_RULES}
+- Rewrite each clause independently.
+
+TASK:
+Rewrite every clause in the JSON array below to be clearer and more balanced in wording ONLY.
+Respond with JSON ONLY, no markdown, in exactly this shape:
+{{"rewrites": [{{"id": <id>, "rewrite": "<rewritten clause>"}}]}}
+Include one entry per input id.
+
+Clauses (JSON):
+"""
+
+
+def _batch_payload(items: List[Tuple[str, str]]) -> List[dict]:
+    return [{"id": i, "risk_type": risk_type, "clause": text} for i, (text, risk_type) in enumerate(items)]
+
+
+def pack_rewrite_batches(items: List[Tuple[str, str]], max_items: int = None,
+                         max_prompt_tokens: int = None, max_completion_tokens: int = None) -> List[List[int]]:
+    """
+    Greedily group (clause, risk_type) items, in order, into batches that
+    fit the per-request item, prompt-token and completion-token budgets.
+    Returns lists of item indexes; an item too large for any batch ends up
+    alone.
+    """
+    max_items = max_items or LLM_BATCH_MAX_ITEMS
+    max_prompt_tokens = max_prompt_tokens or LLM_BATCH_PROMPT_TOKENS
+    max_completion_tokens = max_completion_tokens or LLM_BATCH_COMPLETION_TOKENS
+    header_tokens = estimate_tokens(BATCH_PROMPT_HEADER)
+
+    batches = []
+    current, prompt_tokens, completion_tokens = [], header_tokens, 0
+    for i, item in enumerate(items):
+        item_tokens = estimate_tokens(json.dumps(_batch_payload([item])[0]))
+        # A rewrite is roughly as long as the clause, plus the JSON wrapping
+        output_tokens = estimate_tokens(item[0]) + 16
+        if current and (
+            len(current) >= max_items
+            or prompt_tokens + item_tokens > max_prompt_tokens
+            or completion_tokens + output_tokens > max_completion_tokens
+        ):
+            batches.append(current)
+            current, prompt_tokens, completion_tokens = [], header_tokens, 0
+        current.append(i)
+        prompt_tokens += item_tokens
+        completion_tokens += output_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _parse_batch_response(content: str, count: int) -> List[Optional[str]]:
+    """Per-item rewrites from a batch reply; None where an item is missing or malformed."""
+    rewrites = [None] * count
+    text = content.strip()
+    # Tolerate a markdown fence or stray text around the JSON object
+    start, end = text.find("{"), text.rfind("}")
+    if start == -1 or end <= start:
+        return rewrites
+    try:
+        data = json.loads(text[start:end + 1])
+    except json.JSONDecodeError:
+        return rewrites
+
+    entries = data.get("rewrites") if isinstance(data, dict) else None
+    if not isinstance(entries, list):
+        return rewrites
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        index, rewrite = entry.get("id"), entry.get("rewrite")
+        if isinstance(index, str) and index.isdigit():
+            index = int(index)
+        if isinstance(index, int) and 0 <= index < count and isinstance(rewrite, str) and rewrite.strip():
+            rewrites[index] = rewrite.strip()
+    return rewrites
+
+
+def generate_safe_rewrites_batch(items: List[Tuple[str, str]]) -> Optional[List[Optional[str]]]:
+    """
+    Rewrite several (clause, risk_type) items with one chat completion.
+    Returns one entry per item, None for items the model did not answer,
+    so callers can retry just those. Returns None (not a list) when the
+    request itself failed.
+    """
+    prompt = BATCH_PROMPT_HEADER + json.dumps(_batch_payload(items), ensure_ascii=False)
+    max_tokens = min(
+        LLM_BATCH_COMPLETION_TOKENS,
+        sum(estimate_tokens(text) + 16 for text, _ in items) + 32,
+    )
+
+    try:
+        metrics.registry.inc("llm_calls")
+        metrics.registry.inc("llm_batch_calls")
+        record_usage("llm_calls")
+        with fair_share("llm"), stage("llm_rewrite_batch"):
+            response = batch_client.chat.completions.create(
+                model=OPENROUTER_MODEL,
+                messages=[
+                    {"role": "system", "content": "You are a helpful legal assistant."},
+                    {"role": "user", "content": prompt}
+                ],
+                temperature=0.1,
+                max_tokens=max_tokens
+            )
+        return _parse_batch_response(response.choices[0].message.content or "", len(items))
+    except Exception as e:
+        metrics.registry.inc("llm_failures")
+        print(f"Batch Generation Failed: {e}")
+        return None
+
+
+def rewrite_clauses(items: List[Tuple[str, str]], validate=None) -> List[str]:
+    """
+    Rewrite many (clause, risk_type) items. In batched mode they are packed
+    into token-budgeted JSON requests; each answer is checked on its own
+    with `validate`, and only missing or rejected items are re-issued one
+    by one through generate_safe_rewrite. A batch whose request failed is
+    retried whole with backoff instead (one call per retry, not one per
+    item); if it keeps failing its items get GENERATION_UNAVAILABLE, like
+    a failed single rewrite. Returns one rewrite per item
+    (validation of the single retries is left to the caller), or None for
+    items not attempted because the request budget ran out of LLM calls
+    or time.
+    """
+    if not items:
+        return []
+
+    budget = current_budget()
+
+    def allowed():
+        return budget is None or budget.allow_llm_call()
+
+    if not LLM_BATCH_REWRITES or len(items) == 1:
+        return [
+            generate_safe_rewrite(risky_text=text, risk_type=risk_type) if allowed() else None
+            for text, risk_type in items
+        ]
+
+    results = [None] * len(items)
+    singles = []
+    for batch in pack_rewrite_batches(items):
+        if len(batch) == 1:
+            singles.extend(batch)
+            continue
+        if not allowed():
+            break
+        answers = generate_safe_rewrites_batch([items[i] for i in batch])
+        delay = LLM_BATCH_RETRY_DELAY
+        for _ in range(LLM_BATCH_RETRIES):
+            if answers is not None:
+                break
+            remaining = budget.remaining_seconds() if budget else None
+            if remaining is not None and remaining <= delay:
+                break
+            time.sleep(delay)
+            delay *= 2
+            if not allowed():
+                break
+            metrics.registry.inc("llm_batch_request_retries")
+            answers = generate_safe_rewrites_batch([items[i] for i in batch])
+        if answers is None:
+            for i in batch:
+                results[i] = GENERATION_UNAVAILABLE
+            continue
+        for i, answer in zip(batch, answers):
+            if answer is not None and (validate is None or validate(answer)):
+                results[i] = answer
+                metrics.registry.inc("llm_batch_items")
+            else:
+                singles.append(i)
+                metrics.registry.inc("llm_batch_retries")
+
+    for i in sorted(singles):
+        if not allowed():
+            break
+        text, risk_type = items[i]
+        results[i] = generate_safe_rewrite(risky_text=text, risk_type=risk_type)
+    return results
@@ -0,0 +1,156 @@
+"""
+Concurrent load test for a running backend.
+
+    python mock_llm_server.py --latency 1.5 --latency-dist lognormal --latency-std 0.8 --rpm 20
+    LLM_BASE_URL=http://127.0.0.1:8089/api/v1 OPENROUTER_API_KEY=mock uvicorn main:app --port 8000
+    python load_test.py --url http://127.0.0.1:8000 --pages 20 --concurrency 1 2 4 8 16
+
+Each concurrency level keeps N uploads in flight for --duration seconds and
+reports throughput, latency percentiles and error counts. The saturation
+point is the first level whose throughput gain over the previous level
+drops below --saturation-gain.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+import numpy as np
+
+from synthetic_pdf import generate_contract_pdf
+
+
+DATASET_PATH = "dataset/synthetic_gold_standard_with_nli.json"
+
+
+def run_level(url, payload, filename, concurrency, duration, timeout, api_key=None):
+    latencies = []
+    statuses = {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker():
+        headers = {"X-API-Key": api_key} if api_key else {}
+        with httpx.Client(timeout=timeout, headers=headers) as client:
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = client.post(
+                        f"{url}/analyze-contract",
+                        files={"file": (filename, payload, "application/pdf")},
+                    )
+                    status = str(response.status_code)
+                except httpx.HTTPError as e:
+                    status = type(e).__name__
+                elapsed = time.perf_counter() - start
+                with lock:
+                    statuses[status] = statuses.get(status, 0) + 1
+                    if status == "200":
+                        latencies.append(elapsed)
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - started
+
+    total = sum(statuses.values())
+    ok = statuses.get("200", 0)
+    result = {
+        "concurrency": concurrency,
+        "wall_seconds": round(wall, 3),
+        "requests": total,
+        "succeeded": ok,
+        "error_rate": round(1 - ok / total, 4) if total else None,
+        "throughput_rps": round(ok / wall, 4) if wall else None,
+        "statuses": statuses,
+    }
+    if latencies:
+        arr = np.array(latencies)
+        result["latency_seconds"] = {
+            "p50": round(float(np.percentile(arr, 50)), 4),
+            "p95": round(float(np.percentile(arr, 95)), 4),
+            "p99": round(float(np.percentile(arr, 99)), 4),
+            "max": round(float(arr.max()), 4),
+        }
+    return result
+
+
+def find_saturation(levels, min_gain):
+    """
+    Return the concurrency at which adding workers stopped buying throughput.
+    """
+    if not levels:
+        return None, None
+    for previous, current in zip(levels, levels[1:]):
+        before = previous["throughput_rps"] or 0
+        after = current["throughput_rps"] or 0
+        if before and (after - before) / before < min_gain:
+            return previous["concurrency"], before
+    return levels[-1]["concurrency"], levels[-1]["throughput_rps"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test /analyze-contract with concurrent uploads")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--pdf", help="PDF to upload (default: generate a synthetic contract)")
+    parser.add_argument("--pages", type=int, default=10, help="Pages in the synthetic contract")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds per concurrency level")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--saturation-gain", type=float, default=0.05,
+                        help="Minimum relative throughput gain to keep scaling")
+    parser.add_argument("--dataset", default=DATASET_PATH)
+    parser.add_argument("--api-key", help="Send as X-API-Key (the server rate-limits per tenant; 429s are counted)")
+    parser.add_argument("--output", help="Write results as JSON")
+    args = parser.parse_args()
+
+    url = args.url.rstrip("/")
+    try:
+        httpx.get(f"{url}/readyz", timeout=10).raise_for_status()
+    except httpx.HTTPError as e:
+        print(f"[ERROR] Backend not reachable or not ready at {url}: {e}")
+        return 1
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pdf_path = args.pdf
+        if not pdf_path:
+            pdf_path = os.path.join(tmp_dir, f"load_test_{args.pages}p.pdf")
+            generate_contract_pdf(pdf_path, args.pages, args.dataset)
+        with open(pdf_path, "rb") as f:
+            payload = f.read()
+
+    levels = []
+    for concurrency in args.concurrency:
+        print(f"Concurrency {concurrency:>3} for {args.duration:.0f}s ...", end="", flush=True)
+        result = run_level(url, payload, os.path.basename(pdf_path), concurrency, args.duration, args.timeout,
+                           args.api_key)
+        levels.append(result)
+        p95 = result.get("latency_seconds", {}).get("p95")
+        p95_text = f"{p95:.2f}s" if p95 is not None else "n/a"
+        print(f" {result['throughput_rps']} req/s, p95={p95_text}, statuses={result['statuses']}")
+
+    saturation_concurrency, saturation_rps = find_saturation(levels, args.saturation_gain)
+    print(f"\nSaturation throughput: {saturation_rps} req/s at concurrency {saturation_concurrency}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({
+                "url": url,
+                "pdf_bytes": len(payload),
+                "duration_per_level": args.duration,
+                "levels": levels,
+                "saturation": {"concurrency": saturation_concurrency, "throughput_rps": saturation_rps},
+            }, f, indent=4)
+        print(f"Results saved to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,45 +1,74 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, UploadFile, File, HTTPException, BackgroundTasks, Request
+from fastapi.responses import PlainTextResponse, FileResponse, JSONResponse
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+from typing import List, Optional
+from pydantic import BaseModel
 import tempfile
+import zipfile
+import io
+import json
 import os
 from dotenv import load_dotenv
-# from langfuse import Langfuse
 import traceback
-from openai import OpenAI 
-
-from ip_mod_api import ContractIngestor
-from vector_search import RiskDetector
-from clause_policy import decide_clause_action, ClauseAction, validate_rewrite_output
-
+import uuid
+import threading
+import time
+import math
+from contextlib import nullcontext
+
+from analysis import (
+    analyze_batch, analyze_chunks, analyze_revision, compact_result, ingest_docx, ingest_pdf, ingest_text,
+    prepare_chunks, read_docx, DETECTION_THRESHOLD
+)
+from analysis_store import AnalysisStore
+from clause_index import ClauseIndex
+from job_queue import JobStore, WorkerPool, JobStatus, TERMINAL_STATUSES, default_priority
+import metrics
+from metrics import annotate, stage, track_request
+from profiling import profiling_requested, profile_request, is_admin, profile_artifact
+from budget import limit_chunks, request_budget
+from fast_json import json_response
+from gold_store import GoldStore
+from tenancy import (
+    ANONYMOUS_TENANT, Tenant, TenantRegistry, api_key_from_headers, fair_share, record_usage, schedulers, tenant_context
+)
 
-FORBIDDEN_TERMS = [
-    "liability shall be limited",
-    "in no event shall",
-    "consequential damages",
-    "punitive damages",
-    "$",
-    "cap",
-    "fees paid"
-]
 
 # Load environment variables
 load_dotenv()
 
+# Langfuse is an optional exporter (LANGFUSE_ENABLED=1). Request breakdowns are
+# shipped to it from a background task, never from inside the request.
 
-# try:
-#     langfuse = Langfuse()
-# except Exception as e:
-#     print(f"Warning: Langfuse client failed to initialize: {e}")
-# langfuse = None
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.db")
+JOBS_DIR = os.getenv("JOBS_DIR", "job_uploads")
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+# A running job whose worker process stops renewing it for this long is requeued
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
 
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", "500"))
+MAX_BATCH_UNCOMPRESSED_MB = int(os.getenv("MAX_BATCH_UNCOMPRESSED_MB", "1024"))
+BATCH_EXTRACT_WORKERS = int(os.getenv("BATCH_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
 
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=os.getenv("OPENROUTER_API_KEY"),
-)
+# Finished analyses are kept so revised versions can be re-analysed incrementally
+ANALYSIS_STORE_ENABLED = os.getenv("ANALYSIS_STORE_ENABLED", "1").lower() in ("1", "true", "yes")
+ANALYSIS_DB_PATH = os.getenv("ANALYSIS_DB_PATH", "analyses.db")
 
-OPENROUTER_MODEL = "mistralai/mistral-7b-instruct:free" 
+# Portfolio-wide clause search index fed by every analysis
+CLAUSE_INDEX_ENABLED = os.getenv("CLAUSE_INDEX_ENABLED", "1").lower() in ("1", "true", "yes")
+CLAUSE_INDEX_DIR = os.getenv("CLAUSE_INDEX_DIR", "clause_index")
+MAX_SEARCH_RESULTS = int(os.getenv("MAX_SEARCH_RESULTS", "100"))
+
+# ?format= values accepted by the analysis endpoints
+RESPONSE_FORMATS = ("full", "compact")
+
+# Single-document uploads (/analyze-contract, /jobs)
+UPLOAD_EXTENSIONS = (".pdf", ".docx")
+# Largest /analyze-text body
+MAX_TEXT_BYTES = int(os.getenv("MAX_TEXT_MB", "20")) * 1024 * 1024
 
 # Initialize FastAPI app
 app = FastAPI(
@@ -55,62 +84,130 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-print("--- INITIALIZING AI MODEL (This may take a minute) ---")
 detector = None
 DATASET_PATH = "dataset/synthetic_gold_standard_with_nli.json" 
+# Columnar store built with `python gold_store.py build`; preferred when present
+GOLD_STORE_PATH = os.getenv("GOLD_STORE_PATH", "dataset/gold_standard.gold")
+if GoldStore.is_store(GOLD_STORE_PATH):
+    DATASET_PATH = GOLD_STORE_PATH
 
-try:
-    if os.path.exists(DATASET_PATH):
-        detector = RiskDetector(DATASET_PATH)
-        print("RiskDetector Model initialized successfully.")
-    else:
-        print(f"CRITICAL ERROR: Dataset not found at {DATASET_PATH}")
-except Exception as e:
-    print(f"CRITICAL ERROR: Failed to load RiskDetector: {e}")
-    traceback.print_exc()
-
+# The model loads in a background thread started at startup, so the app
+# answers /livez (and reports "loading" on /readyz) within moments of boot.
+# status: pending -> loading -> ready | failed
+model_state = {"status": "pending", "error": None, "started_at": None, "ready_at": None}
+_model_lock = threading.Lock()
+STARTED_AT = time.time()
 
-def is_safe_rewrite(original: str, rewritten: str) -> bool:
-    lower = rewritten.lower()
-    return not any(term in lower for term in FORBIDDEN_TERMS)
 
-def generate_safe_rewrite(risky_text: str, risk_type: str) -> str:
+def load_detector():
     """
-    Uses OpenRouter to rewrite a risky clause.
+    Load the RiskDetector if it is not loaded yet (blocking). serve.py calls
+    this before forking so workers share the weights; the startup hook
+    calls it from a background thread otherwise.
     """
-    prompt = f"""
-    You are a senior legal expert.
-    You are rewriting a contract clause for clarity ONLY.
-
-STRICT RULES:
-- Do NOT add new legal concepts
-- Do NOT add liability caps, damages, numbers, or exclusions
-- Do NOT remove or limit existing rights
-- Do NOT introduce new obligations
-- Preserve the original legal meaning
-- Do NOT add conversational filler (e.g., "Here is the rewrite").
-- Output ONLY the rewritten clause text.
-
-TASK:
-Rewrite the clause below to be clearer and more balanced in wording ONLY.
-
-Clause:
-{risky_text}"""
-    
-    try:
-        response = client.chat.completions.create(
-            model=OPENROUTER_MODEL,
-            messages=[
-                {"role": "system", "content": "You are a helpful legal assistant."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.1, 
-            max_tokens=300
+    global detector
+    with _model_lock:
+        if model_state["status"] in ("ready", "failed"):
+            return detector
+        model_state.update(status="loading", started_at=time.time())
+        print("--- INITIALIZING AI MODEL (This may take a minute) ---")
+        try:
+            if not os.path.exists(DATASET_PATH):
+                raise FileNotFoundError(f"Dataset not found at {DATASET_PATH}")
+            from vector_search import RiskDetector
+
+            detector = RiskDetector(DATASET_PATH)
+            model_state.update(status="ready", ready_at=time.time())
+            print(f"RiskDetector Model initialized successfully "
+                  f"({model_state['ready_at'] - model_state['started_at']:.1f}s).")
+        except Exception as e:
+            model_state.update(status="failed", error=str(e))
+            print(f"CRITICAL ERROR: Failed to load RiskDetector: {e}")
+            traceback.print_exc()
+        return detector
+
+
+def require_detector():
+    """The loaded detector, or 503 (still loading, retry) / 500 (failed to load)."""
+    if detector is not None:
+        return detector
+    if model_state["status"] == "failed":
+        raise HTTPException(
+            status_code=500,
+            detail="AI Model is not loaded. Please check server logs."
         )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        print(f"Generation Failed: {e}")
-        return "Legal review recommended. (generation unavailable)"
+    raise HTTPException(
+        status_code=503,
+        detail="AI Model is still loading. Retry shortly.",
+        headers={"Retry-After": "5"},
+    )
+
+
+tenant_registry = TenantRegistry()
+
+
+def request_tenant(request: Request) -> Tenant:
+    """The caller's tenant, from its API key; 401 for an unknown key (or a missing one when keys are required)."""
+    tenant = tenant_registry.resolve(api_key_from_headers(request.headers))
+    if tenant is None:
+        raise HTTPException(status_code=401, detail="Missing or unknown API key",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return tenant
+
+
+def charge_tenant(tenant: Tenant, cost: int = 1):
+    """Take `cost` tokens (documents) from the tenant's rate limit, or answer 429 with Retry-After."""
+    retry_after = tenant.take(cost)
+    if retry_after:
+        metrics.registry.inc("rate_limited_requests")
+        metrics.registry.record_usage(tenant.name, "rate_limited")
+        raise HTTPException(
+            status_code=429,
+            detail=f"Rate limit exceeded for tenant '{tenant.name}'",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    metrics.registry.record_usage(tenant.name, "requests")
+
+
+analysis_store = AnalysisStore(ANALYSIS_DB_PATH) if ANALYSIS_STORE_ENABLED else None
+clause_index = ClauseIndex(CLAUSE_INDEX_DIR) if CLAUSE_INDEX_ENABLED else None
+
+
+def persist_analysis(tenant: Tenant, filename: str, chunks: list, result: dict,
+                     embeddings: Optional[dict] = None, previous: Optional[dict] = None,
+                     previous_analysis_id: Optional[str] = None):
+    """
+    Keep a finished analysis on behalf of `tenant`: store it for incremental
+    re-analysis (sets result["analysis_id"]) and add its clauses to the
+    search index. An indexing failure is logged, not raised; the analysis
+    itself succeeded.
+    """
+    if analysis_store is not None:
+        with stage("store"):
+            result["analysis_id"] = analysis_store.save(
+                filename,
+                [c["text"] for c in chunks],
+                jsonable_encoder(result),
+                threshold=previous["threshold"] if previous else DETECTION_THRESHOLD,
+                parent_id=previous_analysis_id,
+                tenant=tenant.name,
+            )
+
+    if clause_index is not None and embeddings is not None:
+        try:
+            clause_index.add_contract(
+                result.get("analysis_id") or uuid.uuid4().hex,
+                filename,
+                chunks,
+                result["risks"],
+                embeddings,
+                parent_id=previous_analysis_id,
+                tenant=tenant.name,
+            )
+        except Exception as e:
+            metrics.registry.inc("index_errors")
+            print(f"Error indexing {filename}: {str(e)}")
+
 
 @app.get("/")
 async def root():
@@ -122,137 +219,192 @@ async def root():
         "model_loaded": detector is not None
     }
 
-@app.post("/analyze-contract")
-async def analyze_contract(file: UploadFile = File(...)):
+def check_response_format(response_format: str):
+    if response_format not in RESPONSE_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown format '{response_format}'; expected one of {', '.join(RESPONSE_FORMATS)}"
+        )
+
+
+def load_previous(tenant: Tenant, previous_analysis_id: Optional[str]) -> Optional[dict]:
     """
-    Upload a contract PDF and get detected legal risks.
+    The stored analysis a revision is compared against (None without an id);
+    404 if it is unknown or another tenant's.
     """
-    if detector is None:
-        raise HTTPException(
-            status_code=500,
-            detail="AI Model is not loaded. Please check server logs."
+    if not previous_analysis_id:
+        return None
+    if analysis_store is None:
+        raise HTTPException(status_code=400, detail="Incremental analysis is disabled on this server")
+    previous = analysis_store.get(previous_analysis_id, tenant=tenant.name)
+    if previous is None:
+        raise HTTPException(status_code=404, detail="Previous analysis not found")
+    return previous
+
+
+def analyze_document(tenant: Tenant, filename: str, response_format: str, profiler, timings,
+                     pdf_path: Optional[str] = None, docx: Optional[bytes] = None, text: Optional[str] = None,
+                     chunks: Optional[list] = None, previous: Optional[dict] = None,
+                     previous_analysis_id: Optional[str] = None):
+    """
+    One document through the pipeline, shared by /analyze-contract and
+    /analyze-text; blocking, so it runs in the threadpool. The document is
+    given as exactly one of: a PDF on disk, DOCX bytes, extracted text, or
+    caller-made chunks (already through prepare_chunks, used as-is).
+    Returns (result, profile).
+    """
+    with profiler as profile:
+        embeddings = {} if clause_index is not None else None
+        with request_budget() as budget:
+            source_type = "contract_pdf"
+            try:
+                if docx is not None:
+                    text, source_type = read_docx(docx), "contract_docx"
+                elif text is not None:
+                    source_type = "text"
+                elif chunks is not None:
+                    chunks = limit_chunks(chunks)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+
+            if previous is not None:
+                result, chunks = analyze_revision(
+                    detector, pdf_path, filename, previous, embeddings=embeddings,
+                    raw_text=text, source_type=source_type,
+                )
+                result["previous_analysis_id"] = previous_analysis_id
+            else:
+                if text is not None:
+                    chunks = ingest_text(text, source_type)
+                elif chunks is None:
+                    chunks = ingest_pdf(pdf_path)
+                result = analyze_chunks(detector, filename, chunks, embeddings=embeddings)
+        result["skipped"] = budget.skipped
+        annotate(chunks=len(chunks), tenant=tenant.name, source_type=source_type)
+        record_usage("documents")
+        record_usage("chunks", len(chunks))
+
+        if chunks:
+            persist_analysis(tenant, filename, chunks, result, embeddings, previous, previous_analysis_id)
+
+        if response_format == "compact":
+            result = compact_result(result, chunks)
+
+        if profile is not None:
+            profile["timings"] = timings.as_dict()
+    return result, profile
+
+
+def document_response(request: Request, background_tasks: BackgroundTasks, endpoint: str, filename: str,
+                      result: dict, profile: Optional[dict], timings, debug: bool):
+    """Attach profile/timings to an analysis result, schedule the Langfuse export and encode it."""
+    if profile is not None:
+        result["profile"] = {
+            "profile_id": profile["profile_id"],
+            "samples": profile["samples"],
+            "artifacts": [os.path.basename(path) for path in profile["artifacts"]],
+        }
+
+    if debug:
+        result["timings"] = timings.as_dict()
+
+    if metrics.langfuse_enabled():
+        background_tasks.add_task(
+            metrics.export_to_langfuse,
+            endpoint,
+            timings,
+            {"filename": filename, "num_chunks": result["num_chunks"]},
         )
 
-    if not file.filename.lower().endswith('.pdf'):
+    return json_response(result, request.headers.get("accept-encoding", ""))
+
+
+def analysis_failed(e: Exception):
+    metrics.registry.inc("analysis_errors")
+    print(f"Error analyzing contract: {str(e)}")
+    print(traceback.format_exc())
+
+    raise HTTPException(
+        status_code=500,
+        detail=f"Error analyzing contract: {str(e)}"
+    )
+
+
+@app.post("/analyze-contract")
+async def analyze_contract(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    debug: bool = False,
+    previous_analysis_id: Optional[str] = None,
+    format: str = "full",
+):
+    """
+    Upload a contract (PDF or DOCX) and get detected legal risks.
+    DOCX text is read straight from the document XML, in memory: no temp
+    file, PDF extraction or layout pass.
+    Pass ?debug=true to include the per-stage timing breakdown.
+    Pass ?previous_analysis_id=<id> when uploading a revision of an already
+    analysed contract: only changed clauses are re-analysed and the response
+    carries a `delta` of risks added and removed.
+    Pass ?format=compact for the offset-based response: chunks listed once
+    with page/character offsets and risks referencing them by id.
+    Send the server's PROFILE_TOKEN as an X-Profile-Token header (or
+    ?profile=<token>) to run this request under the sampling profiler; the
+    response then carries a `profile` entry naming the saved artifacts.
+    The caller's API key (X-API-Key) selects its tenant's rate limit and
+    fair share of the encoder and LLM.
+    """
+    check_response_format(format)
+
+    require_detector()
+    tenant = request_tenant(request)
+
+    is_docx = file.filename.lower().endswith(".docx")
+    if not file.filename.lower().endswith(UPLOAD_EXTENSIONS):
         raise HTTPException(
             status_code=400,
-            detail="Only PDF files are supported"
+            detail="Only PDF and DOCX files are supported"
         )
+    charge_tenant(tenant)
+
+    previous = load_previous(tenant, previous_analysis_id)
 
     pdf_path = None
+    profiler = profile_request("analyze_contract") if profiling_requested(request) else nullcontext()
     
     try:
-        # Create a trace for this contract analysis
-        trace_span = None
-        # if langfuse:
-        #     trace_span = langfuse.trace(
-        #         name="analyze_contract",
-        #         input={"filename": file.filename}
-        #     )
-            
-        try:
-            # Save uploaded PDF temporarily
-            with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+        with track_request("analyze_contract") as timings, tenant_context(tenant):
+            with stage("upload"):
                 contents = await file.read()
                 if not contents:
                     raise HTTPException(status_code=400, detail="Uploaded file is empty")
-                tmp.write(contents)
-                pdf_path = tmp.name
-
-            ingestion_span = None
-            # if langfuse:
-            #     ingestion_span = trace_span.span(name="ingestion")
-            
-            ingestor = ContractIngestor(chunk_size=600, chunk_overlap=150)
-            chunks = ingestor.process_contract(pdf_path)
-            
-            if ingestion_span:
-                ingestion_span.update(output={"num_chunks": len(chunks)})
-                ingestion_span.end()
-
-            if not chunks:
-                result = {
-                    "filename": file.filename,
-                    "num_chunks": 0,
-                    "num_risks": 0,
-                    "risks": [],
-                    "message": "No text could be extracted from the PDF."
-                }
-                # if trace_span:
-                #     trace_span.update(output=result)
-                #     trace_span.end()
-                return JSONResponse(status_code=200, content=result)
-
-            detection_span = None
-            # if langfuse:
-            #     detection_span = trace_span.span(name="risk_detection")
-                
-            risks = detector.detect_risks(chunks, threshold=0.75)
-            
-            if detection_span:
-                detection_span.update(output={"num_risks": len(risks)})
-                detection_span.end()
-
-            for risk in risks:
-                action = decide_clause_action(
-                    risk_category=risk["risk_category"],
-                    clause_text=risk["chunk_text"]
-                )
-
-                risk["action"] = action
-
-                if action == ClauseAction.REWRITE:
-                    rewritten = generate_safe_rewrite(
-                        risky_text=risk["chunk_text"],
-                        risk_type=risk["risk_category"]
-                    )
-
-                    if not rewritten or not validate_rewrite_output(rewritten):
-                        risk["suggested_clause"] = (
-                            "Legal review recommended due to potential legal modification."
-                        )
-                    else:
-                        risk["suggested_clause"] = rewritten
-
-                else:
-                    risk["suggested_clause"] = (
-                        "Legal review recommended. This clause affects liability, "
-                        "damages, or remedies and should not be rewritten automatically."
-                    )
-
-            response = {
-                "filename": file.filename,
-                "num_chunks": len(chunks),
-                "num_risks": len(risks),
-                "risks": risks,
-                "status": "success"
-            }
-            
-            if trace_span:
-                trace_span.update(output=response)
-                trace_span.end()
-            
-            return response
-            
-        except Exception as inner_e:
-            if trace_span:
-                 trace_span.update(level="ERROR", status_message=str(inner_e))
-                 trace_span.end()
-            raise inner_e
-
+                if not is_docx:
+                    # Save uploaded PDF temporarily
+                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp:
+                        tmp.write(contents)
+                        pdf_path = tmp.name
+
+            # Off the event loop: the request may wait for a CPU/LLM slot
+            # behind other tenants, and the server keeps answering meanwhile
+            result, profile = await run_in_threadpool(
+                analyze_document, tenant, file.filename, format, profiler, timings,
+                pdf_path=pdf_path, docx=contents if is_docx else None,
+                previous=previous, previous_analysis_id=previous_analysis_id,
+            )
+
+        return document_response(request, background_tasks, "analyze_contract", file.filename,
+                                 result, profile, timings, debug)
+
+    except HTTPException:
+        raise
     except FileNotFoundError as e:
         raise HTTPException(
             status_code=500,
             detail=f"Required file not found: {str(e)}"
         )
     except Exception as e:
-        print(f"Error analyzing contract: {str(e)}")
-        print(traceback.format_exc())
-        
-        raise HTTPException(
-            status_code=500,
-            detail=f"Error analyzing contract: {str(e)}"
-        )
+        analysis_failed(e)
     
     finally:
         # Cleanup temp file
@@ -261,46 +413,518 @@ async def analyze_contract(file: UploadFile = File(...)):
                 os.remove(pdf_path)
             except Exception as e:
                 print(f"Warning: Could not delete temporary file {pdf_path}: {e}")
-        
-        # if langfuse:
-        #     langfuse.flush()
+
+
+class TextChunk(BaseModel):
+    text: str
+    id: Optional[str] = None
+    page: Optional[int] = None
+    start_char: Optional[int] = None
+    end_char: Optional[int] = None
+
+
+class TextAnalysisRequest(BaseModel):
+    text: Optional[str] = None
+    chunks: Optional[List[TextChunk]] = None
+    filename: str = "document.txt"
+    previous_analysis_id: Optional[str] = None
+
+
+@app.post("/analyze-text")
+async def analyze_text(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    debug: bool = False,
+    filename: Optional[str] = None,
+    previous_analysis_id: Optional[str] = None,
+    format: str = "full",
+):
+    """
+    Analyse contract text that is already extracted, e.g. from a document
+    management system: no upload, temp file or PDF processing.
+    The body is either plain text (Content-Type: text/plain, with
+    ?filename= and ?previous_analysis_id= as query parameters) or JSON:
+    {"text": "..."} to be chunked like an upload, or
+    {"chunks": [{"text", "id"?, "page"?, "start_char"?, "end_char"?}]}
+    to be analysed as given, plus optional "filename" and
+    "previous_analysis_id" (text only; pre-chunked input has no revision
+    alignment). debug, format, profiling and tenancy work as for
+    /analyze-contract.
+    """
+    check_response_format(format)
+
+    require_detector()
+    tenant = request_tenant(request)
+
+    body = await request.body()
+    if len(body) > MAX_TEXT_BYTES:
+        raise HTTPException(status_code=413, detail=f"Text exceeds {MAX_TEXT_BYTES} bytes")
+    if request.headers.get("content-type", "").startswith("application/json"):
+        try:
+            data = json.loads(body)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid request body: {e}")
+        if not isinstance(data, dict):
+            raise HTTPException(status_code=400, detail="Body must be a JSON object")
+        try:
+            payload = TextAnalysisRequest(**data)
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=f"Invalid request body: {e}")
+    else:
+        try:
+            payload = TextAnalysisRequest(text=body.decode("utf-8"))
+        except UnicodeDecodeError:
+            raise HTTPException(status_code=400, detail="Text body must be UTF-8")
+    filename = filename or payload.filename
+    previous_analysis_id = previous_analysis_id or payload.previous_analysis_id
+
+    if (payload.text is None) == (payload.chunks is None):
+        raise HTTPException(status_code=400, detail="Send exactly one of 'text' or 'chunks'")
+    if payload.chunks is not None and previous_analysis_id:
+        raise HTTPException(status_code=400, detail="previous_analysis_id requires 'text', not 'chunks'")
+    if not (payload.text or "").strip() and not any(c.text.strip() for c in payload.chunks or []):
+        raise HTTPException(status_code=400, detail="No text to analyse")
+    chunks = None
+    if payload.chunks is not None:
+        # Validate before charging the tenant; the chunk limit is applied under the request budget
+        try:
+            chunks = prepare_chunks([dict(c) for c in payload.chunks])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    charge_tenant(tenant)
+
+    previous = load_previous(tenant, previous_analysis_id)
+    profiler = profile_request("analyze_text") if profiling_requested(request) else nullcontext()
+
+    try:
+        with track_request("analyze_text") as timings, tenant_context(tenant):
+            result, profile = await run_in_threadpool(
+                analyze_document, tenant, filename, format, profiler, timings,
+                text=payload.text, chunks=chunks,
+                previous=previous, previous_analysis_id=previous_analysis_id,
+            )
+
+        return document_response(request, background_tasks, "analyze_text", filename,
+                                 result, profile, timings, debug)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        analysis_failed(e)
+
+
+def unpack_batch_upload(filename: str, contents: bytes, target_dir: str, documents: list):
+    """
+    Write one uploaded file (a PDF, or a ZIP of PDFs) into target_dir and
+    append (filename, path) pairs to documents.
+    """
+    lower = filename.lower()
+    if lower.endswith('.pdf'):
+        path = os.path.join(target_dir, f"{len(documents)}.pdf")
+        with open(path, "wb") as f:
+            f.write(contents)
+        documents.append((filename, path))
+        return
+
+    if not lower.endswith('.zip'):
+        raise HTTPException(status_code=400, detail=f"Unsupported file type: {filename}")
+
+    try:
+        archive = zipfile.ZipFile(io.BytesIO(contents))
+    except zipfile.BadZipFile:
+        raise HTTPException(status_code=400, detail=f"Invalid ZIP archive: {filename}")
+
+    members = [
+        info for info in archive.infolist()
+        if not info.is_dir()
+        and info.filename.lower().endswith('.pdf')
+        and not info.filename.startswith('__MACOSX/')
+    ]
+    uncompressed = sum(info.file_size for info in members)
+    if uncompressed > MAX_BATCH_UNCOMPRESSED_MB * 1024 * 1024:
+        raise HTTPException(status_code=413, detail=f"ZIP archive {filename} is too large when extracted")
+
+    for info in members:
+        if len(documents) >= MAX_BATCH_FILES:
+            raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_FILES} documents")
+        # Never trust archive paths; files are stored under an index-based name
+        path = os.path.join(target_dir, f"{len(documents)}.pdf")
+        with archive.open(info) as src, open(path, "wb") as dst:
+            dst.write(src.read())
+        documents.append((os.path.basename(info.filename), path))
+
+
+@app.post("/analyze-batch")
+async def analyze_contract_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    debug: bool = False,
+    format: str = "full",
+):
+    """
+    Analyze many contracts in one request. Accepts several PDFs and/or ZIP
+    archives of PDFs; returns one result per document, in upload order.
+    ?format=compact returns every document in the offset-based form.
+    Each document counts against the tenant's rate limit.
+    """
+    check_response_format(format)
+
+    require_detector()
+    tenant = request_tenant(request)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        with track_request("analyze_batch") as timings:
+            documents = []
+            with stage("upload"):
+                for upload in files:
+                    contents = await upload.read()
+                    if not contents:
+                        raise HTTPException(status_code=400, detail=f"Uploaded file is empty: {upload.filename}")
+                    unpack_batch_upload(upload.filename, contents, tmp_dir, documents)
+                    if len(documents) > MAX_BATCH_FILES:
+                        raise HTTPException(status_code=413, detail=f"Batch exceeds {MAX_BATCH_FILES} documents")
+
+            if not documents:
+                raise HTTPException(status_code=400, detail="No PDF documents found in upload")
+            charge_tenant(tenant, len(documents))
+            annotate(documents=len(documents), tenant=tenant.name)
+
+            def on_result(index, chunks, result, embeddings):
+                record_usage("chunks", len(chunks))
+                persist_analysis(tenant, documents[index][0], chunks, result, embeddings)
+
+            try:
+                with tenant_context(tenant), request_budget(kind="batch") as budget:
+                    record_usage("documents", len(documents))
+                    results = await run_in_threadpool(
+                        analyze_batch, detector, documents, BATCH_EXTRACT_WORKERS, format == "compact", on_result
+                    )
+            except Exception as e:
+                metrics.registry.inc("analysis_errors")
+                print(f"Error analyzing batch: {str(e)}")
+                print(traceback.format_exc())
+                raise HTTPException(
+                    status_code=500,
+                    detail=f"Error analyzing batch: {str(e)}"
+                )
+
+    response = {
+        "num_documents": len(results),
+        "num_risks": sum(r.get("num_risks", 0) for r in results),
+        "documents": results,
+        "skipped": budget.skipped,
+        "status": "success"
+    }
+    if debug:
+        response["timings"] = timings.as_dict()
+    return json_response(response, request.headers.get("accept-encoding", ""))
+
+
+job_store = JobStore(JOBS_DB_PATH)
+
+
+def run_analysis_job(job: dict, report) -> dict:
+    """
+    Worker-side handler for queued PDF/DOCX analyses. Partial results are
+    published as soon as detection finishes, before any LLM rewrites.
+    """
+    partial = {}
+
+    def progress(event: str, data: dict):
+        if event == "risks_detected":
+            partial.update({
+                "filename": job["filename"],
+                "num_chunks": data["num_chunks"],
+                "num_risks": len(data["risks"]),
+                "risks": data["risks"],
+            })
+            report({"stage": event, "num_chunks": data["num_chunks"]}, partial_result=partial)
+        elif event == "clause_reviewed":
+            report({"stage": event, "done": data["done"], "total": data["total"]}, partial_result=partial)
+        else:
+            report({"stage": event, **data})
+
+    tenant = tenant_registry.named((job["params"] or {}).get("tenant"))
+    with track_request("job_analyze_contract"), tenant_context(tenant), request_budget(kind="job") as budget:
+        if job["file_path"].lower().endswith(".docx"):
+            with open(job["file_path"], "rb") as f:
+                chunks = ingest_docx(f.read())
+        else:
+            chunks = ingest_pdf(job["file_path"])
+        annotate(chunks=len(chunks), tenant=tenant.name)
+        record_usage("documents")
+        record_usage("chunks", len(chunks))
+        progress("ingested", {"num_chunks": len(chunks)})
+
+        embeddings = {} if clause_index is not None else None
+        result = analyze_chunks(detector, job["filename"], chunks, progress=progress, embeddings=embeddings)
+        result["skipped"] = budget.skipped
+        if chunks:
+            persist_analysis(tenant, job["filename"], chunks, result, embeddings)
+        return result
+
+
+worker_pool = WorkerPool(
+    job_store,
+    handlers={"analyze_contract": run_analysis_job},
+    num_workers=JOB_WORKERS,
+    lease_seconds=JOB_LEASE_SECONDS,
+)
+
+
+def load_model_and_start_workers():
+    if load_detector() is not None:
+        worker_pool.start()
+
+
+@app.on_event("startup")
+async def start_model_and_job_workers():
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    metrics.init_langfuse()
+    if detector is not None:
+        # Preloaded (serve.py loads the model before forking workers)
+        worker_pool.start()
+    else:
+        threading.Thread(target=load_model_and_start_workers, name="model-loader", daemon=True).start()
+
+
+def job_response(job: dict) -> dict:
+    response = {
+        "job_id": job["id"],
+        "status": job["status"],
+        "filename": job["filename"],
+        "priority": job["priority"],
+        "attempts": job["attempts"],
+        "max_attempts": job["max_attempts"],
+        "progress": job["progress"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"],
+    }
+    if job["status"] == JobStatus.SUCCEEDED:
+        response["result"] = job["result"]
+    elif job["partial_result"] is not None:
+        response["partial_result"] = job["partial_result"]
+    if job["error"]:
+        response["error"] = job["error"]
+    if job["cancel_requested"] and job["status"] == JobStatus.RUNNING:
+        response["status"] = "cancelling"
+    return response
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: Request, file: UploadFile = File(...), priority: int = None):
+    """
+    Queue a contract (PDF or DOCX) for background analysis and return its job ID.
+    Small uploads get a higher priority than bulk documents by default.
+    The job runs with the submitting tenant's fair share.
+    """
+    if model_state["status"] == "failed":
+        # Jobs may be queued while the model is still loading
+        require_detector()
+    tenant = request_tenant(request)
+
+    if not file.filename.lower().endswith(UPLOAD_EXTENSIONS):
+        raise HTTPException(
+            status_code=400,
+            detail="Only PDF and DOCX files are supported"
+        )
+    charge_tenant(tenant)
+
+    contents = await file.read()
+    if not contents:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+
+    os.makedirs(JOBS_DIR, exist_ok=True)
+    suffix = os.path.splitext(file.filename)[1].lower()
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix, dir=JOBS_DIR) as tmp:
+        tmp.write(contents)
+        upload_path = tmp.name
+
+    if priority is None:
+        priority = default_priority(len(contents))
+
+    job_id = job_store.create(
+        kind="analyze_contract",
+        filename=file.filename,
+        file_path=upload_path,
+        params={"tenant": tenant.name},
+        priority=priority,
+        max_attempts=JOB_MAX_ATTEMPTS,
+    )
+    return {"job_id": job_id, "status": JobStatus.QUEUED, "priority": priority}
+
+
+def tenant_job(request: Request, job_id: str) -> dict:
+    """The job, if the caller's tenant submitted it; 404 otherwise (other tenants' jobs are not revealed)."""
+    tenant = request_tenant(request)
+    job = job_store.get(job_id)
+    # Jobs queued before tenants were recorded belong to the anonymous tenant
+    if job is None or ((job["params"] or {}).get("tenant") or ANONYMOUS_TENANT) != tenant.name:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, request: Request):
+    """Status plus partial or final results of a background analysis"""
+    return job_response(tenant_job(request, job_id))
+
+
+@app.delete("/jobs/{job_id}")
+async def cancel_job(job_id: str, request: Request):
+    """Cancel a queued job, or ask a running one to stop"""
+    job = tenant_job(request, job_id)
+    if job["status"] in TERMINAL_STATUSES:
+        raise HTTPException(status_code=409, detail=f"Job already {job['status']}")
+
+    job_store.request_cancel(job_id)
+    return job_response(job_store.get(job_id))
+
+
+class SearchRequest(BaseModel):
+    text: str
+    top_k: int = 10
+    categories: Optional[List[str]] = None
+    min_risk_score: Optional[float] = None
+    contract_ids: Optional[List[str]] = None
+    filename: Optional[str] = None
+    include_superseded: bool = False
+    unique_contracts: bool = False
+
+
+def run_search(tenant: Tenant, query: SearchRequest) -> list:
+    """Encode the query in the tenant's CPU share and search only its contracts."""
+    with fair_share("cpu"), stage("encode"):
+        vector = detector.model.encode([query.text])[0]
+    return clause_index.search(
+        vector,
+        top_k=min(query.top_k, MAX_SEARCH_RESULTS),
+        categories=query.categories,
+        min_risk_score=query.min_risk_score,
+        contract_ids=query.contract_ids,
+        filename=query.filename,
+        include_superseded=query.include_superseded,
+        unique_contracts=query.unique_contracts,
+        tenant=tenant.name,
+    )
+
+
+@app.post("/search")
+async def search_clauses(query: SearchRequest, request: Request, debug: bool = False):
+    """
+    Find clauses across the tenant's analysed contracts that are similar
+    to `text`, optionally restricted to risk categories (with a minimum risk
+    score), specific contracts or a filename. Set unique_contracts to get
+    the best-matching clause per contract.
+    """
+    require_detector()
+    if clause_index is None:
+        raise HTTPException(status_code=400, detail="Clause search index is disabled on this server")
+    if not query.text.strip():
+        raise HTTPException(status_code=400, detail="Search text is empty")
+    tenant = request_tenant(request)
+    charge_tenant(tenant)
+
+    with track_request("search") as timings, tenant_context(tenant):
+        results = await run_in_threadpool(run_search, tenant, query)
+
+    response = {
+        "query": query.text,
+        "num_results": len(results),
+        "results": results,
+    }
+    if debug:
+        response["timings"] = timings.as_dict()
+    return response
+
+
+@app.get("/livez")
+async def liveness():
+    """The process is up and serving; never depends on the model"""
+    return {"status": "alive", "uptime_seconds": round(time.time() - STARTED_AT, 1)}
+
+
+@app.get("/readyz")
+async def readiness():
+    """200 once the model is loaded and requests can be analysed, 503 before (or if loading failed)"""
+    body = {
+        "status": model_state["status"],
+        "model_load_seconds": round(model_state["ready_at"] - model_state["started_at"], 2)
+        if model_state["ready_at"] else None,
+    }
+    if model_state["error"]:
+        body["error"] = model_state["error"]
+    return JSONResponse(body, status_code=200 if detector is not None else 503)
+
 
 @app.get("/health")
 async def health_check():
     """Check if all required files and dependencies are available"""
     dataset_exists = os.path.exists(DATASET_PATH)
     
-    
-    # langfuse_ok = False
-    # if langfuse:
-    #     try:
-    #         langfuse.auth_check()
-    #         langfuse_ok = True
-    #     except Exception as e:
-    #         print(f"Langfuse auth check failed: {e}")
-    
     return {
         "status": "healthy",
-        # "langfuse_connected": langfuse_ok,
+        "langfuse_enabled": metrics.langfuse_enabled(),
         "dataset_exists": dataset_exists,
         "dataset_path": DATASET_PATH,
-        "model_initialized": detector is not None
+        "model_initialized": detector is not None,
+        "model_status": model_state["status"],
+        "jobs": job_store.counts(),
+        "clause_index": clause_index.counts() if clause_index is not None else None
     }
 
 
-# @app.on_event("shutdown")
-# async def shutdown_event():
-    # if langfuse:
-    #     langfuse.flush()
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Pipeline metrics in Prometheus text format"""
+    return PlainTextResponse(
+        metrics.registry.render_prometheus(),
+        media_type="text/plain; version=0.0.4"
+    )
 
 
-if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="127.0.0.1", port=8000)
+@app.get("/usage")
+async def tenant_usage(request: Request):
+    """
+    Usage counters of the caller's tenant. With the admin X-Profile-Token:
+    every tenant's counters plus the CPU/LLM scheduler queues.
+    """
+    if is_admin(request.headers.get("x-profile-token")):
+        return {
+            "tenants": metrics.registry.usage_snapshot(),
+            "schedulers": {name: scheduler.snapshot() for name, scheduler in schedulers.items()},
+        }
+    tenant = request_tenant(request)
+    return {"tenant": tenant.name, "usage": metrics.registry.usage_snapshot(tenant.name).get(tenant.name, {})}
 
 
+@app.get("/debug/slow-requests")
+async def slow_requests(request: Request):
+    """The slowest requests since startup with their stage breakdown, slowest first; requires the X-Profile-Token header"""
+    if not is_admin(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=403, detail="Profiling is disabled or the token is wrong")
+    return {"requests": metrics.slow_requests.snapshot()}
 
 
+@app.get("/debug/profiles/{filename}")
+async def download_profile(filename: str, request: Request):
+    """Download a profile artifact; requires the X-Profile-Token header"""
+    if not is_admin(request.headers.get("x-profile-token")):
+        raise HTTPException(status_code=403, detail="Profiling is disabled or the token is wrong")
+    artifact = profile_artifact(filename)
+    if artifact is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    path, media_type = artifact
+    return FileResponse(path, media_type=media_type, filename=filename)
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    worker_pool.stop()
+    metrics.flush_langfuse()
 
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="127.0.0.1", port=8000)
@@ -0,0 +1,383 @@
+import heapq
+import os
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+# Upper bounds (seconds) for the latency histograms. Covers everything from a
+# cached lookup up to a slow LLM call on a large contract.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+METRIC_PREFIX = "legality"
+
+# How many of the slowest requests SlowRequestLog keeps (0 disables it)
+SLOW_REQUESTS_KEPT = int(os.getenv("SLOW_REQUESTS_KEPT", "20"))
+
+
+class Histogram:
+    """
+    Cumulative histogram in the Prometheus sense: one counter per bucket
+    plus a running sum and count.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * len(self.buckets)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.total += value
+        self.count += 1
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        running = 0
+        out = []
+        for bound, c in zip(self.buckets, self.counts):
+            running += c
+            out.append((bound, running))
+        return out
+
+
+class MetricsRegistry:
+    """
+    Process-wide store for pipeline timings and counters.
+
+    Everything lives in plain dicts behind a single lock, so recording a
+    sample costs a few dictionary operations and nothing leaves the process
+    until /metrics is scraped.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self._lock = threading.Lock()
+        self._buckets = buckets
+        self.stage_histograms: Dict[str, Histogram] = {}
+        self.request_histograms: Dict[str, Histogram] = {}
+        self.counters: Dict[str, float] = {}
+        self.cache_hits: Dict[str, int] = {}
+        self.cache_misses: Dict[str, int] = {}
+        self.in_flight: Dict[str, int] = {}
+        # tenant -> usage counter name -> value (see tenancy.py)
+        self.tenant_usage: Dict[str, Dict[str, float]] = {}
+
+    def observe_stage(self, stage_name: str, seconds: float):
+        with self._lock:
+            hist = self.stage_histograms.get(stage_name)
+            if hist is None:
+                hist = self.stage_histograms[stage_name] = Histogram(self._buckets)
+            hist.observe(seconds)
+
+    def observe_request(self, endpoint: str, seconds: float):
+        with self._lock:
+            hist = self.request_histograms.get(endpoint)
+            if hist is None:
+                hist = self.request_histograms[endpoint] = Histogram(self._buckets)
+            hist.observe(seconds)
+
+    def inc(self, name: str, value: float = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def record_usage(self, tenant: str, name: str, value: float = 1):
+        with self._lock:
+            usage = self.tenant_usage.setdefault(tenant, {})
+            usage[name] = usage.get(name, 0) + value
+
+    def usage_snapshot(self, tenant: Optional[str] = None) -> Dict[str, Dict[str, float]]:
+        """Usage counters per tenant (only `tenant`'s when given)."""
+        with self._lock:
+            return {
+                name: {key: round(value, 3) for key, value in usage.items()}
+                for name, usage in self.tenant_usage.items()
+                if tenant is None or name == tenant
+            }
+
+    def record_cache(self, cache_name: str, hit: bool):
+        with self._lock:
+            target = self.cache_hits if hit else self.cache_misses
+            target[cache_name] = target.get(cache_name, 0) + 1
+
+    def cache_hit_rate(self, cache_name: str) -> Optional[float]:
+        hits = self.cache_hits.get(cache_name, 0)
+        total = hits + self.cache_misses.get(cache_name, 0)
+        if total == 0:
+            return None
+        return hits / total
+
+    def request_started(self, endpoint: str):
+        with self._lock:
+            self.in_flight[endpoint] = self.in_flight.get(endpoint, 0) + 1
+
+    def request_finished(self, endpoint: str):
+        with self._lock:
+            self.in_flight[endpoint] = max(0, self.in_flight.get(endpoint, 0) - 1)
+
+    def render_prometheus(self) -> str:
+        """
+        Render every metric in the Prometheus text exposition format (0.0.4).
+        """
+        lines = []
+        with self._lock:
+            self._render_histograms(
+                lines, f"{METRIC_PREFIX}_stage_duration_seconds",
+                "Time spent in each pipeline stage.", "stage", self.stage_histograms
+            )
+            self._render_histograms(
+                lines, f"{METRIC_PREFIX}_request_duration_seconds",
+                "End-to-end request latency.", "endpoint", self.request_histograms
+            )
+
+            name = f"{METRIC_PREFIX}_requests_in_flight"
+            lines.append(f"# HELP {name} Requests currently being processed.")
+            lines.append(f"# TYPE {name} gauge")
+            for endpoint, value in sorted(self.in_flight.items()):
+                lines.append(f'{name}{{endpoint="{_escape_label(endpoint)}"}} {value}')
+
+            for label, store in (("hits", self.cache_hits), ("misses", self.cache_misses)):
+                name = f"{METRIC_PREFIX}_cache_{label}_total"
+                lines.append(f"# HELP {name} Cache {label} by cache name.")
+                lines.append(f"# TYPE {name} counter")
+                for cache_name, value in sorted(store.items()):
+                    lines.append(f'{name}{{cache="{_escape_label(cache_name)}"}} {value}')
+
+            name = f"{METRIC_PREFIX}_cache_hit_ratio"
+            lines.append(f"# HELP {name} Fraction of cache lookups that were hits.")
+            lines.append(f"# TYPE {name} gauge")
+            for cache_name in sorted(set(self.cache_hits) | set(self.cache_misses)):
+                lines.append(f'{name}{{cache="{_escape_label(cache_name)}"}} {self.cache_hit_rate(cache_name):.6f}')
+
+            for counter_name, value in sorted(self.counters.items()):
+                name = f"{METRIC_PREFIX}_{counter_name}_total"
+                lines.append(f"# HELP {name} Total {counter_name.replace('_', ' ')}.")
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {_format_value(value)}")
+
+            usage_names = sorted({key for usage in self.tenant_usage.values() for key in usage})
+            for usage_name in usage_names:
+                name = f"{METRIC_PREFIX}_tenant_{usage_name}_total"
+                lines.append(f"# HELP {name} Total {usage_name.replace('_', ' ')} by tenant.")
+                lines.append(f"# TYPE {name} counter")
+                for tenant, usage in sorted(self.tenant_usage.items()):
+                    if usage_name in usage:
+                        lines.append(f'{name}{{tenant="{_escape_label(tenant)}"}} {_format_value(usage[usage_name])}')
+
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _render_histograms(lines, name, help_text, label, histograms):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} histogram")
+        for key, hist in sorted(histograms.items()):
+            key = _escape_label(key)
+            for bound, value in hist.cumulative():
+                lines.append(f'{name}_bucket{{{label}="{key}",le="{_format_value(bound)}"}} {value}')
+            lines.append(f'{name}_bucket{{{label}="{key}",le="+Inf"}} {hist.count}')
+            lines.append(f'{name}_sum{{{label}="{key}"}} {hist.total:.6f}')
+            lines.append(f'{name}_count{{{label}="{key}"}} {hist.count}')
+
+
+def _escape_label(value) -> str:
+    # Label values escape backslash, double quote and line feed in the text format
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value) -> str:
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+registry = MetricsRegistry()
+
+
+class RequestTimings:
+    """
+    Per-request stage breakdown. Stages that run more than once within a
+    request (e.g. one LLM call per clause) are accumulated.
+    """
+
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages: Dict[str, float] = {}
+        self.calls: Dict[str, int] = {}
+        self.details: Dict = {}
+        self.total = None
+
+    def add(self, stage_name: str, seconds: float):
+        self.stages[stage_name] = self.stages.get(stage_name, 0.0) + seconds
+        self.calls[stage_name] = self.calls.get(stage_name, 0) + 1
+
+    def finish(self):
+        self.total = time.perf_counter() - self.started
+        return self.total
+
+    def as_dict(self) -> dict:
+        total = self.total if self.total is not None else time.perf_counter() - self.started
+        return {
+            "total_seconds": round(total, 6),
+            "stages": {
+                name: {"seconds": round(seconds, 6), "calls": self.calls[name]}
+                for name, seconds in self.stages.items()
+            },
+        }
+
+
+class SlowRequestLog:
+    """
+    The N slowest requests since startup, with their stage breakdown and
+    whatever the pipeline attached via annotate() (pages, chunks). A request
+    that is not among the slowest costs one comparison under the lock.
+    """
+
+    def __init__(self, size: int = SLOW_REQUESTS_KEPT):
+        self.size = size
+        self._heap = []
+        self._counter = 0
+        self._lock = threading.Lock()
+
+    def record(self, timings: "RequestTimings"):
+        if self.size <= 0:
+            return
+        with self._lock:
+            if len(self._heap) >= self.size and timings.total <= self._heap[0][0]:
+                return
+            self._counter += 1
+            entry = {"endpoint": timings.endpoint, "finished_at": time.time(), **timings.details, **timings.as_dict()}
+            item = (timings.total, self._counter, entry)
+            if len(self._heap) < self.size:
+                heapq.heappush(self._heap, item)
+            else:
+                heapq.heapreplace(self._heap, item)
+
+    def snapshot(self):
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._heap, reverse=True)]
+
+
+slow_requests = SlowRequestLog()
+
+
+_current_timings: contextvars.ContextVar = contextvars.ContextVar("request_timings", default=None)
+
+
+def current_timings() -> Optional[RequestTimings]:
+    return _current_timings.get()
+
+
+@contextmanager
+def track_request(endpoint: str):
+    """
+    Wrap a whole request: maintains the in-flight gauge, records end-to-end
+    latency and makes a RequestTimings available to stage() calls below it.
+    """
+    timings = RequestTimings(endpoint)
+    token = _current_timings.set(timings)
+    registry.request_started(endpoint)
+    try:
+        yield timings
+    finally:
+        registry.request_finished(endpoint)
+        registry.observe_request(endpoint, timings.finish())
+        slow_requests.record(timings)
+        _current_timings.reset(token)
+
+
+def annotate(**details):
+    """Attach request facts (page count, chunk count...) to the current request, if any."""
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.details.update(details)
+
+
+def record_stage(stage_name: str, seconds: float):
+    """Record time already measured as a stage, like stage() does for a block."""
+    registry.observe_stage(stage_name, seconds)
+    timings = _current_timings.get()
+    if timings is not None:
+        timings.add(stage_name, seconds)
+
+
+@contextmanager
+def stage(stage_name: str):
+    """
+    Time a block of pipeline work. Always feeds the global histogram and,
+    when called inside track_request(), the per-request breakdown as well.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage_name, time.perf_counter() - start)
+
+
+# ---------------------------------------------------------------------------
+# Optional Langfuse exporter
+# ---------------------------------------------------------------------------
+
+_langfuse_client = None
+_langfuse_checked = False
+
+
+def init_langfuse():
+    """
+    Import and create the Langfuse client when LANGFUSE_ENABLED is set.
+    Called once from app startup so no request pays for the import; later
+    calls are no-ops.
+    """
+    global _langfuse_client, _langfuse_checked
+    if _langfuse_checked:
+        return _langfuse_client
+    _langfuse_checked = True
+
+    if os.getenv("LANGFUSE_ENABLED", "").lower() not in ("1", "true", "yes"):
+        return None
+    try:
+        from langfuse import get_client
+        _langfuse_client = get_client()
+    except Exception as e:
+        print(f"Warning: Langfuse client failed to initialize: {e}")
+        _langfuse_client = None
+    return _langfuse_client
+
+
+def langfuse_enabled() -> bool:
+    # Never initialises: before init_langfuse() the exporter is simply off
+    return _langfuse_client is not None
+
+
+def export_to_langfuse(name: str, timings: RequestTimings, metadata: Optional[dict] = None):
+    """
+    Ship a finished request's breakdown to Langfuse. Meant to be scheduled as
+    a background task after the response has been sent; failures are logged
+    and swallowed.
+    """
+    langfuse = _langfuse_client
+    if langfuse is None:
+        return
+    try:
+        with langfuse.start_as_current_observation(
+            as_type="span",
+            name=name,
+            input=metadata or {},
+        ) as span:
+            span.update(output=timings.as_dict())
+        langfuse.flush()
+    except Exception as e:
+        print(f"Warning: Langfuse export failed: {e}")
+
+
+def flush_langfuse():
+    langfuse = _langfuse_client
+    if langfuse is not None:
+        try:
+            langfuse.flush()
+        except Exception as e:
+            print(f"Warning: Langfuse flush failed: {e}")
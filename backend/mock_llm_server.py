@@ -0,0 +1,288 @@
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+LATENCY_DISTRIBUTIONS = ("fixed", "uniform", "normal", "lognormal", "exponential")
+
+
+class LatencyModel:
+    """
+    Draws a per-request delay (seconds) from one of LATENCY_DISTRIBUTIONS.
+    `mean` and `std` are in seconds for every distribution; lognormal is
+    parameterised so that its mean/std match the requested values.
+    """
+
+    def __init__(self, distribution="fixed", mean=0.0, std=0.0, maximum=None, seed=None):
+        if distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution: {distribution}")
+        self.distribution = distribution
+        self.mean = mean
+        self.std = std
+        self.maximum = maximum
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample(self) -> float:
+        if self.mean <= 0:
+            return 0.0
+        with self._lock:
+            if self.distribution == "fixed":
+                value = self.mean
+            elif self.distribution == "uniform":
+                value = self._rng.uniform(max(0.0, self.mean - self.std), self.mean + self.std)
+            elif self.distribution == "normal":
+                value = self._rng.gauss(self.mean, self.std)
+            elif self.distribution == "exponential":
+                value = self._rng.expovariate(1.0 / self.mean)
+            else:
+                variance = self.std ** 2
+                sigma2 = math.log(1 + variance / (self.mean ** 2))
+                mu = math.log(self.mean) - sigma2 / 2
+                value = self._rng.lognormvariate(mu, sigma2 ** 0.5)
+
+        value = max(0.0, value)
+        if self.maximum is not None:
+            value = min(value, self.maximum)
+        return value
+
+
+class TokenBucket:
+    """
+    Requests-per-minute limiter in the style of OpenRouter's free tier.
+    A rate of 0 disables limiting.
+    """
+
+    def __init__(self, requests_per_minute=0, burst=None):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = float(burst or max(1, requests_per_minute))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """Returns (allowed, retry_after_seconds)."""
+        if self.rate <= 0:
+            return True, 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True, 0.0
+            return False, (1 - self.tokens) / self.rate
+
+
+def _rewrite_from_prompt(prompt: str) -> str:
+    """
+    Echo back the clause the caller asked us to rewrite. Prompts built by
+    generate_safe_rewrite end with "Clause:\\n<text>".
+    """
+    marker = "Clause:"
+    if marker in prompt:
+        return prompt.rsplit(marker, 1)[1].strip()
+    return prompt.strip()[-300:]
+
+
+def _batch_rewrite_from_prompt(prompt: str) -> str:
+    """
+    Answer for batched rewrite prompts (llm_rewrite.generate_safe_rewrites_batch):
+    echo every clause back under its id.
+    """
+    try:
+        items = json.loads(prompt.rsplit("Clauses (JSON):", 1)[1])
+    except (ValueError, IndexError):
+        items = []
+    return json.dumps({"rewrites": [{"id": item.get("id"), "rewrite": item.get("clause", "")} for item in items]})
+
+
+def _json_answer_from_prompt(prompt: str) -> str:
+    """
+    Answer for synthesize_data.py prompts, which ask for
+    {"safe_clause": ..., "explanation": ...}.
+    """
+    clause = ""
+    if 'RISKY CLAUSE: "' in prompt:
+        clause = prompt.split('RISKY CLAUSE: "', 1)[1].split('"\n', 1)[0]
+    return json.dumps({
+        "safe_clause": f"Subject to thirty (30) days' mutual written notice, {clause}".strip(),
+        "explanation": "Mock response generated by mock_llm_server.",
+    })
+
+
+class MockChatHandler(BaseHTTPRequestHandler):
+    server_version = "MockOpenRouter/0.2"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, payload: dict, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        path = self.path.rstrip("/")
+        if path.endswith("/models"):
+            self._send_json(200, {"object": "list", "data": [{"id": "mock-model", "object": "model"}]})
+        elif path.endswith("/stats"):
+            self._send_json(200, self.server.snapshot_stats())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except json.JSONDecodeError:
+            self._send_json(400, {"error": {"message": "invalid JSON body"}})
+            return
+
+        server = self.server
+        server.count("requests")
+
+        allowed, retry_after = server.limiter.try_acquire()
+        if not allowed:
+            server.count("rate_limited")
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit exceeded", "code": 429}},
+                headers={"Retry-After": f"{retry_after:.2f}"},
+            )
+            return
+
+        time.sleep(server.latency.sample())
+
+        if server.error_rate and server.rng_random() < server.error_rate:
+            server.count("errors")
+            self._send_json(server.error_status, {"error": {"message": "Injected failure", "code": server.error_status}})
+            return
+
+        messages = request.get("messages", [])
+        prompt = messages[-1].get("content", "") if messages else ""
+        if "RETURN JSON ONLY" in prompt:
+            content = _json_answer_from_prompt(prompt)
+        elif "Clauses (JSON):" in prompt:
+            content = _batch_rewrite_from_prompt(prompt)
+        else:
+            content = _rewrite_from_prompt(prompt)
+
+        server.count("completions")
+        server.count("prompt_tokens", len(prompt) // 4)
+        server.count("completion_tokens", len(content) // 4)
+        self._send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "mock-model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": len(prompt) // 4,
+                "completion_tokens": len(content) // 4,
+                "total_tokens": (len(prompt) + len(content)) // 4,
+            },
+        })
+
+
+class MockLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency=None, error_rate=0.0, error_status=500,
+                 requests_per_minute=0, burst=None, seed=None, verbose=False):
+        super().__init__(address, MockChatHandler)
+        if latency is None or isinstance(latency, (int, float)):
+            latency = LatencyModel("fixed", mean=float(latency or 0.0))
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.limiter = TokenBucket(requests_per_minute, burst)
+        self.verbose = verbose
+        self._rng = random.Random(seed)
+        self._stats = {"requests": 0, "completions": 0, "errors": 0, "rate_limited": 0,
+                       "prompt_tokens": 0, "completion_tokens": 0}
+        self._lock = threading.Lock()
+
+    def rng_random(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def count(self, key: str, amount: int = 1):
+        with self._lock:
+            self._stats[key] += amount
+
+    def snapshot_stats(self) -> dict:
+        with self._lock:
+            return dict(self._stats)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api/v1"
+
+
+def start_mock_server(host="127.0.0.1", port=0, **kwargs) -> MockLLMServer:
+    """
+    Start the mock server on a daemon thread and return it. Port 0 picks a
+    free port; read it back from `server.base_url`.
+    """
+    server = MockLLMServer((host, port), **kwargs)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenRouter chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency-dist", choices=LATENCY_DISTRIBUTIONS, default="fixed")
+    parser.add_argument("--latency", type=float, default=0.0, help="Mean delay per completion, in seconds")
+    parser.add_argument("--latency-std", type=float, default=0.0, help="Spread for uniform/normal/lognormal")
+    parser.add_argument("--latency-max", type=float, default=None, help="Clamp sampled delays to this value")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of completions that fail")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before 429s (0 = unlimited)")
+    parser.add_argument("--burst", type=int, default=None, help="Token bucket size (default: rpm)")
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    latency = LatencyModel(args.latency_dist, mean=args.latency, std=args.latency_std,
+                           maximum=args.latency_max, seed=args.seed)
+    server = MockLLMServer(
+        (args.host, args.port),
+        latency=latency,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        requests_per_minute=args.rpm,
+        burst=args.burst,
+        seed=args.seed,
+        verbose=args.verbose,
+    )
+    print(f"Mock LLM server listening at {server.base_url}")
+    print("Start the backend with: LLM_BASE_URL=" + server.base_url + " uvicorn main:app")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
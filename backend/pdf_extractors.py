@@ -0,0 +1,197 @@
+"""
+PDF text-extraction backends used by ContractIngestor.
+
+    pdfplumber  pdfplumber's extract_text(): character-level layout analysis
+                in pure Python; the slowest
+    fast        PDFium (pypdfium2) raw text; several times faster, no
+                table or column handling
+    layout      pdfplumber plus table and two-column detection: tables are
+                read row by row (cells joined with " | "), columns one
+                after the other instead of line by line across the page
+    auto        per document: probe a few pages and use layout if any has
+                a table or a second column, otherwise fast
+
+PDF_EXTRACTOR selects the backend (default auto). pypdfium2 is installed
+with pdfplumber; without it, fast falls back to pdfplumber.
+"""
+import os
+from typing import List, Optional
+
+import pdfplumber
+
+from budget import sample_evenly
+
+try:
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+
+PDF_EXTRACTOR = os.getenv("PDF_EXTRACTOR", "auto")
+# Pages the auto mode inspects for tables/columns
+PDF_PROBE_PAGES = int(os.getenv("PDF_PROBE_PAGES", "3"))
+
+# Column detection: a vertical strip at least this wide (points), in the
+# middle of the page, that (almost) no word crosses
+GUTTER_MIN_WIDTH = 12
+GUTTER_SEARCH = (0.3, 0.7)
+# Each side of the gutter must hold at least this share of the words
+GUTTER_MIN_SIDE_SHARE = 0.2
+# Ruling lines/rectangles on a page before tables are looked for
+TABLE_MIN_RULINGS = 4
+
+
+class PdfplumberExtractor:
+    name = "pdfplumber"
+
+    def __init__(self, pdf_path: str):
+        self.pdf = pdfplumber.open(pdf_path)
+
+    def __len__(self):
+        return len(self.pdf.pages)
+
+    def page_text(self, index: int) -> str:
+        return self.pdf.pages[index].extract_text() or ""
+
+    def close(self):
+        self.pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FastExtractor:
+    name = "fast"
+
+    def __init__(self, pdf_path: str):
+        self.pdf = pypdfium2.PdfDocument(pdf_path)
+
+    def __len__(self):
+        return len(self.pdf)
+
+    def page_text(self, index: int) -> str:
+        page = self.pdf[index]
+        try:
+            textpage = page.get_textpage()
+            try:
+                text = textpage.get_text_range()
+            finally:
+                textpage.close()
+        finally:
+            page.close()
+        return text.replace("\r\n", "\n").replace("\r", "\n").replace("\x00", "")
+
+    def close(self):
+        self.pdf.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def find_column_gutter(words: List[dict], x0: float, x1: float) -> Optional[float]:
+    """
+    x position of the gap between two text columns, or None for single-column
+    text. A few words (e.g. a centred heading) may cross the gap.
+    """
+    if len(words) < 20:
+        return None
+    width = int(x1 - x0) + 1
+    coverage = [0] * width
+    for w in words:
+        for x in range(max(0, int(w["x0"] - x0)), min(width, int(w["x1"] - x0) + 1)):
+            coverage[x] += 1
+
+    tolerance = max(1, len(words) // 100)
+    best_start, best_length, start = None, 0, None
+    for x in range(int(width * GUTTER_SEARCH[0]), int(width * GUTTER_SEARCH[1]) + 1):
+        if coverage[x] <= tolerance:
+            start = x if start is None else start
+            if x - start + 1 > best_length:
+                best_start, best_length = start, x - start + 1
+        else:
+            start = None
+    if best_length < GUTTER_MIN_WIDTH:
+        return None
+
+    gutter = x0 + best_start + best_length / 2
+    left = sum(1 for w in words if w["x1"] <= gutter)
+    right = sum(1 for w in words if w["x0"] >= gutter)
+    if min(left, right) < GUTTER_MIN_SIDE_SHARE * len(words):
+        return None
+    return gutter
+
+
+def find_tables(page) -> list:
+    # Table finding is expensive; only run it on pages with ruling lines
+    if len(page.lines) + len(page.rects) < TABLE_MIN_RULINGS:
+        return []
+    return page.find_tables()
+
+
+class LayoutExtractor(PdfplumberExtractor):
+    name = "layout"
+
+    def page_text(self, index: int) -> str:
+        page = self.pdf.pages[index]
+        parts = []
+        top = page.bbox[1]
+        for table in sorted(find_tables(page), key=lambda t: t.bbox[1]):
+            if table.bbox[1] > top:
+                parts.append(self._region_text(page, top, table.bbox[1]))
+            rows = table.extract()
+            parts.append("\n".join(
+                " | ".join((cell or "").replace("\n", " ") for cell in row) for row in rows
+            ))
+            top = max(top, table.bbox[3])
+        if top < page.bbox[3]:
+            parts.append(self._region_text(page, top, page.bbox[3]))
+        return "\n".join(part for part in parts if part)
+
+    def _region_text(self, page, top: float, bottom: float) -> str:
+        x0, _, x1, _ = page.bbox
+        region = page.crop((x0, top, x1, bottom))
+        gutter = find_column_gutter(region.extract_words(), x0, x1)
+        if gutter is None:
+            return region.extract_text() or ""
+        columns = [region.crop((x0, top, gutter, bottom)), region.crop((gutter, top, x1, bottom))]
+        return "\n".join(text for text in (c.extract_text() for c in columns) if text)
+
+
+EXTRACTORS = {
+    "pdfplumber": PdfplumberExtractor,
+    "fast": FastExtractor,
+    "layout": LayoutExtractor,
+}
+
+
+def needs_layout(pdf_path: str, probe_pages: int = PDF_PROBE_PAGES) -> bool:
+    """True if any of a few evenly spread pages has a table or two columns."""
+    with pdfplumber.open(pdf_path) as pdf:
+        for i in sample_evenly(len(pdf.pages), probe_pages):
+            page = pdf.pages[i]
+            if find_tables(page):
+                return True
+            if find_column_gutter(page.extract_words(), page.bbox[0], page.bbox[2]) is not None:
+                return True
+    return False
+
+
+def choose_extractor(pdf_path: str, backend: str = PDF_EXTRACTOR) -> str:
+    if backend not in ("auto", *EXTRACTORS):
+        raise ValueError(f"Unknown PDF extractor '{backend}', expected auto or one of {', '.join(EXTRACTORS)}")
+    if backend == "auto":
+        backend = "layout" if needs_layout(pdf_path) else "fast"
+    if backend == "fast" and pypdfium2 is None:
+        backend = "pdfplumber"
+    return backend
+
+
+def open_extractor(pdf_path: str, backend: str = PDF_EXTRACTOR):
+    """An extractor for the document: len() pages, page_text(i), usable as a context manager."""
+    return EXTRACTORS[choose_extractor(pdf_path, backend)](pdf_path)
@@ -0,0 +1,183 @@
+"""
+On-demand sampling profiler for individual requests.
+
+Set PROFILE_TOKEN on the server, then send the same value in an
+`X-Profile-Token` header (or `?profile=<token>`) with /analyze-contract.
+That one request is sampled and its stacks are written to PROFILE_DIR as:
+
+    <profile_id>.folded   collapsed stacks ("a;b;c <samples>"), the input
+                          format of flamegraph.pl, inferno and speedscope
+    <profile_id>.json     top functions by self/total samples plus the
+                          request's stage breakdown
+
+Only the thread running the request is sampled; work it hands to other
+threads or processes shows up as the frame waiting on it. Without a
+PROFILE_TOKEN (the default) nothing here runs: no thread is started and a
+request only pays for one truth test.
+"""
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN", "")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_TOP_FUNCTIONS = 25
+# Only the newest this many profiles are kept in PROFILE_DIR
+PROFILE_MAX_KEPT = int(os.getenv("PROFILE_MAX_KEPT", "50"))
+
+
+def is_admin(token: Optional[str]) -> bool:
+    return bool(PROFILE_TOKEN) and bool(token) and hmac.compare_digest(token, PROFILE_TOKEN)
+
+
+def profiling_requested(request) -> bool:
+    """True when the request carries the profiling token (header or query)."""
+    if not PROFILE_TOKEN:
+        return False
+    return is_admin(request.headers.get("x-profile-token") or request.query_params.get("profile"))
+
+
+def _frame_label(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a
+    background thread. Only stacks are recorded, so the profiled code runs
+    at full speed apart from the GIL hand-offs.
+    """
+
+    def __init__(self, thread_id: Optional[int] = None, interval: float = PROFILE_INTERVAL_MS / 1000):
+        self.thread_id = thread_id if thread_id is not None else threading.get_ident()
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        labels = {}
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = _frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "\n".join(f"{';'.join(stack)} {count}" for stack, count in self.stacks.most_common())
+
+    def top_functions(self, limit: int = PROFILE_TOP_FUNCTIONS) -> List[Dict]:
+        own, total = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            own[stack[-1]] += count
+            for label in set(stack):
+                total[label] += count
+        # Hot spots first: frames where the samples landed, not their callers
+        return [
+            {"function": label, "self_samples": count, "total_samples": total[label],
+             "self_fraction": round(count / self.samples, 4)}
+            for label, count in own.most_common(limit)
+        ]
+
+
+@contextmanager
+def profile_request(name: str):
+    """
+    Sample the calling thread for the duration of the block. Yields a dict
+    that is filled with the artifact paths and summary once the block exits;
+    pass request timings in via its "timings" key to store them alongside.
+    """
+    profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{uuid.uuid4().hex[:8]}"
+    info = {"profile_id": profile_id}
+    profiler = SamplingProfiler()
+    started = time.perf_counter()
+    profiler.start()
+    try:
+        yield info
+    finally:
+        profiler.stop()
+        write_profile(profiler, info, time.perf_counter() - started)
+
+
+def write_profile(profiler: SamplingProfiler, info: Dict, seconds: float):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    base = os.path.join(PROFILE_DIR, info["profile_id"])
+    with open(base + ".folded", "w") as f:
+        f.write(profiler.folded())
+    summary = {
+        "profile_id": info["profile_id"],
+        "seconds": round(seconds, 4),
+        "samples": profiler.samples,
+        "interval_ms": profiler.interval * 1000,
+        "top_functions": profiler.top_functions(),
+        "timings": info.get("timings"),
+    }
+    with open(base + ".json", "w") as f:
+        json.dump(summary, f, indent=2)
+    info.update({"samples": profiler.samples, "artifacts": [base + ".folded", base + ".json"]})
+    print(f"Profile written to {base}.folded ({profiler.samples} samples)")
+    prune_profiles()
+
+
+def prune_profiles(keep: int = None):
+    """Delete all but the newest `keep` profiles (both artifacts of each)."""
+    keep = PROFILE_MAX_KEPT if keep is None else keep
+    try:
+        names = [name for name in os.listdir(PROFILE_DIR) if name.endswith((".folded", ".json"))]
+    except OSError:
+        return
+    by_profile = {}
+    for name in names:
+        path = os.path.join(PROFILE_DIR, name)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            continue
+        profile_id = os.path.splitext(name)[0]
+        by_profile[profile_id] = max(by_profile.get(profile_id, 0), mtime)
+    oldest_first = sorted(by_profile, key=by_profile.get)
+    for profile_id in oldest_first[:max(0, len(oldest_first) - keep)]:
+        for ext in (".folded", ".json"):
+            try:
+                os.remove(os.path.join(PROFILE_DIR, profile_id + ext))
+            except OSError:
+                pass
+
+
+def profile_artifact(filename: str) -> Optional[Tuple[str, str]]:
+    """(path, media type) of a stored artifact, or None. Rejects anything but a bare file name."""
+    if os.path.basename(filename) != filename or not filename.endswith((".folded", ".json")):
+        return None
+    path = os.path.join(PROFILE_DIR, filename)
+    if not os.path.isfile(path):
+        return None
+    return path, "application/json" if filename.endswith(".json") else "text/plain"
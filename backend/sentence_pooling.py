@@ -0,0 +1,203 @@
+"""
+Sentence-level encoding for RiskDetector (ENCODE_MODE=sentence).
+
+Chunks overlap (CHUNK_OVERLAP of every CHUNK_SIZE characters), so encoding
+chunks runs the transformer over the overlapping text twice. In sentence
+mode the document is rebuilt from the chunks' character offsets, split
+into sentences, and every distinct sentence is encoded once. A chunk's
+vector is the mean of the vectors of the sentences it overlaps, weighted
+by the number of characters it shares with each. Any other chunk or
+window layout over the same text can be pooled from the same sentence
+vectors without encoding again.
+
+Sentence scores come for free: each risk names the sentence of its chunk
+that scores highest for its category.
+"""
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from thresholds import normalise
+
+
+# Fragments shorter than this ("12.", "(a)") are joined to the next sentence
+SENTENCE_MIN_CHARS = 20
+# Longer sentences are cut at whitespace; keeps each within the encoder's window
+SENTENCE_MAX_CHARS = 400
+
+_BOUNDARY = re.compile(r"[.!?][\"')\]]*(?=\s)|\n[ \t]*\n")
+# A period after these does not end a sentence
+ABBREVIATIONS = {"e.g.", "i.e.", "etc.", "no.", "nos.", "inc.", "ltd.", "co.", "corp.", "sec.", "art.",
+                 "para.", "cl.", "vs.", "v.", "mr.", "ms.", "dr.", "u.s.", "st."}
+
+
+def _is_boundary(text: str, match) -> bool:
+    if match.group()[0] == "\n":
+        return True
+    word = text[text.rfind(" ", 0, match.start()) + 1:match.start() + 1].lstrip("(\"'").lower()
+    # Abbreviations and initials ("J. Smith")
+    return word not in ABBREVIATIONS and not (len(word) == 2 and word[0].isalpha())
+
+
+def split_sentences(text: str, min_chars: int = SENTENCE_MIN_CHARS,
+                    max_chars: int = SENTENCE_MAX_CHARS) -> List[Tuple[int, int]]:
+    """(start, end) of each sentence in `text`, surrounding whitespace excluded."""
+    cuts = [m.start() if m.group()[0] == "\n" else m.end() for m in _BOUNDARY.finditer(text) if _is_boundary(text, m)]
+    cuts.append(len(text))
+
+    spans = []
+    pending = None
+    start = 0
+    for cut in cuts:
+        s, e = start, cut
+        start = cut
+        while s < e and text[s].isspace():
+            s += 1
+        while e > s and text[e - 1].isspace():
+            e -= 1
+        if s == e:
+            continue
+        if pending is not None:
+            s = pending
+        if e - s < min_chars:
+            pending = s
+            continue
+        pending = None
+        spans.append((s, e))
+    if pending is not None:
+        if spans:
+            spans[-1] = (spans[-1][0], len(text.rstrip()))
+        else:
+            spans.append((pending, len(text.rstrip())))
+
+    bounded = []
+    for s, e in spans:
+        while e - s > max_chars:
+            cut = text.rfind(" ", s + min_chars, s + max_chars)
+            cut = cut if cut != -1 else s + max_chars
+            bounded.append((s, cut))
+            s = cut
+            while s < e and text[s].isspace():
+                s += 1
+        bounded.append((s, e))
+    return bounded
+
+
+class SentenceLayout:
+    """
+    The sentences under a list of chunks and, per chunk, which sentences it
+    overlaps by how many characters.
+
+    Chunks with document offsets (metadata start_char/end_char) are laid
+    back onto the document, so overlapping chunks share sentences; runs of
+    touching chunks are segmented as one text. A chunk without offsets is
+    segmented on its own.
+    """
+
+    def __init__(self, chunks: List[Dict]):
+        placed, loose = [], []
+        for i, chunk in enumerate(chunks):
+            metadata = chunk.get("metadata") or {}
+            start, end = metadata.get("start_char"), metadata.get("end_char")
+            if start is not None and end is not None and end - start == len(chunk["text"]):
+                placed.append((start, end, i))
+            else:
+                loose.append(i)
+
+        # Stitch overlapping/adjacent chunks into segments of document text
+        segments = []
+        for start, end, i in sorted(placed):
+            text = chunks[i]["text"]
+            if segments and start <= segments[-1][1]:
+                seg_start, seg_end, parts = segments[-1]
+                if end > seg_end:
+                    parts.append(text[seg_end - start:])
+                    segments[-1] = (seg_start, end, parts)
+            else:
+                segments.append((start, end, [text]))
+
+        # Chunks without offsets get positions past the end of the document
+        chunk_spans = [None] * len(chunks)
+        for start, end, i in placed:
+            chunk_spans[i] = (start, end)
+        position = max((end for _, end, _ in segments), default=0) + 1
+        loose_segments = []
+        for i in loose:
+            length = len(chunks[i]["text"])
+            chunk_spans[i] = (position, position + length)
+            loose_segments.append((position, position + length, [chunks[i]["text"]]))
+            position += length + 1
+        self.document_end = max((end for _, end, _ in segments), default=0)
+
+        self.texts: List[str] = []
+        self.spans: List[Tuple[int, int]] = []
+        for seg_start, _, parts in segments + loose_segments:
+            text = "".join(parts)
+            for s, e in split_sentences(text):
+                self.texts.append(text[s:e])
+                self.spans.append((seg_start + s, seg_start + e))
+
+        self.chunk_spans = chunk_spans
+        self._starts = np.array([s for s, _ in self.spans], dtype=np.int64)
+        self._ends = np.array([e for _, e in self.spans], dtype=np.int64)
+        self.members = [self._overlaps(start, end) for start, end in chunk_spans]
+
+    def _overlaps(self, start: int, end: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Indexes of the sentences overlapping [start, end) and the overlap lengths."""
+        # Spans are sorted and disjoint, so the overlapping ones are contiguous
+        lo = np.searchsorted(self._ends, start, side="right")
+        hi = np.searchsorted(self._starts, end, side="left")
+        indexes = np.arange(lo, hi)
+        overlap = (np.minimum(end, self._ends[lo:hi]) - np.maximum(start, self._starts[lo:hi])).astype(np.float32)
+        keep = overlap > 0
+        return indexes[keep], overlap[keep]
+
+    def pool(self, sentence_vectors: np.ndarray, spans: Optional[List[Tuple[int, int]]] = None) -> np.ndarray:
+        """
+        Overlap-weighted mean of the (normalised) sentence vectors under each
+        chunk, or under each (start, end) of `spans` for another layout.
+        """
+        members = self.members if spans is None else [self._overlaps(s, e) for s, e in spans]
+        vectors = normalise(sentence_vectors)
+        pooled = np.zeros((len(members), vectors.shape[1]), dtype=np.float32)
+        for c, (indexes, weights) in enumerate(members):
+            if len(indexes):
+                pooled[c] = weights @ vectors[indexes] / weights.sum()
+        return pooled
+
+    def _main_sentences(self, c: int) -> np.ndarray:
+        # Sentences mostly inside the chunk; a sentence cut by the chunk
+        # boundary belongs to its neighbour. All of them if none qualifies.
+        indexes, weights = self.members[c]
+        lengths = (self._ends[indexes] - self._starts[indexes]).astype(np.float32)
+        main = indexes[weights * 2 >= lengths]
+        return main if len(main) else indexes
+
+    def max_scores(self, sentence_scores: np.ndarray) -> np.ndarray:
+        """(categories x chunks) best sentence score within each chunk."""
+        scores = np.full((sentence_scores.shape[0], len(self.members)), -1.0, dtype=np.float32)
+        for c in range(len(self.members)):
+            main = self._main_sentences(c)
+            if len(main):
+                scores[:, c] = sentence_scores[:, main].max(axis=1)
+        return scores
+
+    def pinpoint(self, risks: List[Dict], sentence_scores: np.ndarray, categories: List[str],
+                 chunk_index: Dict[str, int]):
+        """Add the best-scoring sentence of its chunk, for its category, to each risk."""
+        category_row = {category: r for r, category in enumerate(categories)}
+        for risk in risks:
+            main = self._main_sentences(chunk_index[risk["chunk_id"]])
+            if not len(main):
+                continue
+            row = sentence_scores[category_row[risk["risk_category"]], main]
+            best = int(main[int(np.argmax(row))])
+            start, end = self.spans[best]
+            in_document = end <= self.document_end
+            risk["sentence"] = {
+                "text": self.texts[best],
+                "start_char": start if in_document else None,
+                "end_char": end if in_document else None,
+                "similarity_score": float(row.max()),
+            }
@@ -0,0 +1,152 @@
+"""
+Pre-fork multi-worker server.
+
+    python serve.py --host 0.0.0.0 --port 8000 --workers 4
+
+The master process imports main.py and loads the SentenceTransformer and
+the gold standard (main.load_detector) exactly once, then forks the
+workers. Model weights are only ever read after loading, so the pages
+holding them stay shared copy-on-write between workers instead of being
+duplicated per process. Each worker gets
+its own torch thread budget so N workers do not oversubscribe the cores.
+"""
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+
+def configure_master_threads():
+    # Loading must not spin up intra-op thread pools in the master: OpenMP
+    # pools do not survive fork(), and HF tokenizers warn/deadlock after it.
+    os.environ.setdefault("TOKENIZERS_PARALLELISM", "false")
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+
+
+def configure_worker_threads(threads: int):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Already fixed if anything in the master touched inter-op parallelism
+            pass
+    except ImportError:
+        pass
+
+
+def create_socket(host: str, port: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, threads: int, log_level: str):
+    import uvicorn
+
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    configure_worker_threads(threads)
+
+    config = uvicorn.Config(app, lifespan="on", log_level=log_level)
+    server = uvicorn.Server(config)
+    server.run(sockets=[sock])
+
+
+def spawn_worker(app, sock, threads, log_level, index) -> int:
+    pid = os.fork()
+    if pid == 0:
+        exit_code = 0
+        try:
+            run_worker(app, sock, threads, log_level)
+        except Exception as e:
+            print(f"Worker {index} crashed: {e}")
+            exit_code = 1
+        finally:
+            os._exit(exit_code)
+    print(f"Started worker {index} (pid {pid}, {threads} torch thread(s))")
+    return pid
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the API with pre-forked workers sharing one model copy")
+    parser.add_argument("--host", default=os.getenv("HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", "1")))
+    parser.add_argument("--threads-per-worker", type=int, default=int(os.getenv("TORCH_THREADS_PER_WORKER", "0")),
+                        help="torch intra-op threads per worker (default: cores / workers)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    if not hasattr(os, "fork"):
+        print("[ERROR] serve.py needs fork(); use 'uvicorn main:app' on this platform.")
+        return 1
+
+    workers = max(1, args.workers)
+    threads = args.threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+
+    sock = create_socket(args.host, args.port)
+    print(f"Listening on {args.host}:{args.port} with {workers} worker(s)")
+
+    configure_master_threads()
+    import main as app_module
+    # Load in the master (not in each worker's background startup task) so
+    # the weights are loaded once and shared
+    app_module.load_detector()
+
+    # Move everything loaded so far into the permanent generation so the
+    # workers' garbage collector never writes to (and un-shares) those pages.
+    gc.collect()
+    gc.freeze()
+
+    children = {}
+    for i in range(workers):
+        children[spawn_worker(app_module.app, sock, threads, args.log_level, i)] = i
+
+    stopping = False
+
+    def handle_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, handle_stop)
+    signal.signal(signal.SIGINT, handle_stop)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        index = children.pop(pid, None)
+        if index is None:
+            continue
+        if not stopping:
+            print(f"Worker {index} (pid {pid}) exited with status {status}; restarting")
+            time.sleep(1)
+            children[spawn_worker(app_module.app, sock, threads, args.log_level, index)] = index
+
+    sock.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
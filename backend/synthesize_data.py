@@ -4,15 +4,16 @@ import json
 import time
 import os
 
-OPENROUTER_API_KEY = ""
+OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
+LLM_BASE_URL = os.getenv("LLM_BASE_URL", "https://openrouter.ai/api/v1")
 
 # Initialize Client
 client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
+    base_url=LLM_BASE_URL,
     api_key=OPENROUTER_API_KEY,
 )
 
-MODEL_NAME = "amazon/nova-2-lite-v1:free" 
+MODEL_NAME = os.getenv("LLM_MODEL", "amazon/nova-2-lite-v1:free")
 
 
 #HARDCODED CONTRACT NLI MAP
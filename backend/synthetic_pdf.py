@@ -0,0 +1,231 @@
+import json
+import os
+import random
+import textwrap
+from typing import List
+
+
+# Filler clauses that carry no risk signal. Real contracts are mostly this kind
+# of text, so the generator uses them for the bulk of every page.
+BOILERPLATE_CLAUSES = [
+    "Definitions. Capitalised terms used in this Agreement have the meanings given to them in this Section unless the context otherwise requires.",
+    "Headings. The headings in this Agreement are for convenience only and shall not affect its interpretation.",
+    "Counterparts. This Agreement may be executed in any number of counterparts, each of which shall be deemed an original.",
+    "Entire Agreement. This Agreement constitutes the entire agreement between the parties with respect to its subject matter.",
+    "Severability. If any provision of this Agreement is held invalid, the remaining provisions shall continue in full force and effect.",
+    "Notices. All notices under this Agreement shall be in writing and delivered to the addresses set out on the signature page.",
+    "Assignment. Neither party may assign this Agreement without the prior written consent of the other party.",
+    "Waiver. No failure or delay by either party in exercising any right shall operate as a waiver of that right.",
+    "Relationship of the Parties. Nothing in this Agreement creates a partnership, joint venture or agency relationship.",
+    "Payment Terms. Invoices are payable within thirty days of receipt by wire transfer to the account designated by the supplier.",
+    "Deliverables. The supplier shall provide the deliverables described in the applicable statement of work in a professional manner.",
+    "Records. Each party shall keep complete and accurate records relating to its performance under this Agreement.",
+    "Signature. IN WITNESS WHEREOF, the parties have caused this Agreement to be executed by their duly authorised representatives.",
+]
+
+LINES_PER_PAGE = 48
+CHARS_PER_LINE = 92
+COLUMN_CHARS_PER_LINE = 44
+TABLE_ROWS = 12
+
+# Page layouts generate_layout_contract can produce
+LAYOUTS = ("single", "two_column", "table")
+
+TABLE_HEADER = ["Item", "Responsible Party", "Term"]
+TABLE_CELLS = [
+    ["Hosting services", "Supplier", "Monthly"],
+    ["Data backup", "Supplier", "Daily"],
+    ["Invoice review", "Customer", "Thirty days"],
+    ["Security audit", "Supplier", "Annually"],
+    ["Training sessions", "Supplier", "On request"],
+    ["Acceptance testing", "Customer", "Ten days"],
+    ["Incident report", "Supplier", "Within 24 hours"],
+    ["Renewal notice", "Either party", "Ninety days"],
+]
+
+
+def load_risky_clauses(dataset_path: str) -> List[str]:
+    """
+    Pull the risky exemplar clauses out of the gold standard so the generated
+    contracts contain text the detector is expected to flag.
+    """
+    if not os.path.exists(dataset_path):
+        return []
+    with open(dataset_path, 'r') as f:
+        data = json.load(f)
+    return [item["risky_clause"] for item in data if item.get("risky_clause")]
+
+
+def generate_contract_pages(num_pages: int, risky_clauses: List[str], risk_ratio=0.05, seed=0,
+                            chars_per_line=CHARS_PER_LINE) -> List[List[str]]:
+    """
+    Build `num_pages` pages of wrapped text lines. Roughly `risk_ratio` of the
+    paragraphs are drawn from `risky_clauses`, the rest from boilerplate.
+    """
+    rng = random.Random(seed)
+    pages = []
+    current = []
+    section = 1
+
+    while len(pages) < num_pages:
+        if risky_clauses and rng.random() < risk_ratio:
+            clause = rng.choice(risky_clauses)
+        else:
+            clause = rng.choice(BOILERPLATE_CLAUSES)
+
+        paragraph = f"{section}. {clause}"
+        section += 1
+        lines = textwrap.wrap(paragraph, chars_per_line) + [""]
+
+        for line in lines:
+            current.append(line)
+            if len(current) >= LINES_PER_PAGE:
+                pages.append(current)
+                current = []
+                if len(pages) >= num_pages:
+                    break
+
+    return pages
+
+
+def _escape_pdf_text(line: str) -> str:
+    line = line.encode("latin-1", "replace").decode("latin-1")
+    return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _text_stream(lines: List[str], x: int = 50, y: int = 760) -> List[str]:
+    ops = ["BT", "/F1 10 Tf", "12 TL", f"{x} {y} Td"]
+    for line in lines:
+        ops.append(f"({_escape_pdf_text(line)}) Tj T*")
+    ops.append("ET")
+    return ops
+
+
+def two_column_stream(left: List[str], right: List[str]) -> str:
+    return "\n".join(_text_stream(left, x=50) + _text_stream(right, x=320))
+
+
+def table_stream(before: List[str], rows: List[List[str]], after: List[str]) -> str:
+    """Text lines, a ruled table (one row per 18pt) and more text lines."""
+    ops = _text_stream(before)
+    widths = [170, 170, 170]
+    row_height = 18
+    top = 760 - 12 * len(before) - 10
+    left = 50
+    for r, row in enumerate(rows):
+        y = top - (r + 1) * row_height
+        x = left
+        for width, cell in zip(widths, row):
+            ops.append(f"{x} {y} {width} {row_height} re S")
+            ops.append(f"BT /F1 10 Tf 1 0 0 1 {x + 4} {y + 5} Tm ({_escape_pdf_text(cell)}) Tj ET")
+            x += width
+    ops += _text_stream(after, y=top - (len(rows) + 1) * row_height - 16)
+    return "\n".join(ops)
+
+
+def write_pdf(pages: List, output_path: str):
+    """
+    Write a minimal, uncompressed PDF with one Helvetica text stream per page.
+    Hand-rolled so the benchmark does not need a PDF authoring dependency.
+    A page is a list of text lines or a ready-made content stream (str).
+    """
+    objects = []
+
+    def add_object(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    catalog_id = add_object(b"")  # placeholder, filled once the page tree exists
+    pages_id = add_object(b"")
+    font_id = add_object(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+    page_ids = []
+    for page in pages:
+        stream = (page if isinstance(page, str) else "\n".join(_text_stream(page))).encode("latin-1")
+        content_id = add_object(
+            b"<< /Length " + str(len(stream)).encode() + b" >>\nstream\n" + stream + b"\nendstream"
+        )
+        page_ids.append(add_object(
+            f"<< /Type /Page /Parent {pages_id} 0 R /MediaBox [0 0 612 792] "
+            f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {content_id} 0 R >>".encode()
+        ))
+
+    kids = " ".join(f"{pid} 0 R" for pid in page_ids)
+    objects[catalog_id - 1] = f"<< /Type /Catalog /Pages {pages_id} 0 R >>".encode()
+    objects[pages_id - 1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for i, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += f"{i} 0 obj\n".encode() + body + b"\nendobj\n"
+
+    xref_offset = len(out)
+    out += f"xref\n0 {len(objects) + 1}\n".encode()
+    out += b"0000000000 65535 f \n"
+    for offset in offsets:
+        out += f"{offset:010d} 00000 n \n".encode()
+    out += f"trailer\n<< /Size {len(objects) + 1} /Root {catalog_id} 0 R >>\n".encode()
+    out += f"startxref\n{xref_offset}\n%%EOF\n".encode()
+
+    with open(output_path, "wb") as f:
+        f.write(out)
+
+
+def generate_contract_pdf(output_path: str, num_pages: int, dataset_path: str, risk_ratio=0.05, seed=0) -> str:
+    risky_clauses = load_risky_clauses(dataset_path)
+    pages = generate_contract_pages(num_pages, risky_clauses, risk_ratio=risk_ratio, seed=seed)
+    write_pdf(pages, output_path)
+    return output_path
+
+
+def generate_layout_contract(output_path: str, num_pages: int, dataset_path: str, layout="single",
+                             risk_ratio=0.05, seed=0) -> List[str]:
+    """
+    Write a contract PDF in one of LAYOUTS and return each page's text in
+    reading order (columns one after the other, table rows left to right),
+    the reference for extraction fidelity.
+    """
+    if layout not in LAYOUTS:
+        raise ValueError(f"Unknown layout '{layout}', expected one of {LAYOUTS}")
+    risky_clauses = load_risky_clauses(dataset_path)
+    if layout == "single":
+        pages = generate_contract_pages(num_pages, risky_clauses, risk_ratio=risk_ratio, seed=seed)
+        write_pdf(pages, output_path)
+        return ["\n".join(lines) for lines in pages]
+
+    if layout == "two_column":
+        columns = generate_contract_pages(num_pages * 2, risky_clauses, risk_ratio=risk_ratio, seed=seed,
+                                          chars_per_line=COLUMN_CHARS_PER_LINE)
+        streams, reference = [], []
+        for left, right in zip(columns[0::2], columns[1::2]):
+            streams.append(two_column_stream(left, right))
+            reference.append("\n".join(left + right))
+        write_pdf(streams, output_path)
+        return reference
+
+    rng = random.Random(seed)
+    text = generate_contract_pages(num_pages, risky_clauses, risk_ratio=risk_ratio, seed=seed)
+    streams, reference = [], []
+    for lines in text:
+        rows = [TABLE_HEADER] + [rng.choice(TABLE_CELLS) for _ in range(TABLE_ROWS - 1)]
+        before, after = lines[:12], lines[12:24]
+        streams.append(table_stream(before, rows, after))
+        reference.append("\n".join(before + [" ".join(row) for row in rows] + after))
+    write_pdf(streams, output_path)
+    return reference
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate a synthetic contract PDF")
+    parser.add_argument("output", help="Path of the PDF to write")
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--dataset", default="dataset/synthetic_gold_standard_with_nli.json")
+    parser.add_argument("--risk-ratio", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    generate_contract_pdf(args.output, args.pages, args.dataset, args.risk_ratio, args.seed)
+    print(f"Wrote {args.pages} pages to {args.output}")
@@ -0,0 +1,278 @@
+"""
+Tenants (API keys), per-tenant token-bucket rate limits and weighted fair
+queuing for the CPU-heavy and LLM stages.
+
+Tenants are read from TENANTS_PATH (default tenants.json):
+
+    {
+        "default": {"requests_per_minute": 60, "burst": 20, "weight": 1},
+        "tenants": {
+            "web-ui":   {"api_key": "...", "weight": 4, "requests_per_minute": 120},
+            "bulk-etl": {"api_key": "...", "weight": 1, "requests_per_minute": 30, "burst": 100}
+        }
+    }
+
+Callers send their key as `X-API-Key` (or `Authorization: Bearer <key>`).
+Requests without a key belong to the "anonymous" tenant with the default
+limits, unless REQUIRE_API_KEY=1. A request costs one token per document.
+
+CPU work (extraction, encoding) and LLM calls each run in a fixed number
+of slots (FAIR_CPU_SLOTS, FAIR_LLM_SLOTS). When slots are busy, waiting
+work is granted in order of each tenant's virtual time: the service time
+it has received divided by its weight. A bulk client that keeps the
+encoder busy falls behind an interactive one that sends a request now and
+then, instead of both queueing first come, first served.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from metrics import record_stage, registry
+
+
+TENANTS_PATH = os.getenv("TENANTS_PATH", "tenants.json")
+REQUIRE_API_KEY = os.getenv("REQUIRE_API_KEY", "0").lower() in ("1", "true", "yes")
+ANONYMOUS_TENANT = "anonymous"
+
+# Limits for anonymous callers and tenants that do not set their own
+# (requests_per_minute 0, the default, disables rate limiting)
+DEFAULT_LIMITS = {
+    "requests_per_minute": float(os.getenv("TENANT_REQUESTS_PER_MINUTE", "0")),
+    "burst": float(os.getenv("TENANT_BURST", "20")),
+    "weight": float(os.getenv("TENANT_WEIGHT", "1")),
+}
+
+# Concurrent CPU-heavy stages / LLM calls across all tenants (0 = unscheduled)
+FAIR_CPU_SLOTS = int(os.getenv("FAIR_CPU_SLOTS", "2"))
+FAIR_LLM_SLOTS = int(os.getenv("FAIR_LLM_SLOTS", "4"))
+
+
+class TokenBucket:
+    """
+    `burst` tokens, refilled at `rate` per second. A request costing more
+    than the whole bucket (a large batch) is let through once the bucket
+    is full and leaves it in debt, so its sender waits for the refill.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self, cost: float = 1) -> float:
+        """0 if `cost` tokens were taken, otherwise the seconds to wait before retrying."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            needed = min(cost, self.burst)
+            if self.tokens >= needed:
+                self.tokens -= cost
+                return 0.0
+            return (needed - self.tokens) / self.rate
+
+
+class Tenant:
+    def __init__(self, name: str, api_key: Optional[str] = None, requests_per_minute: float = None,
+                 burst: float = None, weight: float = None):
+        self.name = name
+        self.api_key = api_key
+        self.requests_per_minute = DEFAULT_LIMITS["requests_per_minute"] if requests_per_minute is None \
+            else requests_per_minute
+        self.weight = max(0.01, DEFAULT_LIMITS["weight"] if weight is None else weight)
+        self.bucket = TokenBucket(
+            self.requests_per_minute / 60,
+            DEFAULT_LIMITS["burst"] if burst is None else burst,
+        )
+
+    def take(self, cost: float = 1) -> float:
+        return self.bucket.take(cost)
+
+
+TENANT_SETTINGS = ("api_key", "requests_per_minute", "burst", "weight")
+
+
+class TenantRegistry:
+    """API key -> Tenant, loaded once from the tenants file."""
+
+    def __init__(self, path: Optional[str] = TENANTS_PATH, require_key: bool = REQUIRE_API_KEY):
+        self.require_key = require_key
+        self.by_key: Dict[str, Tenant] = {}
+        self.by_name: Dict[str, Tenant] = {}
+        self.anonymous = Tenant(ANONYMOUS_TENANT)
+        if path and os.path.isfile(path):
+            with open(path) as f:
+                config = json.load(f)
+            defaults = {k: v for k, v in config.get("default", {}).items() if k in TENANT_SETTINGS[1:]}
+            self.anonymous = Tenant(ANONYMOUS_TENANT, **defaults)
+            for name, settings in config.get("tenants", {}).items():
+                settings = {**defaults, **{k: v for k, v in settings.items() if k in TENANT_SETTINGS}}
+                if not settings.get("api_key"):
+                    print(f"Ignoring tenant {name}: no api_key")
+                    continue
+                tenant = Tenant(name, **settings)
+                self.by_key[tenant.api_key] = self.by_name[name] = tenant
+            print(f"Loaded {len(self.by_key)} tenant(s) from {path}.")
+
+    def resolve(self, api_key: Optional[str]) -> Optional[Tenant]:
+        """The key's tenant, anonymous for no key (if allowed), None if rejected."""
+        if not api_key:
+            return None if self.require_key else self.anonymous
+        return self.by_key.get(api_key)
+
+    def named(self, name: Optional[str]) -> Tenant:
+        """Tenant by name (e.g. one recorded with a queued job); anonymous if unknown."""
+        return self.by_name.get(name) or self.anonymous
+
+
+def api_key_from_headers(headers) -> Optional[str]:
+    key = headers.get("x-api-key")
+    if key:
+        return key.strip()
+    authorization = headers.get("authorization", "")
+    if authorization.lower().startswith("bearer "):
+        return authorization[7:].strip()
+    return None
+
+
+class FairScheduler:
+    """
+    Weighted fair queuing over `slots` concurrent holders.
+
+    Each tenant has a virtual time. A grant advances it by the expected
+    service time (the tenant's running average) over its weight; the
+    release corrects that to the measured time. Free slots go to the
+    waiting tenant with the lowest virtual time, FIFO within a tenant. A
+    tenant that was idle restarts at the current virtual time, so it
+    cannot bank credit while away.
+    """
+
+    def __init__(self, name: str, slots: int):
+        self.name = name
+        self.slots = slots
+        self.busy = 0
+        self.virtual_now = 0.0
+        self._cond = threading.Condition()
+        self._queues: Dict[str, deque] = {}
+        self._vtime: Dict[str, float] = {}
+        self._expected: Dict[str, float] = {}
+        self._running: Dict[str, int] = {}
+        self._seq = 0
+
+    def _dispatch(self):
+        while self.busy < self.slots:
+            waiting = [(self._vtime[name], queue[0][0], name) for name, queue in self._queues.items() if queue]
+            if not waiting:
+                break
+            vtime, _, name = min(waiting)
+            ticket = self._queues[name].popleft()
+            ticket[1]["granted"] = True
+            self.busy += 1
+            self._running[name] = self._running.get(name, 0) + 1
+            self.virtual_now = max(self.virtual_now, vtime)
+            self._vtime[name] = vtime + ticket[1]["expected"] / ticket[1]["weight"]
+        self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, tenant: Tenant):
+        if self.slots <= 0:
+            yield
+            return
+        name = tenant.name
+        asked = time.perf_counter()
+        with self._cond:
+            if not self._queues.get(name) and not self._running.get(name):
+                self._vtime[name] = max(self._vtime.get(name, 0.0), self.virtual_now)
+            self._seq += 1
+            expected = self._expected.get(name, 1.0)
+            state = {"granted": False, "expected": expected, "weight": tenant.weight}
+            self._queues.setdefault(name, deque()).append((self._seq, state))
+            self._dispatch()
+            queued = not state["granted"]
+            while not state["granted"]:
+                self._cond.wait()
+        granted = time.perf_counter()
+        if queued:
+            # Shows up as e.g. "cpu_queue" in the request's stage breakdown
+            record_stage(f"{self.name}_queue", granted - asked)
+        try:
+            yield
+        finally:
+            service = time.perf_counter() - granted
+            with self._cond:
+                self.busy -= 1
+                self._running[name] -= 1
+                self._vtime[name] += (service - expected) / tenant.weight
+                self._expected[name] = 0.8 * self._expected.get(name, service) + 0.2 * service
+                self._dispatch()
+            registry.record_usage(name, f"{self.name}_seconds", service)
+            registry.record_usage(name, f"{self.name}_wait_seconds", granted - asked)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "slots": self.slots,
+                "busy": self.busy,
+                "waiting": {name: len(queue) for name, queue in self._queues.items() if queue},
+            }
+
+
+schedulers = {
+    "cpu": FairScheduler("cpu", FAIR_CPU_SLOTS),
+    "llm": FairScheduler("llm", FAIR_LLM_SLOTS),
+}
+
+
+_current_tenant: contextvars.ContextVar = contextvars.ContextVar("tenant", default=None)
+# Schedulers whose slot the current context already holds (slots are not re-entrant)
+_held_slots: contextvars.ContextVar = contextvars.ContextVar("held_slots", default=frozenset())
+
+
+def current_tenant() -> Optional[Tenant]:
+    return _current_tenant.get()
+
+
+@contextmanager
+def tenant_context(tenant: Optional[Tenant]):
+    """Make `tenant` current for the enclosed work (and threads started from it via run_in_threadpool)."""
+    token = _current_tenant.set(tenant)
+    try:
+        yield tenant
+    finally:
+        _current_tenant.reset(token)
+
+
+@contextmanager
+def fair_share(scheduler_name: str):
+    """
+    Run the enclosed work in one of the scheduler's slots on behalf of the
+    current tenant. Work outside a tenant context (CLI tools, worker
+    processes) and nested calls run unscheduled.
+    """
+    tenant = _current_tenant.get()
+    held = _held_slots.get()
+    if tenant is None or scheduler_name in held:
+        yield
+        return
+    with schedulers[scheduler_name].slot(tenant):
+        token = _held_slots.set(held | {scheduler_name})
+        try:
+            yield
+        finally:
+            _held_slots.reset(token)
+
+
+def record_usage(name: str, value: float = 1):
+    """Add to the current tenant's usage counter, if there is a tenant."""
+    tenant = _current_tenant.get()
+    if tenant is not None:
+        registry.record_usage(tenant.name, name, value)
@@ -0,0 +1,8 @@
+import os
+import sys
+
+# The backend modules import each other as top-level modules (run from backend/)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# llm_rewrite builds its OpenAI client at import time; no request is ever sent
+os.environ.setdefault("OPENROUTER_API_KEY", "test")
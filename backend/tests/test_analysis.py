@@ -0,0 +1,56 @@
+import pytest
+
+from analysis import align_revision
+
+
+@pytest.fixture
+def ingestor():
+    from ip_mod_api import ContractIngestor
+
+    ingestor = ContractIngestor(chunk_size=120, chunk_overlap=0)
+    ingestor.source_type = "text"
+    return ingestor
+
+
+CLAUSES = [
+    "1. Term. This Agreement starts on the Effective Date and runs for two years.",
+    "2. Payment. Invoices are payable within thirty days of receipt by the Customer.",
+    "3. Termination. Either party may terminate on ninety days written notice.",
+]
+
+
+def test_unchanged_text_reuses_every_chunk(ingestor):
+    text = "\n".join(CLAUSES)
+    chunks = align_revision(ingestor, text, CLAUSES)
+    assert [c["previous_index"] for c in chunks] == [0, 1, 2]
+    assert [c["text"] for c in chunks] == CLAUSES
+    for chunk in chunks:
+        start, end = chunk["metadata"]["start_char"], chunk["metadata"]["end_char"]
+        assert text[start:end] == chunk["text"]
+
+
+def test_edited_clause_is_rechunked(ingestor):
+    edited = "2. Payment. Invoices are payable within sixty days of receipt by the Customer."
+    text = "\n".join([CLAUSES[0], edited, CLAUSES[2]])
+    chunks = align_revision(ingestor, text, CLAUSES)
+    assert [c["previous_index"] for c in chunks] == [0, None, 2]
+    assert chunks[1]["text"] == edited
+    assert [c["id"] for c in chunks] == ["chunk_0", "chunk_1", "chunk_2"]
+
+
+def test_inserted_and_removed_clauses(ingestor):
+    inserted = "4. Confidentiality. Each party keeps the other's information confidential."
+    text = "\n".join([CLAUSES[0], inserted, CLAUSES[2]])
+    chunks = align_revision(ingestor, text, CLAUSES)
+    assert [c["previous_index"] for c in chunks] == [0, None, 2]
+    assert chunks[1]["text"] == inserted
+    # The removed clause is simply not carried over
+    assert 1 not in [c["previous_index"] for c in chunks]
+
+
+def test_reordered_clause_is_new(ingestor):
+    text = "\n".join([CLAUSES[2], CLAUSES[0], CLAUSES[1]])
+    chunks = align_revision(ingestor, text, CLAUSES)
+    # Previous chunks are only carried over in order
+    assert [c["previous_index"] for c in chunks] == [None, 0, 1]
+    assert chunks[0]["text"] == CLAUSES[2]
@@ -0,0 +1,75 @@
+import io
+import zipfile
+
+import pytest
+
+from docx_extractor import DOCUMENT_XML, extract_docx_text
+
+
+NS = 'xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main"'
+
+
+def paragraph(text):
+    return f"<w:p><w:r><w:t>{text}</w:t></w:r></w:p>"
+
+
+def table(*rows):
+    return "<w:tbl>" + "".join(
+        "<w:tr>" + "".join(f"<w:tc>{cell}</w:tc>" for cell in row) + "</w:tr>" for row in rows
+    ) + "</w:tbl>"
+
+
+def docx(body, compression=zipfile.ZIP_DEFLATED):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression) as archive:
+        archive.writestr(DOCUMENT_XML, f"<w:document {NS}><w:body>{body}</w:body></w:document>")
+    return buffer.getvalue()
+
+
+def test_paragraphs_and_table_rows():
+    body = paragraph("Intro") + table([paragraph("a"), paragraph("b")], [paragraph("c"), paragraph("d")])
+    assert extract_docx_text(docx(body)) == "Intro\na | b\nc | d"
+
+
+def test_nested_table_is_folded_into_its_cell_once():
+    inner = table([paragraph("n1"), paragraph("n2")])
+    body = table([paragraph("outer") + inner, paragraph("right")])
+    assert extract_docx_text(docx(body)) == "outer n1 | n2 | right"
+
+
+def test_not_a_zip():
+    with pytest.raises(ValueError, match="Not a valid DOCX"):
+        extract_docx_text(b"plain text, not a zip")
+
+
+def test_missing_document_xml():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("other.xml", "<x/>")
+    with pytest.raises(ValueError, match="Not a valid DOCX"):
+        extract_docx_text(buffer.getvalue())
+
+
+def test_corrupt_member_data():
+    data = bytearray(docx(paragraph("clause text " * 200)))
+    # Flip bytes inside the compressed member (bad CRC or broken deflate stream)
+    start = data.index(DOCUMENT_XML.encode()) + len(DOCUMENT_XML) + 20
+    data[start] ^= 0xFF
+    with pytest.raises(ValueError, match="Not a valid DOCX"):
+        extract_docx_text(bytes(data))
+
+
+def test_encrypted_member():
+    data = bytearray(docx(paragraph("secret")))
+    central = data.index(b"PK\x01\x02")
+    data[central + 8] |= 0x1  # general purpose flag: encrypted
+    with pytest.raises(ValueError, match="Encrypted"):
+        extract_docx_text(bytes(data))
+
+
+def test_invalid_xml():
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr(DOCUMENT_XML, "<w:document")
+    with pytest.raises(ValueError, match="Invalid DOCX document XML"):
+        extract_docx_text(buffer.getvalue())
@@ -0,0 +1,77 @@
+import sqlite3
+import time
+
+import pytest
+
+from job_queue import JobStatus, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / "jobs.db"))
+
+
+def test_claim_sets_lease(store):
+    job_id = store.create("analyze_contract")
+    job = store.claim_next(owner="worker-a", lease_seconds=30)
+    assert job["id"] == job_id
+    assert job["status"] == JobStatus.RUNNING
+    assert job["lease_owner"] == "worker-a"
+    assert job["lease_expires"] == pytest.approx(time.time() + 30, abs=5)
+    assert job["attempts"] == 1
+
+
+def test_live_lease_is_not_recovered(store):
+    job_id = store.create("analyze_contract")
+    store.claim_next(owner="worker-a", lease_seconds=60)
+    # A sibling process starting up must not requeue a job that is still being worked on
+    assert store.recover_interrupted() == 0
+    assert store.get(job_id)["status"] == JobStatus.RUNNING
+
+
+def test_expired_lease_is_requeued(store):
+    job_id = store.create("analyze_contract")
+    store.claim_next(owner="worker-a", lease_seconds=-1)
+    assert store.recover_interrupted() == 1
+    job = store.get(job_id)
+    assert job["status"] == JobStatus.QUEUED
+    assert job["lease_owner"] is None
+    assert job["attempts"] == 1
+
+    # Another worker picks it up; the earlier attempt still counts
+    job = store.claim_next(owner="worker-b")
+    assert job["lease_owner"] == "worker-b"
+    assert job["attempts"] == 2
+
+
+def test_renew_only_extends_own_leases(store):
+    job_id = store.create("analyze_contract")
+    store.claim_next(owner="worker-a", lease_seconds=-1)
+    store.renew_leases("worker-b", [job_id], lease_seconds=60)
+    assert store.get(job_id)["lease_expires"] < time.time()
+    store.renew_leases("worker-a", [job_id], lease_seconds=60)
+    assert store.get(job_id)["lease_expires"] > time.time()
+    assert store.recover_interrupted() == 0
+
+
+def test_old_database_gains_lease_columns(tmp_path):
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE jobs (id TEXT PRIMARY KEY, kind TEXT NOT NULL, status TEXT NOT NULL, "
+        "priority INTEGER NOT NULL DEFAULT 0, filename TEXT, file_path TEXT, params TEXT, "
+        "attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL DEFAULT 3, "
+        "cancel_requested INTEGER NOT NULL DEFAULT 0, progress TEXT, partial_result TEXT, result TEXT, "
+        "error TEXT, created_at REAL NOT NULL, run_after REAL NOT NULL, started_at REAL, finished_at REAL)"
+    )
+    conn.execute(
+        "INSERT INTO jobs (id, kind, status, params, created_at, run_after) VALUES ('old', 'k', ?, '{}', 0, 0)",
+        (JobStatus.RUNNING,),
+    )
+    conn.commit()
+    conn.close()
+
+    store = JobStore(path)
+    # Rows from before leases existed have no lease and are recovered
+    assert store.recover_interrupted() == 1
+    assert store.get("old")["status"] == JobStatus.QUEUED
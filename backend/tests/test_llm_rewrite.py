@@ -0,0 +1,51 @@
+import json
+
+from llm_rewrite import _parse_batch_response, estimate_tokens, pack_rewrite_batches
+
+
+def test_parse_batch_response_maps_ids_to_items():
+    content = json.dumps({"rewrites": [{"id": 1, "rewrite": " second "}, {"id": 0, "rewrite": "first"}]})
+    assert _parse_batch_response(content, 2) == ["first", "second"]
+
+
+def test_parse_batch_response_tolerates_fence_and_string_ids():
+    content = '```json\n{"rewrites": [{"id": "0", "rewrite": "only"}]}\n```'
+    assert _parse_batch_response(content, 2) == ["only", None]
+
+
+def test_parse_batch_response_skips_bad_entries():
+    content = json.dumps({"rewrites": [
+        {"id": 5, "rewrite": "out of range"},
+        {"id": 0, "rewrite": "   "},
+        {"id": 1, "rewrite": 42},
+        "not an object",
+        {"id": 2, "rewrite": "kept"},
+    ]})
+    assert _parse_batch_response(content, 3) == [None, None, "kept"]
+
+
+def test_parse_batch_response_unparseable():
+    assert _parse_batch_response("no json here", 2) == [None, None]
+    assert _parse_batch_response("{not json}", 2) == [None, None]
+    assert _parse_batch_response('{"rewrites": "nope"}', 1) == [None]
+    assert _parse_batch_response("[]", 1) == [None]
+
+
+def test_pack_rewrite_batches_item_limit_keeps_order():
+    items = [(f"clause {i}", "risk") for i in range(7)]
+    assert pack_rewrite_batches(items, max_items=3, max_prompt_tokens=10**6, max_completion_tokens=10**6) == [
+        [0, 1, 2], [3, 4, 5], [6],
+    ]
+
+
+def test_pack_rewrite_batches_completion_budget():
+    items = [("x" * 400, "risk")] * 4  # ~117 output tokens each
+    batches = pack_rewrite_batches(items, max_items=10, max_prompt_tokens=10**6, max_completion_tokens=250)
+    assert batches == [[0, 1], [2, 3]]
+
+
+def test_pack_rewrite_batches_oversized_item_alone():
+    items = [("short clause", "risk"), ("y" * 20000, "risk"), ("short clause", "risk")]
+    batches = pack_rewrite_batches(items, max_items=10, max_prompt_tokens=1000, max_completion_tokens=10**6)
+    assert batches == [[0], [1], [2]]
+    assert estimate_tokens(items[1][0]) > 1000
@@ -0,0 +1,32 @@
+import pytest
+
+from tenancy import TokenBucket
+
+
+def test_token_bucket_rejects_when_empty():
+    bucket = TokenBucket(rate=1, burst=2)
+    assert bucket.take() == 0
+    assert bucket.take() == 0
+    assert bucket.take() == pytest.approx(1, abs=0.05)
+
+
+def test_token_bucket_large_cost_leaves_debt():
+    bucket = TokenBucket(rate=1, burst=5)
+    # A batch bigger than the bucket is admitted from a full bucket...
+    assert bucket.take(20) == 0
+    assert bucket.tokens == pytest.approx(-15, abs=0.05)
+    # ...and the sender then waits until the debt is paid off
+    assert bucket.take() == pytest.approx(16, abs=0.05)
+
+
+def test_token_bucket_refills_over_time():
+    bucket = TokenBucket(rate=2, burst=4)
+    bucket.take(4)
+    bucket.updated -= 1  # one second passes
+    assert bucket.take(2) == 0
+    assert bucket.take() > 0
+
+
+def test_token_bucket_zero_rate_is_unlimited():
+    bucket = TokenBucket(rate=0, burst=1)
+    assert all(bucket.take(100) == 0 for _ in range(10))
@@ -0,0 +1,147 @@
+"""
+Category scoring strategies, vectorised threshold sweeps and the tuned
+threshold config shared by RiskDetector and evaluate_thresholds.py.
+
+Aggregation strategies (how chunk-vs-category similarity is computed):
+
+    definition   cosine to the category's definition (nli_hypothesis)
+    centroid     cosine to the mean of the category's exemplar embeddings
+    max          best cosine over the category's exemplars
+    mean_topk    mean of the top_k best cosines over the category's exemplars
+
+Exemplar strategies treat the definition as one more exemplar, so every
+category has at least one.
+"""
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+AGGREGATIONS = ("definition", "centroid", "max", "mean_topk")
+THRESHOLDS_PATH = os.getenv("THRESHOLDS_PATH", "dataset/thresholds.json")
+
+
+def normalise(matrix) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def aggregate_scores(chunk_vectors, definition_vectors, exemplar_vectors=None, exemplar_categories=None,
+                     aggregation: str = "definition", top_k: int = 3) -> np.ndarray:
+    """
+    (categories x chunks) similarity matrix. exemplar_categories holds the
+    category row (index into definition_vectors) of each exemplar vector.
+    Exemplars are scored one category at a time, so memory stays at
+    (exemplars of one category x chunks).
+    """
+    if aggregation not in AGGREGATIONS:
+        raise ValueError(f"Unknown aggregation '{aggregation}', expected one of {AGGREGATIONS}")
+    chunks = normalise(chunk_vectors)
+    definitions = normalise(definition_vectors)
+    if aggregation == "definition" or exemplar_vectors is None:
+        return definitions @ chunks.T
+
+    exemplar_categories = np.asarray(exemplar_categories)
+    scores = np.empty((len(definitions), len(chunks)), dtype=np.float32)
+    for c in range(len(definitions)):
+        rows = np.flatnonzero(exemplar_categories == c)
+        # Contiguous ranges (gold store layout) slice a memmap without copying it all
+        if len(rows) and rows[-1] - rows[0] + 1 == len(rows):
+            exemplars = exemplar_vectors[rows[0]:rows[-1] + 1]
+        else:
+            exemplars = exemplar_vectors[rows]
+        exemplars = np.vstack([definitions[c:c + 1], normalise(exemplars)]) if len(rows) else definitions[c:c + 1]
+
+        if aggregation == "centroid":
+            scores[c] = normalise(exemplars.mean(axis=0, keepdims=True)) @ chunks.T
+            continue
+        sims = exemplars @ chunks.T
+        if aggregation == "max":
+            scores[c] = sims.max(axis=0)
+        else:
+            k = min(top_k, len(sims))
+            scores[c] = np.partition(sims, len(sims) - k, axis=0)[-k:].mean(axis=0)
+    return scores
+
+
+def sweep_thresholds(scores: np.ndarray, labels: np.ndarray, thresholds: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    tp/fp/fn/precision/recall/f1, each (categories x thresholds), for
+    predicting `scores >= threshold`. One sort per category, then every
+    threshold is a binary search into the cumulative true-positive counts.
+    """
+    labels = labels.astype(bool)
+    thresholds = np.asarray(thresholds, dtype=np.float32)
+    num_categories = scores.shape[0]
+    tp = np.zeros((num_categories, len(thresholds)), dtype=np.int64)
+    predicted = np.zeros_like(tp)
+    for c in range(num_categories):
+        order = np.argsort(-scores[c], kind="stable")
+        descending = -scores[c][order]
+        cumulative_tp = np.concatenate([[0], np.cumsum(labels[c][order])])
+        # Number of chunks with score >= t
+        predicted[c] = np.searchsorted(descending, -thresholds, side="right")
+        tp[c] = cumulative_tp[predicted[c]]
+
+    positives = labels.sum(axis=1, keepdims=True)
+    fp = predicted - tp
+    fn = positives - tp
+    precision = np.divide(tp, predicted, out=np.zeros(tp.shape), where=predicted > 0)
+    recall = np.divide(tp, positives, out=np.zeros(tp.shape), where=positives > 0)
+    f1 = np.divide(2 * precision * recall, precision + recall, out=np.zeros(tp.shape), where=(precision + recall) > 0)
+    return {"tp": tp, "fp": fp, "fn": fn, "precision": precision, "recall": recall, "f1": f1}
+
+
+def pick_operating_points(sweep: Dict[str, np.ndarray], thresholds: np.ndarray,
+                          min_recall: Optional[float] = None) -> List[int]:
+    """
+    Per category, the threshold index with the best F1 or, with min_recall,
+    the best precision among thresholds reaching that recall (falling back
+    to the best recall). Ties go to the highest threshold.
+    """
+    picks = []
+    for c in range(sweep["f1"].shape[0]):
+        if min_recall is None:
+            objective = sweep["f1"][c]
+        else:
+            ok = sweep["recall"][c] >= min_recall
+            objective = np.where(ok, sweep["precision"][c], -1.0) if ok.any() else sweep["recall"][c]
+        best = np.flatnonzero(objective == objective.max())
+        picks.append(int(best[np.argmax(thresholds[best])]))
+    return picks
+
+
+def save_threshold_config(path: str, model: str, aggregation: str, top_k: int, thresholds: Dict[str, float],
+                          report: Optional[Dict] = None):
+    config = {
+        "model": model,
+        "aggregation": aggregation,
+        "top_k": top_k,
+        "thresholds": thresholds,
+        "created_at": time.time(),
+        "report": report or {},
+    }
+    with open(path, "w") as f:
+        json.dump(config, f, indent=4)
+
+
+def load_threshold_config(path: Optional[str], model: Optional[str] = None) -> Optional[Dict]:
+    """
+    The tuned config at `path`, or None when there is none or it was tuned
+    for a different embedding model (its thresholds would not transfer).
+    """
+    if not path or not os.path.isfile(path):
+        return None
+    with open(path) as f:
+        config = json.load(f)
+    if config.get("aggregation", "definition") not in AGGREGATIONS:
+        print(f"Ignoring threshold config {path}: unknown aggregation {config.get('aggregation')}")
+        return None
+    if model is not None and config.get("model") not in (None, model):
+        print(f"Ignoring threshold config {path}: tuned for {config.get('model')}, not {model}")
+        return None
+    return config
@@ -1,27 +1,98 @@
 import json
-# import numpy as np
+import numpy as np
 import os
-from sentence_transformers import SentenceTransformer
-from sklearn.metrics.pairwise import cosine_similarity
-from ingestion_pipeline import ContractIngestor
+from metrics import stage, registry
+from budget import current_budget
+from gold_store import GoldStore
+from thresholds import THRESHOLDS_PATH, aggregate_scores, load_threshold_config
+from sentence_pooling import SentenceLayout
+
+# sentence_transformers (torch) and sklearn (prefilter) are imported when a
+# RiskDetector is built, not when this module is imported.
+
+# Optional lexical first stage, see lexical_prefilter.py
+PREFILTER_ENABLED = os.getenv("PREFILTER_ENABLED", "").lower() in ("1", "true", "yes")
+PREFILTER_SKIP_RATIO = float(os.getenv("PREFILTER_SKIP_RATIO", "0.5"))
+PREFILTER_MIN_SCORE = float(os.getenv("PREFILTER_MIN_SCORE", "0.1"))
+
+# chunk: encode every chunk. sentence: encode each sentence once and pool
+# sentence vectors into chunk vectors (see sentence_pooling.py)
+ENCODE_MODES = ("chunk", "sentence")
+ENCODE_MODE = os.getenv("ENCODE_MODE", "chunk")
+# Sentence mode chunk score: mean = score of the pooled chunk vector,
+# max = best score of a sentence in the chunk
+SENTENCE_POOLING = os.getenv("SENTENCE_POOLING", "mean")
+
+HF_MODEL_ID = "bhavibhatt/legal_model"
+FALLBACK_MODEL_ID = "all-MiniLM-L6-v2"
 
 class RiskDetector:
-    def __init__(self, gold_standard_path):
-        # REPLACE 'your_username/legal_risk_model' with your actual Hugging Face Model ID
-        hf_model_id = "bhavibhatt/legal_model" 
+    def __init__(self, gold_standard_path, use_prefilter=None, prefilter_skip_ratio=None, prefilter_min_score=None,
+                 thresholds_path=THRESHOLDS_PATH, encode_mode=None, sentence_pooling=None):
+        """
+        `gold_standard_path` is either the JSON gold standard or a columnar
+        store built from it by gold_store.py (memory-mapped, loaded lazily).
+        `thresholds_path` points at a config written by evaluate_thresholds.py;
+        when present it sets the scoring strategy and per-category thresholds.
+        `encode_mode` / `sentence_pooling` default to ENCODE_MODE / SENTENCE_POOLING.
+        """
+        self.encode_mode = encode_mode or ENCODE_MODE
+        self.sentence_pooling = sentence_pooling or SENTENCE_POOLING
+        if self.encode_mode not in ENCODE_MODES:
+            raise ValueError(f"Unknown encode mode '{self.encode_mode}', expected one of {ENCODE_MODES}")
+        if self.sentence_pooling not in ("mean", "max"):
+            raise ValueError(f"Unknown sentence pooling '{self.sentence_pooling}', expected mean or max")
+
+        from sentence_transformers import SentenceTransformer
+
+        hf_model_id = HF_MODEL_ID
         
         try:
             print(f"Loading model from Hugging Face: {hf_model_id}...")
             # This automatically downloads the model from HF
             self.model = SentenceTransformer(hf_model_id)
+            self.model_id = hf_model_id
         except Exception as e:
             print(f"Error loading custom model: {e}")
-            print("Falling back to generic 'all-MiniLM-L6-v2'...")
-            self.model = SentenceTransformer('all-MiniLM-L6-v2')
+            print(f"Falling back to generic '{FALLBACK_MODEL_ID}'...")
+            self.model = SentenceTransformer(FALLBACK_MODEL_ID)
+            self.model_id = FALLBACK_MODEL_ID
 
+        self.gold_store = GoldStore(gold_standard_path) if GoldStore.is_store(gold_standard_path) else None
+        self.gold_standard_path = gold_standard_path
         self.gold_standard = self.load_gold_standard(gold_standard_path)
+        self._risk_embeddings = None
+        self._exemplar_embeddings = None
+
+        self.threshold_config = load_threshold_config(thresholds_path, self.model_id)
+        self.aggregation = "definition"
+        self.aggregation_top_k = 3
+        self.category_thresholds = {}
+        if self.threshold_config:
+            self.aggregation = self.threshold_config.get("aggregation", "definition")
+            self.aggregation_top_k = self.threshold_config.get("top_k", 3)
+            self.category_thresholds = self.threshold_config.get("thresholds", {})
+            print(f"Loaded tuned thresholds from {thresholds_path} (aggregation: {self.aggregation}).")
+
+        self.prefilter = None
+        if PREFILTER_ENABLED if use_prefilter is None else use_prefilter:
+            from lexical_prefilter import LexicalPrefilter
+
+            self.prefilter = LexicalPrefilter(
+                self.load_exemplars(gold_standard_path),
+                min_score=PREFILTER_MIN_SCORE if prefilter_min_score is None else prefilter_min_score,
+                skip_ratio=PREFILTER_SKIP_RATIO if prefilter_skip_ratio is None else prefilter_skip_ratio,
+            )
+            print(f"Lexical prefilter enabled (skip ratio <= {self.prefilter.skip_ratio}).")
         
     def load_gold_standard(self, path):
+        if self.gold_store is not None:
+            # Definitions live in the store's meta.json; no column is touched
+            unique_risks = dict(self.gold_store.definitions)
+            print(f"Loaded {len(unique_risks)} unique risk definitions from gold store "
+                  f"({self.gold_store.num_rows} exemplars, memory-mapped).")
+            return unique_risks
+
         with open(path, 'r') as f:
             data = json.load(f)
         
@@ -34,18 +105,275 @@ class RiskDetector:
         print(f"Loaded {len(unique_risks)} unique risk definitions from JSON.")
         return unique_risks
 
-    def detect_risks(self, pdf_chunks, threshold=0.50, top_k=3):
-        
+    def load_exemplars(self, path):
+        """
+        Category -> example texts (risk definition plus risky clauses),
+        used to learn the lexical prefilter's vocabularies.
+        """
+        if self.gold_store is not None:
+            clauses = self.gold_store.column('risky_clause')
+            exemplars = {}
+            for category, definition in self.gold_store.definitions.items():
+                texts = exemplars[category] = [definition]
+                texts.extend(t for t in (clauses[i] for i in self.gold_store.category_rows(category)) if t)
+            return exemplars
+
+        with open(path, 'r') as f:
+            data = json.load(f)
+
+        exemplars = {}
+        for item in data:
+            texts = exemplars.setdefault(item['category'], [item['nli_hypothesis']])
+            if item.get('risky_clause'):
+                texts.append(item['risky_clause'])
+        return exemplars
+
+    def apply_prefilter(self, texts):
+        """
+        Indexes of the texts worth embedding. Everything passes when the
+        prefilter is disabled.
+        """
+        if self.prefilter is None:
+            return list(range(len(texts)))
+        with stage("prefilter"):
+            keep = self.prefilter.select(texts).tolist()
+        registry.inc("prefilter_chunks_skipped", len(texts) - len(keep))
+        return keep
+
+    def apply_prefilter_documents(self, unique_texts, document_rows):
+        """
+        apply_prefilter for a batch of documents whose chunk texts are
+        deduplicated into `unique_texts` (`document_rows` maps each document's
+        chunks to rows of it). Texts are scored once, but skip_ratio is
+        enforced per document, so a short document in a large batch keeps
+        its guaranteed share. Returns the sorted rows to embed: those any
+        document keeps.
+        """
+        if self.prefilter is None:
+            return list(range(len(unique_texts)))
+        with stage("prefilter"):
+            scores = self.prefilter.score(unique_texts)
+            keep = set()
+            for rows in document_rows:
+                rows = np.asarray(rows, dtype=np.int64)
+                keep.update(rows[self.prefilter.select_scored(scores[rows])].tolist())
+        keep = sorted(keep)
+        registry.inc("prefilter_chunks_skipped", len(unique_texts) - len(keep))
+        return keep
+
+    def get_risk_embeddings(self):
+        """
+        Risk definitions never change after load, so encode them once and
+        reuse the matrix for every request.
+        """
+        if self._risk_embeddings is not None:
+            registry.record_cache("risk_embeddings", hit=True)
+            return self._risk_embeddings
+
+        registry.record_cache("risk_embeddings", hit=False)
+        store = self.gold_store
+        if store is not None and store.model == self.model_id and store.definition_embeddings is not None:
+            # Built with this model: reuse the stored (normalised) vectors;
+            # cosine similarity is unaffected by the normalisation
+            self._risk_embeddings = np.asarray(store.definition_embeddings, dtype=np.float32)
+            return self._risk_embeddings
+
+        with stage("encode_risks"):
+            self._risk_embeddings = self.model.encode(list(self.gold_standard.values()))
+        return self._risk_embeddings
+
+    def get_exemplar_embeddings(self):
+        """
+        (vectors, category rows) of the gold-standard risky clauses, for
+        the exemplar aggregation strategies. Taken from the gold store when
+        it was built with this model, otherwise encoded once.
+        """
+        if self._exemplar_embeddings is not None:
+            return self._exemplar_embeddings
+
+        categories = list(self.gold_standard.keys())
+        store = self.gold_store
+        if store is not None and store.model == self.model_id and store.embeddings is not None:
+            rows = np.array([categories.index(c) for c in store.categories], dtype=np.int64)[store.category_ids]
+            self._exemplar_embeddings = (store.embeddings, rows)
+            return self._exemplar_embeddings
+
+        texts, rows = [], []
+        for category, exemplars in self.load_exemplars(self.gold_standard_path).items():
+            # Drop the definition; aggregate_scores adds it back itself
+            texts.extend(exemplars[1:])
+            rows.extend([categories.index(category)] * (len(exemplars) - 1))
+        with stage("encode_exemplars"):
+            vectors = self.model.encode(texts) if texts else np.zeros((0, 1), dtype=np.float32)
+        self._exemplar_embeddings = (vectors, np.array(rows, dtype=np.int64))
+        return self._exemplar_embeddings
+
+    def score_chunks(self, risk_embeddings, chunk_embeddings):
+        """(categories x chunks) scores under the configured aggregation strategy."""
+        if self.aggregation == "definition":
+            return aggregate_scores(chunk_embeddings, risk_embeddings)
+        vectors, rows = self.get_exemplar_embeddings()
+        return aggregate_scores(chunk_embeddings, risk_embeddings, vectors, rows,
+                                aggregation=self.aggregation, top_k=self.aggregation_top_k)
+
+    def detect_risks(self, pdf_chunks, threshold=0.50, top_k=3, embeddings=None):
+        """
+        Pass a dict as `embeddings` to also receive chunk_id -> embedding for
+        every chunk that was encoded (chunks skipped by the prefilter are
+        absent), e.g. for the clause search index.
+        """
         chunk_texts = [c['text'] for c in pdf_chunks]
         chunk_ids = [c['id'] for c in pdf_chunks]
 
+        keep = self.apply_prefilter(chunk_texts)
+        if len(keep) < len(chunk_texts):
+            chunk_texts = [chunk_texts[i] for i in keep]
+            chunk_ids = [chunk_ids[i] for i in keep]
+        if not chunk_texts:
+            return []
+
+        budget = current_budget()
+        batch_size = budget.encode_batch_size(32) if budget else 32
+        if self.encode_mode == "sentence":
+            kept_chunks = [pdf_chunks[i] for i in keep]
+            return self.detect_risks_sentences(
+                [kept_chunks], threshold, batch_size, [embeddings] if embeddings is not None else None
+            )[0]
+
         # Vectorize
-        risk_embeddings = self.model.encode(list(self.gold_standard.values()))
-        chunk_embeddings = self.model.encode(chunk_texts)
+        risk_embeddings = self.get_risk_embeddings()
+        with stage("encode"):
+            chunk_embeddings = self.model.encode(chunk_texts, batch_size=batch_size)
+        if embeddings is not None:
+            embeddings.update(zip(chunk_ids, chunk_embeddings))
         
         # Calculate Similarity
-        similarity_matrix = cosine_similarity(risk_embeddings, chunk_embeddings)
-        
+        with stage("similarity"):
+            similarity_matrix = self.score_chunks(risk_embeddings, chunk_embeddings)
+
+        return self.collect_risks(similarity_matrix, chunk_ids, chunk_texts, threshold)
+
+    def detect_risks_batch(self, documents_chunks, threshold=0.50, batch_size=128, embeddings=None):
+        """
+        Score several documents at once. Chunk texts shared between documents
+        are encoded only once, encoding runs in large batches, and a single
+        similarity pass covers every chunk. Returns one risk list per document.
+        `embeddings`, if given, is a list with one dict per document that is
+        filled like in detect_risks.
+        """
+        if self.encode_mode == "sentence":
+            budget = current_budget()
+            kept_documents = []
+            for chunks in documents_chunks:
+                keep = self.apply_prefilter([c['text'] for c in chunks])
+                kept_documents.append([chunks[i] for i in keep])
+            return self.detect_risks_sentences(
+                kept_documents, threshold, budget.encode_batch_size(batch_size) if budget else batch_size, embeddings
+            )
+
+        unique_rows = {}
+        unique_texts = []
+        document_rows = []
+        for chunks in documents_chunks:
+            rows = []
+            for c in chunks:
+                row = unique_rows.get(c['text'])
+                if row is None:
+                    row = unique_rows[c['text']] = len(unique_texts)
+                    unique_texts.append(c['text'])
+                rows.append(row)
+            document_rows.append(rows)
+
+        if not unique_texts:
+            return [[] for _ in documents_chunks]
+
+        total_chunks = sum(len(rows) for rows in document_rows)
+        registry.inc("batch_chunks_deduplicated", total_chunks - len(unique_texts))
+
+        # Map unique rows to rows of the (possibly prefiltered) embedding
+        # matrix. A chunk one document skipped is still scored for it when
+        # another document kept the same text, since it is encoded anyway.
+        keep = self.apply_prefilter_documents(unique_texts, document_rows)
+        matrix_row = {row: i for i, row in enumerate(keep)}
+        if not keep:
+            return [[] for _ in documents_chunks]
+
+        risk_embeddings = self.get_risk_embeddings()
+        budget = current_budget()
+        if budget:
+            batch_size = budget.encode_batch_size(batch_size)
+        with stage("encode"):
+            chunk_embeddings = self.model.encode([unique_texts[i] for i in keep], batch_size=batch_size)
+
+        with stage("similarity"):
+            similarity_matrix = self.score_chunks(risk_embeddings, chunk_embeddings)
+
+        results = []
+        for d, (chunks, rows) in enumerate(zip(documents_chunks, document_rows)):
+            kept = [(c, matrix_row[row]) for c, row in zip(chunks, rows) if row in matrix_row]
+            if embeddings is not None:
+                embeddings[d].update((c['id'], chunk_embeddings[m]) for c, m in kept)
+            if not kept:
+                results.append([])
+                continue
+            results.append(self.collect_risks(
+                similarity_matrix[:, [m for _, m in kept]],
+                [c['id'] for c, _ in kept],
+                [c['text'] for c, _ in kept],
+                threshold
+            ))
+        return results
+
+    def detect_risks_sentences(self, documents_chunks, threshold, batch_size, embeddings=None):
+        """
+        Sentence-mode detection for several documents: every distinct
+        sentence (across all of them) is encoded once, chunk vectors are
+        pooled from sentence vectors, and each risk gets the best-scoring
+        `sentence` of its chunk. Same return value and `embeddings` filling
+        (with pooled vectors) as detect_risks_batch.
+        """
+        layouts = [SentenceLayout(chunks) for chunks in documents_chunks]
+        unique = {}
+        document_rows = [[unique.setdefault(text, len(unique)) for text in layout.texts] for layout in layouts]
+        if not unique:
+            return [[] for _ in documents_chunks]
+        registry.inc("sentences_encoded", len(unique))
+        registry.inc("sentences_reused", sum(len(rows) for rows in document_rows) - len(unique))
+
+        risk_embeddings = self.get_risk_embeddings()
+        with stage("encode"):
+            sentence_embeddings = self.model.encode(list(unique), batch_size=batch_size)
+        with stage("similarity"):
+            sentence_scores = self.score_chunks(risk_embeddings, sentence_embeddings)
+
+        results = []
+        categories = list(self.gold_standard.keys())
+        for d, (chunks, layout, rows) in enumerate(zip(documents_chunks, layouts, document_rows)):
+            if not chunks:
+                results.append([])
+                continue
+            chunk_ids = [c['id'] for c in chunks]
+            with stage("pooling"):
+                chunk_embeddings = layout.pool(sentence_embeddings[rows])
+            if embeddings is not None:
+                embeddings[d].update(zip(chunk_ids, chunk_embeddings))
+            document_scores = sentence_scores[:, rows]
+            with stage("similarity"):
+                if self.sentence_pooling == "max":
+                    similarity_matrix = layout.max_scores(document_scores)
+                else:
+                    similarity_matrix = self.score_chunks(risk_embeddings, chunk_embeddings)
+            risks = self.collect_risks(similarity_matrix, chunk_ids, [c['text'] for c in chunks], threshold)
+            layout.pinpoint(risks, document_scores, categories, {chunk_id: i for i, chunk_id in enumerate(chunk_ids)})
+            results.append(risks)
+        return results
+
+    def collect_risks(self, similarity_matrix, chunk_ids, chunk_texts, threshold):
+        """
+        Turn a (categories x chunks) similarity matrix into the risk list,
+        strongest matches first. Tuned per-category thresholds, if loaded,
+        replace `threshold` for their categories.
+        """
         results = []
         risk_categories = list(self.gold_standard.keys())
         risk_definitions = list(self.gold_standard.values())
@@ -53,32 +381,25 @@ class RiskDetector:
         # Iterate each Risk Category
         for r_idx, category in enumerate(risk_categories):
             scores = similarity_matrix[r_idx]
-            
-            indexed_scores = list(enumerate(scores))
-            
-            indexed_scores.sort(key=lambda x: x[1], reverse=True)
-            
-            count = 0
-            for c_idx, score in indexed_scores:
-                if score < threshold:
-                    break
-                    
+
+            hits = np.flatnonzero(scores >= self.category_thresholds.get(category, threshold))
+            hits = hits[np.argsort(-scores[hits], kind="stable")]
+
+            for c_idx in hits:
                 results.append({
                     "risk_category": category,
                     "risk_definition": risk_definitions[r_idx],
                     "chunk_id": chunk_ids[c_idx],
                     "chunk_text": chunk_texts[c_idx],
-                    "similarity_score": float(score)
+                    "similarity_score": float(scores[c_idx])
                 })
-                
-                # count += 1
-                # if count >= top_k:
-                #     break
 
         results.sort(key=lambda x: x['similarity_score'], reverse=True)
         return results
 
 if __name__ == "__main__":
+    from ingestion_pipeline import ContractIngestor
+
     pdf_filename = "contract.pdf"
     json_filename = "synthetic_gold_standard_with_nli.json"
     
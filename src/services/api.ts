@@ -5,10 +5,17 @@ const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || "http://localhost:8000
 
 export interface RiskItem {
   chunk_text: string;
-  risk_type: string;
+  risk_type?: string;
+  risk_category?: string;
+  risk_definition?: string;
   similarity_score: number;
+  action?: string;
   suggested_clause?: string;
   explanation?: string;
+  chunk_id?: string;
+  page?: number | null;
+  start_char?: number | null;
+  end_char?: number | null;
 }
 
 export interface AnalysisResponse {
@@ -20,6 +27,38 @@ export interface AnalysisResponse {
   message?: string;
 }
 
+// ?format=compact: each flagged chunk is listed once with its location and
+// risks reference it by id; definitions and suggestions are sent once.
+export interface CompactChunk {
+  id: string;
+  text: string;
+  page: number | null;
+  start: number | null;
+  end: number | null;
+}
+
+export interface CompactRisk {
+  category: string;
+  chunk_id: string;
+  score: number;
+  action?: string;
+  suggestion: number | null;
+}
+
+export interface CompactAnalysisResponse {
+  format: "compact";
+  filename: string;
+  num_chunks: number;
+  num_risks: number;
+  chunks: CompactChunk[];
+  definitions: Record<string, string>;
+  suggestions: string[];
+  risks: CompactRisk[];
+  status?: string;
+  message?: string;
+  analysis_id?: string;
+}
+
 export interface ProcessedClause {
   id: number;
   title: string;
@@ -37,11 +76,45 @@ function getRiskLevel(score: number): "high" | "medium" | "low" {
   return "low";
 }
 
-// Transform API response to frontend format
-export function processApiResponse(response: AnalysisResponse): ProcessedClause[] {
-  return response.risks.map((risk, index) => ({
+function isCompactResponse(
+  response: AnalysisResponse | CompactAnalysisResponse
+): response is CompactAnalysisResponse {
+  return (response as CompactAnalysisResponse).format === "compact";
+}
+
+// Expand a compact response into the full per-risk shape
+export function expandCompactResponse(response: CompactAnalysisResponse): AnalysisResponse {
+  const chunks = new Map(response.chunks.map((chunk) => [chunk.id, chunk]));
+  return {
+    filename: response.filename,
+    num_chunks: response.num_chunks,
+    num_risks: response.num_risks,
+    status: response.status ?? "success",
+    message: response.message,
+    risks: response.risks.map((risk) => {
+      const chunk = chunks.get(risk.chunk_id);
+      return {
+        chunk_id: risk.chunk_id,
+        chunk_text: chunk?.text ?? "",
+        page: chunk?.page ?? null,
+        start_char: chunk?.start ?? null,
+        end_char: chunk?.end ?? null,
+        risk_category: risk.category,
+        risk_definition: response.definitions[risk.category],
+        similarity_score: risk.score,
+        action: risk.action,
+        suggested_clause: risk.suggestion !== null ? response.suggestions[risk.suggestion] : undefined,
+      };
+    }),
+  };
+}
+
+// Transform API response (full or compact) to frontend format
+export function processApiResponse(response: AnalysisResponse | CompactAnalysisResponse): ProcessedClause[] {
+  const full = isCompactResponse(response) ? expandCompactResponse(response) : response;
+  return full.risks.map((risk, index) => ({
     id: index + 1,
-    title: risk.risk_type || `Risk Clause ${index + 1}`,
+    title: risk.risk_category || risk.risk_type || `Risk Clause ${index + 1}`,
     originalText: risk.chunk_text,
     suggestedText: risk.suggested_clause || "Review this clause with legal counsel for a safer alternative.",
     riskLevel: getRiskLevel(risk.similarity_score),
@@ -54,7 +127,8 @@ export async function analyzeContract(file: File): Promise<AnalysisResponse> {
   const formData = new FormData();
   formData.append("file", file);
 
-  const response = await fetch(`${API_BASE_URL}/analyze-contract`, {
+  // The browser negotiates gzip/brotli transparently
+  const response = await fetch(`${API_BASE_URL}/analyze-contract?format=compact`, {
     method: "POST",
     body: formData,
   });
@@ -64,7 +138,8 @@ export async function analyzeContract(file: File): Promise<AnalysisResponse> {
     throw new Error(errorData.detail || `Analysis failed with status ${response.status}`);
   }
 
-  return response.json();
+  const data: AnalysisResponse | CompactAnalysisResponse = await response.json();
+  return isCompactResponse(data) ? expandCompactResponse(data) : data;
 }
 
 export async function checkHealth(): Promise<boolean> {